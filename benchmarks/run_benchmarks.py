@@ -0,0 +1,174 @@
+#! /usr/bin/env python3
+"""
+Benchmarks the read, merge, filter and export stages of rosbag-merge on synthetic bags.
+
+Every stage runs in a fresh process so its peak RSS is its own. Results are printed
+and optionally saved as JSON, which a later run can compare against:
+
+  python3 benchmarks/run_benchmarks.py --bags 4 --duration 60 --output baseline.json
+  python3 benchmarks/run_benchmarks.py --bags 4 --duration 60 --compare baseline.json
+"""
+
+import argparse
+import contextlib
+import json
+import multiprocessing
+import os
+import platform
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+from importlib import metadata
+
+from rosbag_merge import bag_stream, export
+from rosbag_merge.bag_index import IndexReader, count_indexed
+from rosbag_merge.stats import peak_rss
+from rosbag_merge.synthetic import generate_bags
+
+
+def stage_read(paths, output_path, topics):
+    for _ in bag_stream.read_messages(paths, topics):
+        pass
+
+
+def stage_merge(paths, output_path, topics, passthrough=True):
+    bag_stream.main(input_bags=paths, topics=topics, output_path=output_path, outbag_name='merged', exists_ok=True,
+                    passthrough=passthrough)
+
+
+def stage_merge_messages(paths, output_path, topics):
+    stage_merge(paths, output_path, topics, passthrough=False)
+
+
+def stage_export(paths, output_path, topics):
+    export.export_topics(paths, output_path, topics)
+
+
+STAGES = {
+    'read': (stage_read, False),
+    'merge': (stage_merge, False),
+    'merge_messages': (stage_merge_messages, False),
+    'filter': (stage_merge, True),
+    'export': (stage_export, False),
+}
+
+
+def run_stage(name, paths, output_path, topics):
+    # runs in a fresh worker process, returns (seconds, peak rss in bytes)
+    function, _ = STAGES[name]
+    with open(os.devnull, 'w') as devnull, contextlib.redirect_stdout(devnull), contextlib.redirect_stderr(devnull):
+        started = time.perf_counter()
+        function(paths, output_path, topics)
+        seconds = time.perf_counter() - started
+    return seconds, peak_rss()
+
+
+def benchmark(args: argparse.Namespace) -> dict:
+    with tempfile.TemporaryDirectory(dir=args.work_dir) as work_dir:
+        generated = time.perf_counter()
+        paths = generate_bags(work_dir, bags=args.bags, topics=args.topics, message_size=args.message_size,
+                              rate=args.rate, duration=args.duration, overlap=args.overlap,
+                              compression=args.compression)
+        generated = time.perf_counter() - generated
+        input_bytes = sum(os.path.getsize(x) for x in paths)
+        indexes = [IndexReader(x) for x in paths]
+        for bag in indexes:
+            bag.open()
+        all_topics = sorted({x.topic for bag in indexes for x in bag.connections})
+        filtered = all_topics[:max(len(all_topics) // 2, 1)]
+        counts = {False: count_indexed(indexes), True: count_indexed(indexes, filtered)}
+        for bag in indexes:
+            bag.close()
+
+        results = {}
+        stages = [x for x in args.stages if x != 'export' or export.pa is not None]
+        for name in stages:
+            filter_topics = STAGES[name][1]
+            best = None
+            for _ in range(args.repeat):
+                output_path = tempfile.mkdtemp(dir=work_dir)
+                # spawn so the peak RSS does not include the parent process
+                with ProcessPoolExecutor(1, mp_context=multiprocessing.get_context('spawn')) as pool:
+                    seconds, peak = pool.submit(run_stage, name, paths, output_path,
+                                                filtered if filter_topics else None).result()
+                if best is None or seconds < best[0]:
+                    best = (seconds, peak)
+            seconds, peak = best
+            messages = counts[filter_topics]
+            results[name] = {
+                'seconds': round(seconds, 4),
+                'messages': messages,
+                'input_bytes': input_bytes,
+                'msgs_per_s': round(messages / seconds, 1),
+                'mb_per_s': round(input_bytes / seconds / (1 << 20), 2),
+                'peak_rss_mb': round(peak / (1 << 20), 1),
+            }
+    return {
+        'rosbag_merge': metadata.version('rosbag_merge'),
+        'python': platform.python_version(),
+        'machine': platform.machine(),
+        'cpus': os.cpu_count(),
+        'created': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'profile': {
+            'bags': args.bags,
+            'topics': args.topics,
+            'message_size': args.message_size,
+            'rate': args.rate,
+            'duration': args.duration,
+            'overlap': args.overlap,
+            'compression': args.compression,
+            'generate_seconds': round(generated, 4),
+        },
+        'stages': results,
+    }
+
+
+def print_results(report: dict, baseline: dict = None):
+    header = f"{'stage':<16}{'seconds':>10}{'msgs/s':>14}{'MB/s':>10}{'peak MB':>10}"
+    print(header + ('   vs baseline' if baseline else ''))
+    for name, result in report['stages'].items():
+        line = (f"{name:<16}{result['seconds']:>10.3f}{result['msgs_per_s']:>14.0f}"
+                f"{result['mb_per_s']:>10.1f}{result['peak_rss_mb']:>10.1f}")
+        previous = baseline['stages'].get(name) if baseline else None
+        if previous and previous['msgs_per_s']:
+            line += f"   {result['msgs_per_s'] / previous['msgs_per_s']:.2f}x"
+        print(line)
+
+
+def create_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--bags', type=int, default=3, help='Number of synthetic input bags.')
+    parser.add_argument('--topics', type=int, default=4, help='Number of topics per bag.')
+    parser.add_argument('--message-size', type=int, nargs='+', default=[256],
+                        help='Payload bytes per message, one value per topic (cycled).')
+    parser.add_argument('--rate', type=float, nargs='+', default=[100.0],
+                        help='Messages per second, one value per topic (cycled).')
+    parser.add_argument('--duration', type=float, default=10.0, help='Seconds of data per bag.')
+    parser.add_argument('--overlap', type=float, default=0.5,
+                        help='Fraction of each bag overlapping the previous one in time, 0 to 1.')
+    parser.add_argument('--compression', type=str, choices=['none', 'bz2', 'lz4'], default='none',
+                        help='Chunk compression of the synthetic bags.')
+    parser.add_argument('--stages', type=str, nargs='+', choices=list(STAGES), default=list(STAGES),
+                        help='Stages to benchmark.')
+    parser.add_argument('--repeat', type=int, default=1, help='Runs per stage, the fastest one is reported.')
+    parser.add_argument('--work-dir', type=str, default=None, help='Directory for the temporary bags.')
+    parser.add_argument('--output', '-o', type=str, default=None, help='Save the results to this JSON file.')
+    parser.add_argument('--compare', type=str, default=None, help='JSON results of an earlier run to compare with.')
+    return parser
+
+
+def main(argv=None):
+    args = create_parser().parse_args(argv)
+    report = benchmark(args)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+    print_results(report, baseline)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
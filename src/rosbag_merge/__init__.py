@@ -3,8 +3,44 @@ rosbag-merge __init__
 """
 from . import main
 from . import bag_stream
+from . import bag_append
+from . import bag_chunks
+from . import bag_index
+from . import bag_writer
+from . import batch
+from . import catalog
+from . import dedup
+from . import info
+from . import mapped_reader
+from . import merge
+from . import msg_types
+from . import output_formats
+from . import pipeline
+from . import prefetch
+from . import reindex
+from . import stats
+from . import synthetic
+# align, bag_arrays, export and service import pyarrow, numpy or asyncio, they are imported
+# on use as rosbag_merge.align, rosbag_merge.bag_arrays, rosbag_merge.export and rosbag_merge.service
 
 # explicitly define the outward facing API of this module
 __all__ = [ main.__name__
             , bag_stream.__name__
+            , bag_append.__name__
+            , bag_chunks.__name__
+            , bag_index.__name__
+            , bag_writer.__name__
+            , batch.__name__
+            , catalog.__name__
+            , dedup.__name__
+            , info.__name__
+            , mapped_reader.__name__
+            , merge.__name__
+            , msg_types.__name__
+            , output_formats.__name__
+            , pipeline.__name__
+            , prefetch.__name__
+            , reindex.__name__
+            , stats.__name__
+            , synthetic.__name__
             ]
@@ -0,0 +1,149 @@
+"""
+
+Aligns fields of several topics onto a common time grid and streams the table into a columnar file.
+
+Every grid row holds, per selected field, the latest value received at or before the
+row time (an as-of join, the streaming counterpart of ffill). Messages are consumed in
+time order from read_messages and looked up with np.searchsorted one batch at a time,
+so memory stays bounded by the batch size instead of the length of the recording.
+
+"""
+
+import numpy as np
+from rosbags.serde import deserialize_ros1
+
+from .bag_index import IndexReader
+from .bag_stream import read_messages
+from .export import EXTENSIONS, arrow_type, open_table_writer, pa
+from .msg_types import column_getters, flatten_columns, register_connection_types
+
+
+def parse_spec(spec):
+    """Split a 'TOPIC[:FIELD]' spec into (topic, field), field being None for every field of the topic."""
+    topic, _, field = spec.partition(':')
+    return topic, field or None
+
+
+class AsOfColumn:
+    """Buffers the values of one field since the last emitted row and looks them up as of grid times."""
+
+    def __init__(self, name, getter, type_):
+        self.name = name
+        self.getter = getter
+        self.type = type_
+        self.times = []
+        self.values = []
+
+    def add(self, timestamp, message):
+        self.times.append(timestamp)
+        self.values.append(self.getter(message))
+
+    def lookup(self, grid, tolerance=None):
+        """Return the as-of values at the sorted grid times, dropping values no longer needed."""
+        times = np.asarray(self.times, dtype=np.int64)
+        idx = np.searchsorted(times, grid, side='right') - 1
+        missing = idx < 0
+        idx[missing] = 0
+        if tolerance is not None and len(times):
+            missing |= grid - times[idx] > tolerance
+        values = pa.array(self.values, type=self.type).take(pa.array(idx, mask=missing))
+        # the last value at or before the last row stays the as-of value of the next rows
+        keep = int(idx[-1]) if len(times) else 0
+        self.times = self.times[keep:]
+        self.values = self.values[keep:]
+        return values
+
+
+def align_columns(paths, specs):
+    """Return {topic: [AsOfColumn]} for the field specs, reading only the bag indexes."""
+    wanted = {}
+    for spec in specs:
+        topic, field = parse_spec(spec)
+        wanted.setdefault(topic, []).append(field)
+    connections = []
+    for path in paths:
+        with IndexReader(path) as bag:
+            connections.extend(x for x in bag.connections if x.topic in wanted)
+    register_connection_types(connections)
+
+    columns = {}
+    for topic, fields in wanted.items():
+        msgtypes = {x.msgtype for x in connections if x.topic == topic}
+        if len(msgtypes) != 1:
+            raise ValueError(f'Topic {topic!r} must carry exactly one message type to be aligned, found {sorted(msgtypes)}.')
+        msgtype = msgtypes.pop()
+        selected = []
+        for field in fields:
+            matches = [
+                x for x in flatten_columns(msgtype)
+                if field is None or x.name == field or x.name.startswith(field + '.')
+            ]
+            if field is None:
+                matches = [x for x in matches if x.kind != 'messages']
+            if not matches or any(x.kind == 'messages' for x in matches):
+                raise ValueError(f'Field {field!r} of {msgtype} cannot be aligned, select its value fields instead.')
+            selected.extend(x for x in matches if x not in selected)
+        prefix = topic.strip('/').replace('/', '.')
+        columns[topic] = [
+            AsOfColumn(f'{prefix}.{column.name}', getter,
+                       arrow_type(column.basetype) if column.kind == 'value' else pa.list_(arrow_type(column.basetype)))
+            for column, getter in zip(selected, column_getters(selected))
+        ]
+    return columns
+
+
+def align_topics(paths, output_file, specs, rate, start_time=None, end_time=None, tolerance=None,
+                 fmt='parquet', batch_rows=10000):
+    """Write a table sampling the field specs of paths at rate Hz into output_file.
+
+    specs are 'TOPIC' (every value field of the topic) or 'TOPIC:FIELD' with dotted
+    field paths such as '/imu:angular_velocity.z'. The grid starts at start_time (or
+    the first selected message) and ends before end_time (or at the last selected
+    message). Values older than tolerance nanoseconds, and rows before the first
+    message of a topic, are null. Returns the number of written rows.
+    """
+    if pa is None:
+        raise ImportError('Aligning topics requires pyarrow, install it with `pip install rosbag_merge[export]`.')
+    if fmt not in EXTENSIONS:
+        raise ValueError(f'Output format {fmt!r} is not supported.')
+    period = int(1e9 / rate)
+    columns = align_columns(paths, specs)
+    all_columns = [column for topic_columns in columns.values() for column in topic_columns]
+    schema = pa.schema([pa.field('timestamp', pa.int64())] + [pa.field(x.name, x.type) for x in all_columns])
+    writer = open_table_writer(output_file, schema, fmt)
+    next_time = start_time
+    rows = 0
+
+    def emit(limit):
+        # write every grid row before limit, batch_rows rows at a time
+        nonlocal next_time, rows
+        while next_time < limit:
+            grid = np.arange(next_time, min(limit, next_time + period * batch_rows), period, dtype=np.int64)
+            arrays = [pa.array(grid)] + [column.lookup(grid, tolerance) for column in all_columns]
+            writer.write_batch(pa.RecordBatch.from_arrays(arrays, schema=schema))
+            next_time = int(grid[-1]) + period
+            rows += len(grid)
+
+    try:
+        pending = 0
+        last_time = None
+        for connection, timestamp, rawdata in read_messages(paths, list(columns), start_time, end_time):
+            if next_time is None:
+                next_time = timestamp
+            if pending >= batch_rows:
+                # later messages are not older than timestamp, so rows before it are final
+                emit(timestamp)
+                pending = 0
+            message = deserialize_ros1(rawdata, connection.msgtype)
+            for column in columns[connection.topic]:
+                column.add(timestamp, message)
+            pending += 1
+            last_time = timestamp
+        if last_time is not None:
+            emit(end_time if end_time is not None else last_time + 1)
+    finally:
+        writer.close()
+    return rows
+
+
+__all__ = [align_topics.__name__, AsOfColumn.__name__, parse_spec.__name__]
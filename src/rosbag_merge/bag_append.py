@@ -0,0 +1,171 @@
+"""
+
+Appends new input bags to an output bag merged earlier instead of merging everything again.
+
+The inputs already merged into a bag are remembered in a <bag>.inputs.json sidecar by
+path, size and modification time. New inputs starting after the end of the bag are
+appended behind its last chunk. New inputs reaching back into the bag only cause the
+chunks from that time on to be merged again, the chunks before stay where they are.
+
+"""
+
+import json
+import os
+from contextlib import ExitStack
+
+from tqdm import tqdm
+
+from . import bag_stream
+from .bag_index import IndexReader, count_indexed, time_ranges
+from .bag_stream import open_rosbag1, register_connections, stitch_parts, write_merged
+from .bag_writer import AppendWriter, BagWriter
+
+SIDECAR_SUFFIX = '.inputs.json'
+
+
+def input_record(path):
+    """Identify an input bag by absolute path, size and modification time."""
+    stat = os.stat(path)
+    return {'path': os.path.abspath(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+def load_sidecar(bag_path):
+    """Return the sidecar of bag_path, or None when the bag has none."""
+    try:
+        with open(bag_path + SIDECAR_SUFFIX) as f:
+            return json.load(f)
+    except FileNotFoundError:
+        return None
+
+
+def write_sidecar(bag_path, records, topics=None):
+    """Record the inputs merged into bag_path together with the topic selection."""
+    with open(bag_path + SIDECAR_SUFFIX, 'w') as f:
+        json.dump({'topics': sorted(topics) if topics is not None else None, 'inputs': records}, f, indent=2)
+
+
+def remove_sidecar(bag_path):
+    """Forget the inputs merged into bag_path, so the next append merges everything again."""
+    if os.path.exists(bag_path + SIDECAR_SUFFIX):
+        os.remove(bag_path + SIDECAR_SUFFIX)
+
+
+def plan_append(bag_path, input_bags, topics=None):
+    """Decide how input_bags get into the bag at bag_path.
+
+    Returns (mode, new_inputs, cut_pos) where mode is 'merge' (no usable earlier
+    merge, merge everything), 'noop' (nothing new), 'append' (new inputs start
+    after the bag ends) or 'rewrite' (new inputs reach back before the end of the
+    bag, the chunks from cut_pos on are merged again).
+    """
+    sidecar = load_sidecar(bag_path)
+    if not os.path.exists(bag_path) or sidecar is None:
+        return 'merge', list(input_bags), None
+    if sidecar['topics'] != (sorted(topics) if topics is not None else None):
+        return 'merge', list(input_bags), None
+    merged = {x['path']: x for x in sidecar['inputs']}
+    new_inputs = []
+    for path in input_bags:
+        record = input_record(path)
+        if record['path'] not in merged:
+            new_inputs.append(path)
+        elif merged[record['path']] != record:
+            # an input changed since it was merged, its old messages cannot be told apart
+            return 'merge', list(input_bags), None
+    if not new_inputs:
+        return 'noop', [], None
+    new_start = min(start for start, _ in time_ranges(new_inputs).values())
+    with IndexReader(bag_path) as bag:
+        chunk_infos = sorted(bag.chunk_infos, key=lambda x: x.pos)
+    # merged chunks are in chronological order, those ending before the new inputs are kept
+    affected = [x for x in chunk_infos if x.end_time > new_start]
+    if not affected:
+        return 'append', new_inputs, None
+    return 'rewrite', new_inputs, affected[0].pos
+
+
+def append_merged(bag_path, new_inputs, cut_pos=None, topics=None, passthrough=True, compression='none',
+                  chunk_size=None, prefetch_bytes=None):
+    """Merge new_inputs into the existing bag, yielding message counts like write_merged.
+
+    Without cut_pos the new inputs are merged behind the last chunk. With cut_pos the
+    chunks from there on are merged together with the new inputs into a temporary bag
+    whose chunks then replace them.
+    """
+    writer_kwargs = dict(compression=compression, chunk_size=chunk_size)
+    if cut_pos is None:
+        with ExitStack() as stack:
+            bags = [stack.enter_context(open_rosbag1(path)) for path in new_inputs]
+            output_bag = stack.enter_context(AppendWriter(bag_path, **writer_kwargs))
+            conn_map = register_connections(output_bag, bags, topics)
+            yield from write_merged(output_bag, bags, conn_map, topics, passthrough=passthrough,
+                                    prefetch_bytes=prefetch_bytes)
+        return
+
+    part_path = os.path.join(os.path.dirname(bag_path), '.' + os.path.basename(bag_path) + '.tail.bag')
+    if os.path.exists(part_path):
+        os.remove(part_path)
+    try:
+        with ExitStack() as stack:
+            bags = [stack.enter_context(open_rosbag1(path)) for path in [bag_path] + list(new_inputs)]
+            # only the chunks of the existing bag from the cut on are merged again
+            old = bags[0]
+            old.chunk_infos = [x for x in old.chunk_infos if x.pos >= cut_pos]
+            old.indexes = {cid: [x for x in index if x.chunk_pos >= cut_pos] for cid, index in old.indexes.items()}
+            part = stack.enter_context(BagWriter(part_path, **writer_kwargs))
+            # the existing bag comes first so the part shares its connection ids
+            conn_map = register_connections(part, bags, topics)
+            yield from write_merged(part, bags, conn_map, topics, passthrough=passthrough,
+                                    prefetch_bytes=prefetch_bytes)
+        with ExitStack() as stack:
+            bags = [stack.enter_context(IndexReader(path)) for path in new_inputs]
+            output_bag = stack.enter_context(AppendWriter(bag_path, cut_pos=cut_pos, **writer_kwargs))
+            # registers the connections of the new inputs in the same order as the part did
+            register_connections(output_bag, bags, topics)
+            stitch_parts(output_bag, [part_path])
+    finally:
+        if os.path.exists(part_path):
+            os.remove(part_path)
+
+
+def main(input_bags: 'list[str]', topics: 'list[str]', output_path: str, outbag_name: str, passthrough: bool = True,
+         compression: str = 'none', chunk_size: int = None, prefetch_mb: int = 0):
+    """Bring the output bag up to date with input_bags, merging only what it does not hold yet."""
+    bag_path = os.path.join(output_path, outbag_name + ".bag")
+    input_bags = [x for x in input_bags if os.path.abspath(x) != os.path.abspath(bag_path)]
+    mode, new_inputs, cut_pos = plan_append(bag_path, input_bags, topics)
+    if mode == 'noop':
+        print(f"{bag_path} already holds every input.")
+        return
+    records = load_sidecar(bag_path)['inputs'] if mode != 'merge' else []
+    # the sidecar is only written back once the bag holds every input it lists, so an
+    # interrupted or failed run makes the next append merge everything again
+    remove_sidecar(bag_path)
+    if mode == 'merge':
+        if bag_stream.main(input_bags, topics, output_path, outbag_name, exists_ok=True, passthrough=passthrough,
+                           compression=compression, chunk_size=chunk_size, prefetch_mb=prefetch_mb):
+            write_sidecar(bag_path, [input_record(x) for x in input_bags], topics)
+        return
+    with ExitStack() as stack:
+        new_bags = [stack.enter_context(IndexReader(path)) for path in new_inputs]
+        total = count_indexed(new_bags, topics)
+        if cut_pos is not None:
+            old = stack.enter_context(IndexReader(bag_path))
+            total += sum(sum(x.connection_counts.values()) for x in old.chunk_infos if x.pos >= cut_pos)
+    steps = append_merged(bag_path, new_inputs, cut_pos, topics, passthrough=passthrough, compression=compression,
+                          chunk_size=chunk_size, prefetch_bytes=prefetch_mb * (1 << 20))
+    try:
+        with tqdm(desc="Appending Bags" if mode == 'append' else "Merging Tail", bar_format='{l_bar}{bar}{r_bar}', total=total) as progress:
+            for count in steps:
+                progress.update(count)
+    except KeyboardInterrupt:
+        # closes the output bag with what was appended so far
+        steps.close()
+        print("Interrupted, the next append merges every input again.")
+        return
+    write_sidecar(bag_path, records + [input_record(x) for x in new_inputs], topics)
+    print("Done.")
+
+
+__all__ = [main.__name__, plan_append.__name__, append_merged.__name__, write_sidecar.__name__, load_sidecar.__name__,
+           remove_sidecar.__name__]
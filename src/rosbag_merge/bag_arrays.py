@@ -0,0 +1,157 @@
+"""
+
+Decodes whole topics into NumPy structured arrays instead of one message object at a time.
+
+The ROS1 serialization is packed little endian, so a message type without strings or
+variable length arrays maps onto a fixed NumPy dtype and a batch of raw payloads can be
+viewed with np.frombuffer. Strings and sequences are supported as long as their lengths
+are the same in every message of the batch (e.g. a constant frame_id), which is checked
+on the length prefixes. Anything else falls back to per message decoding.
+
+"""
+
+import struct
+
+import numpy as np
+from rosbags.serde import deserialize_ros1
+from rosbags.typesys import types
+from rosbags.typesys.base import Nodetype
+
+from .bag_chunks import unpack_uint32
+from .bag_index import IndexReader
+from .bag_stream import read_messages
+from .msg_types import base_type_name, register_connection_types
+
+FORMATS = {
+    'bool': '?',
+    'byte': 'u1',
+    'char': 'u1',
+    'int8': 'i1',
+    'uint8': 'u1',
+    'int16': '<i2',
+    'uint16': '<u2',
+    'int32': '<i4',
+    'uint32': '<u4',
+    'int64': '<i8',
+    'uint64': '<u8',
+    'float32': '<f4',
+    'float64': '<f8',
+}
+
+
+def ros1_layout(msgtype, payload, pos=0, prefix=''):
+    """Walk the ROS1 serialization of msgtype in payload.
+
+    Returns (fields, checks, pos) where fields are (name, format, offset) tuples
+    (offset None for empty strings), checks are (offset, value) pairs of the uint32
+    length prefixes the layout depends on, and pos is the offset after the message.
+    """
+    fields, checks = [], []
+
+    def add_string(path, pos):
+        size, = unpack_uint32(payload, pos)
+        checks.append((pos, size))
+        # empty strings occupy no bytes, they are filled in after decoding
+        fields.append((path, f'S{size}', pos + 4) if size else (path, 'S1', None))
+        return pos + 4 + size
+
+    if msgtype == 'std_msgs/msg/Header':
+        # ROS1 headers carry a sequence number which the rosbags type omits
+        fields.append((prefix + 'seq', '<u4', pos))
+        pos += 4
+    for name, desc in types.FIELDDEFS[msgtype][1]:
+        path = prefix + name
+        if desc[0] == Nodetype.BASE:
+            basetype = base_type_name(desc)
+            if basetype == 'string':
+                pos = add_string(path, pos)
+            else:
+                fields.append((path, FORMATS[basetype], pos))
+                pos += np.dtype(FORMATS[basetype]).itemsize
+        elif desc[0] == Nodetype.NAME:
+            subfields, subchecks, pos = ros1_layout(desc[1], payload, pos, path + '.')
+            fields.extend(subfields)
+            checks.extend(subchecks)
+        else:
+            subdesc, length = desc[1]
+            if desc[0] == Nodetype.SEQUENCE:
+                length, = unpack_uint32(payload, pos)
+                checks.append((pos, length))
+                pos += 4
+            if subdesc[0] == Nodetype.BASE and base_type_name(subdesc) != 'string':
+                fmt = FORMATS[base_type_name(subdesc)]
+                if length:
+                    fields.append((path, (fmt, (length,)), pos))
+                pos += length * np.dtype(fmt).itemsize
+            elif subdesc[0] == Nodetype.BASE:
+                for i in range(length):
+                    pos = add_string(f'{path}[{i}]', pos)
+            else:
+                for i in range(length):
+                    subfields, subchecks, pos = ros1_layout(subdesc[1], payload, pos, f'{path}[{i}].')
+                    fields.extend(subfields)
+                    checks.extend(subchecks)
+    return fields, checks, pos
+
+
+def decode_batch(msgtype, timestamps, payloads):
+    """Decode raw ROS1 payloads of one message type into a structured array.
+
+    Returns an array with a 'timestamp' field followed by one field per flattened
+    message field, or with 'timestamp' and 'message' (object) fields when the
+    layout is not the same for every payload.
+    """
+    if payloads:
+        fields, checks, itemsize = ros1_layout(msgtype, payloads[0])
+        if all(len(x) == itemsize for x in payloads):
+            buffer = b''.join(payloads)
+            rows = np.frombuffer(buffer, dtype=np.uint8).reshape(len(payloads), itemsize)
+            uniform = all(
+                (rows[:, offset:offset + 4] == np.frombuffer(struct.pack('<L', value), dtype=np.uint8)).all()
+                for offset, value in checks
+            )
+            if uniform:
+                stored = [x for x in fields if x[2] is not None]
+                message_dtype = np.dtype({
+                    'names': [x[0] for x in stored],
+                    'formats': [x[1] for x in stored],
+                    'offsets': [x[2] for x in stored],
+                    'itemsize': itemsize,
+                })
+                messages = np.frombuffer(buffer, dtype=message_dtype)
+                result = np.zeros(len(payloads), dtype=[('timestamp', '<i8')] + [(x[0], x[1]) for x in fields])
+                result['timestamp'] = timestamps
+                for name, _, _ in stored:
+                    result[name] = messages[name]
+                return result
+    result = np.empty(len(payloads), dtype=[('timestamp', '<i8'), ('message', object)])
+    result['timestamp'] = timestamps
+    for i, payload in enumerate(payloads):
+        result['message'][i] = deserialize_ros1(payload, msgtype)
+    return result
+
+
+def read_array(paths, topic, start_time=None, end_time=None):
+    """Read every message of topic from paths into a NumPy structured array with timestamps attached.
+
+    Fixed layout message types are decoded in bulk with np.frombuffer, variable
+    layouts fall back to per message decoding (see decode_batch).
+    """
+    connections = []
+    for path in paths:
+        with IndexReader(path) as bag:
+            connections.extend(x for x in bag.connections if x.topic == topic)
+    msgtypes = {x.msgtype for x in connections}
+    if len(msgtypes) > 1:
+        raise ValueError(f'Topic {topic!r} carries several message types: {sorted(msgtypes)}.')
+    if not msgtypes:
+        return np.empty(0, dtype=[('timestamp', '<i8')])
+    register_connection_types(connections)
+    timestamps, payloads = [], []
+    for _, timestamp, rawdata in read_messages(paths, [topic], start_time, end_time):
+        timestamps.append(timestamp)
+        payloads.append(rawdata)
+    return decode_batch(msgtypes.pop(), timestamps, payloads)
+
+
+__all__ = [read_array.__name__, decode_batch.__name__, ros1_layout.__name__]
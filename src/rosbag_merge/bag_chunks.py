@@ -0,0 +1,148 @@
+"""
+
+Helps plan merges from the chunk index of rosbag1 files and copy chunk records verbatim.
+
+"""
+
+import bz2
+import struct
+from functools import partial
+from typing import NamedTuple
+
+import lz4.frame
+from rosbags.rosbag1.reader import Header, RecordType, bz2_decompress, lz4_decompress, read_bytes, read_uint32
+
+unpack_uint32 = struct.Struct('<L').unpack_from
+pack_uint32_into = struct.Struct('<L').pack_into
+# an IDXDATA entry: time (sec, nsec) and the offset of the message record in the chunk
+INDEX_ENTRY = struct.Struct('<LLL')
+
+# picklable chunk compressors (same levels as the rosbags writer) so they can run in a process pool
+COMPRESSORS = {
+    'none': None,
+    'bz2': partial(bz2.compress, compresslevel=9),
+    'lz4': partial(lz4.frame.compress, compression_level=0),
+}
+DECOMPRESSORS = {'none': bytes, 'bz2': bz2_decompress, 'lz4': lz4_decompress}
+
+
+class RawChunk(NamedTuple):
+    """A chunk record as stored on disk plus the index records that follow it."""
+
+    compression: str
+    size: int
+    data: bytes
+    start_time: int
+    end_time: int
+    # connection id -> packed IDXDATA entries (12 bytes per message)
+    index: dict
+
+
+class Segment(NamedTuple):
+    """A span of time together with every input chunk that has messages in it."""
+
+    start_time: int
+    end_time: int
+    chunks: list
+
+
+def read_raw_chunk(bio, chunk_info):
+    """Read the chunk record at chunk_info.pos without decompressing it."""
+    bio.seek(chunk_info.pos)
+    header = Header.read(bio, RecordType.CHUNK)
+    compression = header.get_string('compression')
+    size = header.get_uint32('size')
+    data = read_bytes(bio, read_uint32(bio))
+    index = {}
+    for _ in range(len(chunk_info.connection_counts)):
+        header = Header.read(bio, RecordType.IDXDATA)
+        index[header.get_uint32('conn')] = read_bytes(bio, read_uint32(bio))
+    return RawChunk(compression, size, data, chunk_info.start_time, chunk_info.end_time, index)
+
+
+def remap_raw_chunk(raw, id_map):
+    """Rewrite the connection ids of a raw chunk, returns None when that needs decompression.
+
+    Uncompressed chunks are patched in place by walking their record headers, which
+    is cheap compared to decoding and re-encoding every message.
+    """
+    if all(id_map.get(cid, cid) == cid for cid in raw.index):
+        return raw
+    if raw.compression != 'none':
+        return None
+    data = bytearray(raw.data)
+    pos = 0
+    while pos < len(data):
+        header_len, = unpack_uint32(data, pos)
+        field = pos + 4
+        pos = field + header_len
+        while field < pos:
+            field_len, = unpack_uint32(data, field)
+            if data[field + 4:field + 9] == b'conn=':
+                cid, = unpack_uint32(data, field + 9)
+                pack_uint32_into(data, field + 9, id_map.get(cid, cid))
+            field += 4 + field_len
+        data_len, = unpack_uint32(data, pos)
+        pos += 4 + data_len
+    index = {id_map.get(cid, cid): entries for cid, entries in raw.index.items()}
+    return raw._replace(data=bytes(data), index=index)
+
+
+def recompress_raw_chunk(raw, compression, id_map=None):
+    """Return a raw chunk compressed with compression, its connection ids rewritten by id_map.
+
+    The chunk is decompressed and sealed again as a whole, its messages and index
+    records are kept as they are.
+    """
+    raw = raw._replace(compression='none', data=DECOMPRESSORS[raw.compression](raw.data))
+    if id_map:
+        raw = remap_raw_chunk(raw, id_map)
+    compressor = COMPRESSORS[compression]
+    return raw._replace(compression=compression, data=compressor(raw.data) if compressor else raw.data)
+
+
+def raw_chunk_messages(raw):
+    """Return (connection id, timestamp, message data) of every message of a raw chunk in time order."""
+    data = memoryview(DECOMPRESSORS[raw.compression](raw.data))
+    messages = []
+    for cid, entries in raw.index.items():
+        for sec, nsec, offset in INDEX_ENTRY.iter_unpack(entries):
+            # the index points at the message record, its data follows the record header
+            pos = offset + 4 + unpack_uint32(data, offset)[0]
+            size, = unpack_uint32(data, pos)
+            messages.append((sec * 1_000_000_000 + nsec, offset, cid, data[pos + 4:pos + 4 + size]))
+    # equal timestamps keep the order of the chunk
+    messages.sort(key=lambda x: x[:2])
+    return [(cid, timestamp, message) for timestamp, _, cid, message in messages]
+
+
+def plan_segments(bags, start_time=None, end_time=None):
+    """Group the chunks of all bags into time disjoint segments.
+
+    A segment holding a single chunk does not interleave with any other input and
+    can be copied as is; all other segments need a message level merge.
+    """
+    items = sorted(
+        (
+            (info.start_time, info.end_time, i, info)
+            for i, bag in enumerate(bags)
+            for info in bag.chunk_infos
+            if info.connection_counts
+        ),
+        key=lambda x: x[:3],
+    )
+    segments = []
+    for start, end, i, info in items:
+        if (start_time is not None and end <= start_time) or (end_time is not None and start >= end_time):
+            continue
+        # chunk end times are exclusive, so touching chunks share no timestamp
+        if segments and start < segments[-1].end_time:
+            last = segments[-1]
+            segments[-1] = Segment(last.start_time, max(last.end_time, end), last.chunks + [(bags[i], info)])
+        else:
+            segments.append(Segment(start, end, [(bags[i], info)]))
+    return segments
+
+
+__all__ = [RawChunk.__name__, Segment.__name__, read_raw_chunk.__name__, remap_raw_chunk.__name__,
+           recompress_raw_chunk.__name__, raw_chunk_messages.__name__, plan_segments.__name__, 'COMPRESSORS']
@@ -0,0 +1,111 @@
+"""
+
+Helps read the index section of rosbag1 files without loading the per chunk index records.
+
+"""
+
+import re
+from collections import defaultdict
+
+from rosbags.interfaces import Connection
+from rosbags.rosbag1 import Reader, ReaderError
+from rosbags.rosbag1.reader import Header, RecordType
+
+
+class IndexReader(Reader):
+    """Rosbag1 reader which loads only the connection and chunk info records of a bag.
+
+    The chunk info records at the end of the file carry the time range and the
+    per connection message counts of every chunk, which is enough to plan a merge
+    without reading the chunks or their index records. Messages cannot be read.
+    """
+
+    def open(self):
+        """Open rosbag and read the connection and chunk info records."""
+        try:
+            self.bio = self.path.open('rb')  # pylint: disable=consider-using-with
+        except OSError as err:
+            raise ReaderError(f'Could not open file {str(self.path)!r}: {err.strerror}.') from err
+
+        try:
+            magic = self.bio.readline().decode()
+            if not magic:
+                raise ReaderError(f'File {str(self.path)!r} seems to be empty.')
+            if not re.match(r'#ROSBAG V2.0\n', magic):
+                raise ReaderError('File magic is invalid or bag version is not supported.')
+
+            header = Header.read(self.bio, RecordType.BAGHEADER)
+            index_pos = header.get_uint64('index_pos')
+            conn_count = header.get_uint32('conn_count')
+            chunk_count = header.get_uint32('chunk_count')
+            if index_pos == 0:
+                raise ReaderError('Bag is not indexed, reindex before reading.')
+            self.index_pos = index_pos
+
+            self.bio.seek(index_pos)
+            try:
+                self.connections = [self.read_connection() for _ in range(conn_count)]
+                self.chunk_infos = [self.read_chunk_info() for _ in range(chunk_count)]
+            except ReaderError as err:
+                raise ReaderError(f'Bag index looks damaged: {err.args}') from None
+
+            counts = defaultdict(int)
+            for chunk_info in self.chunk_infos:
+                for cid, count in chunk_info.connection_counts.items():
+                    counts[cid] += count
+            self.connections = [Connection(*x[0:5], counts[x.id], *x[6:]) for x in self.connections]
+        except ReaderError:
+            self.close()
+            raise
+
+    def messages(self, *args, **kwargs):
+        raise ReaderError('IndexReader only reads the bag index, open the bag with a Reader to read messages.')
+
+
+def time_ranges(paths):
+    """Return {path: (start_time, end_time)} of bags, end_time being exclusive, read from the index only."""
+    ranges = {}
+    for path in paths:
+        with IndexReader(path) as bag:
+            ranges[path] = (bag.start_time, bag.end_time)
+    return ranges
+
+
+def resolve_time(value, first_time=None):
+    """Turn unix seconds, or a "+SECONDS" string relative to first_time, into nanoseconds."""
+    if value is None:
+        return None
+    if isinstance(value, str) and value.startswith('+'):
+        return first_time + int(float(value[1:]) * 1e9)
+    return int(float(value) * 1e9)
+
+
+def prune_bags(paths, start_time=None, end_time=None, ranges=None):
+    """Return the paths whose bag has messages in [start_time, end_time), without opening the bags fully."""
+    if start_time is None and end_time is None:
+        return list(paths)
+    ranges = ranges if ranges is not None else time_ranges(paths)
+    return [
+        path for path in paths
+        if (start_time is None or ranges[path][1] > start_time)
+        and (end_time is None or ranges[path][0] < end_time)
+    ]
+
+
+def count_indexed(bags, topics=None, start_time=None, end_time=None):
+    """Count the selected messages of bags from their chunk infos.
+
+    Works with opened IndexReaders and catalog entries alike. Chunks straddling the
+    time window are counted in full, so the result is exact only without a window.
+    """
+    total = 0
+    for bag in bags:
+        selected = {x.id for x in bag.connections if topics is None or x.topic in topics}
+        for info in bag.chunk_infos:
+            if (start_time is not None and info.end_time <= start_time) or (end_time is not None and info.start_time >= end_time):
+                continue
+            total += sum(n for cid, n in info.connection_counts.items() if cid in selected)
+    return total
+
+
+__all__ = [IndexReader.__name__, time_ranges.__name__, resolve_time.__name__, prune_bags.__name__, count_indexed.__name__]
@@ -4,16 +4,30 @@ Helps stream bag data and apply bag writing capabilities.
 
 """
 
+import glob
 import hashlib
-import heapq
 import os
+from bisect import bisect_left
 from argparse import Namespace
+from concurrent.futures import ProcessPoolExecutor, as_completed
 from contextlib import ExitStack, contextmanager
+from itertools import chain
+from time import perf_counter
 
-from rosbags.rosbag1 import Reader, ReaderError, Writer, WriterError
+from rosbags.rosbag1 import Reader, ReaderError
 from rosbags.typesys import get_types_from_msg
+from rosbags.typesys.msg import normalize_msgtype
 from tqdm import tqdm
 
+from .bag_index import prune_bags
+from .bag_chunks import plan_segments, read_raw_chunk, recompress_raw_chunk, remap_raw_chunk
+from .bag_writer import BagWriter, SplitWriter
+from . import merge, output_formats
+from .dedup import Deduplicator
+from .mapped_reader import MappedReader
+from .prefetch import PrefetchReader
+from .stats import RunStats, profiled
+
 """
 Copyright open_rosbag1 and read_messages comes from marv_robotics
 https://gitlab.com/ternaris/marv-robotics/-/blob/master/code/marv-robotics/marv_robotics/bag.py#L360
@@ -23,88 +37,455 @@ https://gitlab.com/ternaris/marv-robotics/-/blob/master/code/marv-robotics/marv_
 
 
 @contextmanager
-def open_rosbag1(path):
+def open_rosbag1(path, mapped=False):
+    """Open a rosbag1 for reading, memory mapped with message data as memoryviews when mapped."""
+    # only errors opening the bag are reported as a missing index, not those raised while it is in use
     try:
-        with Reader(path) as bag:
-            yield bag
+        bag = (MappedReader if mapped else Reader)(path)
+        bag.open()
     except ReaderError:
         raise ReaderError(
             (
                 f'Unindexed bag file: {path}\n'
                 '  File was not copied in full or recording did not finish properly\n'
-                '  Use `rosbag reindex` to index what is there.'
+                '  Use --reindex (or `rosbag reindex`) to index what is there.'
             ),
         ) from None
+    try:
+        yield bag
+    finally:
+        bag.close()
+
+
+def connection_digest(connection):
+    """Return the md5 of a connection across rosbags versions."""
+    return connection.digest if hasattr(connection, 'digest') else connection.md5sum
+
+
+def connection_key(connection):
+    """Identify a connection by every attribute the output bag distinguishes it by."""
+    # writers store ros1 style message types, readers return normalized ones
+    return (connection.topic, normalize_msgtype(connection.msgtype), connection_digest(connection),
+            connection.ext.callerid, connection.ext.latching)
+
+
+def select_connections(bag, topics=None):
+    """Return the connections of an open bag which carry one of the topics."""
+    if (topics is None):
+        # connect to all topics
+        return [x for x in bag.connections]
+    return [x for x in bag.connections if x.topic in topics]
+
+
+def index_range(bag, connections):
+    """Return the (first, last) timestamp of the messages of connections from the index of an open bag."""
+    indexes = [bag.indexes[x.id] for x in connections if bag.indexes[x.id]]
+    if not indexes:
+        return (2**63 - 1, 0)
+    return min(x[0].time for x in indexes), max(x[-1].time for x in indexes)
+
+
+def merge_batches(bags, topics=None, start_time=None, end_time=None, prefetch_bytes=None, stats=None,
+                  validate=False):
+    """Iterate chronologically over batches of raw BagMessage for topic from open bags.
+
+    With prefetch_bytes, every bag is read on its own thread and at most
+    prefetch_bytes of message data are buffered across all of them. With a
+    RunStats, the time spent reading every bag is measured. With validate, the
+    merged order is checked and a ValueError raised when it is broken.
+    """
+    selected = [(bag, select_connections(bag, topics)) for bag in bags]
+    # an empty connection list would make the reader yield every topic
+    selected = [(bag, connections) for bag, connections in selected if connections]
+    gens = []
+    for bag, valid_connections in selected:
+        if prefetch_bytes:
+            gens.append(iter(PrefetchReader(
+                bag, valid_connections, start_time, end_time,
+                max_bytes=max(prefetch_bytes // len(selected), 1),
+            )))
+            continue
+        gens.append(
+            bag.messages(
+                connections=valid_connections,
+                start=start_time,
+                stop=end_time,
+            )
+        )
+    if stats is not None:
+        gens = [stats.timed_source(str(bag.path), gen) for (bag, _), gen in zip(selected, gens)]
+    ranges = [index_range(bag, connections) for bag, connections in selected]
+    batches = merge.merge_batches([merge.batched(gen) for gen in gens], ranges)
+    return merge.validated(batches) if validate else batches
+
+
+def merge_messages(bags, topics=None, start_time=None, end_time=None, prefetch_bytes=None, stats=None,
+                   validate=False):
+    """Iterate chronologically raw BagMessage for topic from open bags, see merge_batches."""
+    return chain.from_iterable(merge_batches(bags, topics, start_time, end_time, prefetch_bytes, stats, validate))
 
 
-def read_messages(paths, topics=None, start_time=None, end_time=None):
+def read_messages(paths, topics=None, start_time=None, end_time=None, prefetch_bytes=None):
     """Iterate chronologically raw BagMessage for topic from paths."""
-    # pylint: disable=too-many-locals
     with ExitStack() as stack:
         bags = [stack.enter_context(open_rosbag1(path)) for path in paths]
-        gens = []
-        for bag in bags:
-            valid_connections = []
-            if (topics is None):
-                # connect to all topics
-                valid_connections = [x for x in bag.connections]
-            else:
-                valid_connections = [
-                    x for x in bag.connections if x.topic in topics]
-            gens.append(
-                bag.messages(
-                    connections=valid_connections,
-                    start=start_time,
-                    stop=end_time,
-                )
-            )
-        prev_time = 0
-        for connection, time, data in heapq.merge(*gens, key=lambda x: x[1]):
-            assert time >= prev_time, (repr(time), repr(prev_time))
-            yield connection, time, data
-            prev_time = time
+        yield from merge_messages(bags, topics, start_time, end_time, prefetch_bytes)
+
+
+def count_messages(bags, topics=None, start_time=None, end_time=None):
+    """Count the messages merge_messages would yield using only the bag indexes."""
+    total = 0
+    for bag in bags:
+        for connection in select_connections(bag, topics):
+            index = bag.indexes[connection.id]
+            # the index entries compare against tuples by their time only
+            lower = 0 if start_time is None else bisect_left(index, (start_time,))
+            upper = len(index) if end_time is None else bisect_left(index, (end_time,))
+            total += max(upper - lower, 0)
+    return total
+
+
+def register_connections(output_bag, bags, topics=None):
+    """Add every selected input connection to the output bag before any message is written.
+
+    Input connections sharing a connection_key share one output connection, connections
+    the output bag already has (when appending) are reused.
+    Returns a map from (id(bag), input connection id) to the output connection.
+    """
+    out_connections = {connection_key(x): x for x in output_bag.connections}
+    conn_map = {}
+    for bag in bags:
+        for connection in select_connections(bag, topics):
+            key = connection_key(connection)
+            if key not in out_connections:
+                out_connections[key] = output_bag.add_connection(
+                    topic=connection.topic,
+                    msgtype=connection.msgtype,
+                    msgdef=connection.msgdef,
+                    md5sum=connection_digest(connection),
+                    callerid=connection.ext.callerid,
+                    latching=connection.ext.latching)
+            conn_map[id(bag), connection.id] = out_connections[key]
+    return conn_map
+
+
+def copy_raw_chunk(output_bag, bag, chunk_info, conn_map, topics=None, stats=None):
+    """Copy one input chunk to the output without merging its messages.
+
+    Chunks are copied as they are when they already have the output compression,
+    otherwise (or when a compressed chunk needs other connection ids) they are
+    decompressed and compressed again as a whole. Returns False when the chunk holds
+    filtered connections.
+    """
+    selected = {x.id for x in select_connections(bag, topics)}
+    if not selected.issuperset(chunk_info.connection_counts):
+        return False
+    id_map = {cid: conn_map[id(bag), cid].id for cid in chunk_info.connection_counts}
+    started = perf_counter()
+    raw = read_raw_chunk(bag.bio, chunk_info)
+    read = perf_counter()
+    compression = output_bag.compression_format
+    if raw.compression == compression:
+        raw = remap_raw_chunk(raw, id_map) or recompress_raw_chunk(raw, compression, id_map)
+    else:
+        raw = recompress_raw_chunk(raw, compression, id_map)
+    output_bag.write_raw_chunk(raw)
+    if stats is not None:
+        stats.seconds['read'] += read - started
+        stats.seconds['write'] += perf_counter() - read
+        stats.record_chunk(str(bag.path), {x.id: x for x in bag.connections}, chunk_info, raw, read - started)
+    return True
+
+
+def write_merged(output_bag, bags, conn_map, topics=None, start_time=None, end_time=None, passthrough=True,
+                 prefetch_bytes=None, stats=None, dedup=None, pipeline=None, validate=False):
+    """Write the selected messages of bags to output_bag in chronological order.
+
+    With passthrough, chunks which interleave with no other chunk are copied as
+    compressed records and only the interleaving spans are merged message by message.
+    Yields the number of messages written by each step for progress reporting.
+    With a RunStats, reading, writing and the written messages are accounted for.
+    With a Deduplicator, duplicate messages of the merged spans are dropped, with a
+    Pipeline its stages run on the merged messages (chunks are then never copied).
+    With validate, the order of the merged messages is checked.
+    """
+    write = output_bag.write
+    if stats is not None:
+        timed_write = stats.timed(output_bag.write, 'write')
+
+        def write(connection, timestamp, rawdata):
+            stats.record(connection.topic, len(rawdata))
+            timed_write(connection, timestamp, rawdata)
+
+    def write_messages(batches):
+        if dedup is None and pipeline is None:
+            for batch in batches:
+                for connection, timestamp, rawdata in batch:
+                    write(conn_map[id(connection.owner), connection.id], timestamp, rawdata)
+                yield len(batch)
+            return
+        messages = chain.from_iterable(batches)
+        if dedup is not None:
+            messages = dedup.filter(messages)
+        if pipeline is None:
+            for connection, timestamp, rawdata in messages:
+                write(conn_map[id(connection.owner), connection.id], timestamp, rawdata)
+                yield 1
+            return
+        for batch, consumed in pipeline.batches(messages):
+            for connection, timestamp, rawdata in batch:
+                write(conn_map[id(connection.owner), connection.id], timestamp, rawdata)
+            yield consumed
+
+    if not passthrough or pipeline is not None:
+        yield from write_messages(merge_batches(bags, topics, start_time, end_time, prefetch_bytes, stats, validate))
+        return
+    for segment in plan_segments(bags, start_time, end_time):
+        if len(segment.chunks) == 1:
+            bag, chunk_info = segment.chunks[0]
+            inside = ((start_time is None or chunk_info.start_time >= start_time)
+                      and (end_time is None or chunk_info.end_time <= end_time))
+            if inside and copy_raw_chunk(output_bag, bag, chunk_info, conn_map, topics, stats):
+                yield sum(chunk_info.connection_counts.values())
+                continue
+        # inputs in the same order as bags so equal timestamps keep their order
+        segment_bags = [x for x in bags if any(x is bag for bag, _ in segment.chunks)]
+        segment_start = segment.start_time if start_time is None else max(segment.start_time, start_time)
+        segment_end = segment.end_time if end_time is None else min(segment.end_time, end_time)
+        yield from write_messages(merge_batches(segment_bags, topics, segment_start, segment_end, prefetch_bytes,
+                                                stats, validate))
+
+
+def plan_windows(bags, count, topics=None, start_time=None, end_time=None):
+    """Split the time span of bags into at most count windows holding similar numbers of messages.
+
+    Window boundaries fall on chunk start times and are derived from the chunk
+    infos only. Windows are [start, end) and together cover every selected message
+    inside [start_time, end_time).
+    """
+    chunks = []
+    for bag in bags:
+        selected = {x.id for x in select_connections(bag, topics)}
+        for info in bag.chunk_infos:
+            if (start_time is not None and info.end_time <= start_time) or (end_time is not None and info.start_time >= end_time):
+                continue
+            messages = sum(n for cid, n in info.connection_counts.items() if cid in selected)
+            if messages:
+                chunks.append((info.start_time, info.end_time, messages))
+    if not chunks:
+        return []
+    chunks.sort()
+    total = sum(x[2] for x in chunks)
+    bounds = [chunks[0][0] if start_time is None else max(chunks[0][0], start_time)]
+    seen = 0
+    for start, _, messages in chunks:
+        if seen >= total * len(bounds) / count and start > bounds[-1]:
+            bounds.append(start)
+        seen += messages
+    last = max(x[1] for x in chunks)
+    bounds.append(last if end_time is None else min(last, end_time))
+    return list(zip(bounds[:-1], bounds[1:]))
+
+
+def connection_args(output_bag):
+    """Return the add_connection arguments of the connections of output_bag, in order."""
+    # writers keep ros1 style message types, add_connection takes normalized ones
+    return [dict(topic=x.topic, msgtype=normalize_msgtype(x.msgtype), msgdef=x.msgdef, md5sum=connection_digest(x),
+                 callerid=x.ext.callerid, latching=x.ext.latching) for x in output_bag.connections]
+
+
+def merge_window(input_bags, topics, part_path, start_time, end_time, compression='none', chunk_size=None,
+                 prefetch_bytes=None, mapped=True, validate=False, collect_stats=False, connections=()):
+    """Merge one time window of the input bags into a partial bag (runs in a worker process).
+
+    connections, the add_connection arguments of the final output, are added first so
+    the partial bag shares its connection ids whichever inputs the window opens.
+    Returns the number of messages written and, with collect_stats, the RunStats
+    state of the window (None otherwise).
+    """
+    stats = RunStats() if collect_stats else None
+    with ExitStack() as stack:
+        bags = [stack.enter_context(open_rosbag1(path, mapped)) for path in input_bags]
+        output_bag = stack.enter_context(BagWriter(part_path, compression=compression, chunk_size=chunk_size))
+        for kwargs in connections:
+            output_bag.add_connection(**kwargs)
+        conn_map = register_connections(output_bag, bags, topics)
+        started = perf_counter()
+        count = sum(write_merged(output_bag, bags, conn_map, topics, start_time, end_time,
+                                 prefetch_bytes=prefetch_bytes, stats=stats, validate=validate))
+        if stats is not None:
+            stats.seconds['loop'] += perf_counter() - started
+            close_started = perf_counter()
+    if stats is not None:
+        stats.seconds['close'] += perf_counter() - close_started
+    return count, stats.state() if stats is not None else None
+
+
+def stitch_parts(output_bag, part_paths):
+    """Append the chunks of partial bags to output_bag, decompressing only chunks of another compression."""
+    compression = output_bag.compression_format
+    for part_path in part_paths:
+        with open_rosbag1(part_path) as part:
+            for chunk_info in sorted(part.chunk_infos, key=lambda x: x.pos):
+                if chunk_info.connection_counts:
+                    raw = read_raw_chunk(part.bio, chunk_info)
+                    if raw.compression != compression:
+                        raw = recompress_raw_chunk(raw, compression)
+                    output_bag.write_raw_chunk(raw)
+
+
+def merge_sharded(output_bag, bags, topics, part_prefix, jobs, compression='none', chunk_size=None,
+                  prefetch_bytes=None, start_time=None, end_time=None, mapped=True, validate=False, stats=None):
+    """Merge time windows of bags in parallel processes and stitch the partial bags into output_bag.
+
+    Yields the number of messages merged by every finished window for progress reporting.
+    With a RunStats, the stage times and counts of the windows are added to it and
+    the time spent stitching is its stitch stage.
+    """
+    input_bags = [str(bag.path) for bag in bags]
+    # windows only open the inputs holding messages inside of them, so indexes are not parsed jobs times over
+    ranges = {}
+    for path, bag in zip(input_bags, bags):
+        first, last = index_range(bag, select_connections(bag, topics))
+        ranges[path] = (first, last + 1)
+    connections = connection_args(output_bag)
+    part_paths = []
+    try:
+        with ProcessPoolExecutor(jobs) as pool:
+            futures = []
+            for i, (start, end) in enumerate(plan_windows(bags, jobs, topics, start_time, end_time)):
+                part_paths.append(f'{part_prefix}.part{i:04d}.bag')
+                if os.path.exists(part_paths[-1]):
+                    os.remove(part_paths[-1])
+                futures.append(pool.submit(merge_window, prune_bags(input_bags, start, end, ranges), topics,
+                                           part_paths[-1], start, end, compression, chunk_size, prefetch_bytes,
+                                           mapped, validate, stats is not None, connections))
+            for future in as_completed(futures):
+                count, state = future.result()
+                if stats is not None:
+                    stats.add(state)
+                yield count
+        stitch_started = perf_counter()
+        stitch_parts(output_bag, part_paths)
+        if stats is not None:
+            stats.seconds['stitch'] += perf_counter() - stitch_started
+    finally:
+        for part_path in part_paths:
+            if os.path.exists(part_path):
+                os.remove(part_path)
 
 
 MD5_DEFAULT = str(hashlib.md5())
 
 
-def main(input_bags: 'list[str]', topics: 'list[str]', output_path: str, outbag_name: str, exists_ok: bool):
+def main(input_bags: 'list[str]', topics: 'list[str]', output_path: str, outbag_name: str, exists_ok: bool,
+         passthrough: bool = True, compression: str = None, chunk_size: int = None, compression_workers: int = 0,
+         prefetch_mb: int = 0, jobs: int = 1, start_time: int = None, end_time: int = None, catalog=None, metadata=None,
+         split_size: float = None, split_duration: float = None, stats_json: str = None, profile_path: str = None,
+         dedup: bool = False, dedup_window: float = 0.0, pipeline=None, output_format: str = 'bag',
+         mapped: bool = True, validate: bool = False, on_progress=None) -> bool:
+    # returns whether the merge finished, False when it was interrupted
+    # on_progress(messages done, total) replaces the progress bar when given
+    # stage times and per input/topic counts are only collected when a report is requested
+    # without a compression the default of the output format is used
+    stats = RunStats() if stats_json else None
+    if (dedup or pipeline is not None) and jobs > 1:
+        raise ValueError('Dropping duplicates and pipeline stages need the whole merge in one process, they cannot be combined with jobs.')
+    deduplicator = Deduplicator(int(dedup_window * 1e9)) if dedup else None
+    if dedup_window:
+        # copied chunks are not compared against messages up to a window apart
+        passthrough = False
+    if compression is None:
+        compression = output_formats.DEFAULT_COMPRESSION[output_format]
+    split = bool(split_size or split_duration)
+    if output_format != 'bag':
+        if split or jobs > 1:
+            raise ValueError(f'{output_format} output is written in one piece by one process, it cannot be split or merged with jobs.')
+        # rosbag1 chunks cannot be copied into other formats
+        passthrough = False
+        # the other writers hand message data to libraries expecting bytes
+        mapped = False
     try:
-        full_bag_path = os.path.join(output_path, outbag_name+".bag")
+        full_bag_path = os.path.join(output_path, outbag_name + output_formats.EXTENSIONS[output_format])
+        # a split output is written to <outbag_name>_0000.bag, <outbag_name>_0001.bag, ...
+        output_bags = glob.glob(os.path.join(glob.escape(output_path), glob.escape(outbag_name) + '_[0-9][0-9][0-9][0-9].bag')) if split else [full_bag_path]
         # clean up the preexisting bag when the exists_okay flag is present
-        if (exists_ok and os.path.exists(full_bag_path)):
-            os.remove(full_bag_path)
-            for bag_name in input_bags:
-                if (os.path.basename(bag_name) == outbag_name+".bag"):
-                    input_bags.remove(bag_name)
-
-        # open the output bag in an automatically closing context
-        with Writer(full_bag_path) as output_bag:
-            conn_map = {}
-            def read_messages_generator(): return read_messages(input_bags, topics=topics)
-            # total = len(list(read_messages_generator()))
-            total = 0
-            for i in read_messages_generator():
-                total = total + 1
-            # process messages across input bag(s)
-            for connection, timestamp, rawdata in tqdm(read_messages_generator(), desc="Reading Bags", bar_format='{l_bar}{bar}{r_bar}', total=total):
-                # make dict for safe gets of connection attributes
-                try:
-                    conn_map[connection.topic] = output_bag.add_connection(
-                        topic=connection.topic,
-                        msgtype=connection.msgtype,
-                        msgdef=connection.msgdef,
-                        # connection.digest found to be used in writer.py - > write_connection(..)
-                        md5sum=connection.digest if hasattr(connection, 'digest') else connection.md5sum,
-                        callerid=connection.ext.callerid,
-                        latching=connection.ext.latching)
-                except WriterError:
-                    pass
-            for connection, timestamp, rawdata in tqdm(read_messages_generator(), desc="Writing New Bag", bar_format='{l_bar}{bar}{r_bar}', total=total):
-                # write this message to the output bag
-                output_bag.write(
-                    conn_map[connection.topic], timestamp, rawdata)
+        if exists_ok:
+            for output_bag_path in output_bags:
+                output_formats.remove_output(output_bag_path, input_bags)
+            output_names = {os.path.basename(x) for x in output_bags}
+            input_bags = [x for x in input_bags if os.path.basename(x) not in output_names]
+
+        # planning metadata comes from the catalog when one is given instead of reading every bag index
+        # or from metadata the caller already loaded from one
+        if metadata is None and catalog is not None:
+            metadata = catalog.load(input_bags)
+        ranges = {path: (meta.start_time, meta.end_time) for path, meta in metadata.items()} if metadata else None
+        # bags whose index lies outside of the time window are never opened for reading
+        input_bags = prune_bags(input_bags, start_time, end_time, ranges)
+        with ExitStack() as stack:
+            # every input is opened once; connections and totals come from the bag indexes
+            # mapped inputs pass message data on to the writer as memoryviews without copying it
+            bags = [stack.enter_context(open_rosbag1(path, mapped)) for path in input_bags]
+            # open the output bag in an automatically closing context
+            executor = None
+            if compression_workers > 0 and compression != 'none':
+                # compress sealed chunks in parallel while the merge fills the next one
+                executor = stack.enter_context(ProcessPoolExecutor(compression_workers))
+            writer_kwargs = dict(compression=compression, chunk_size=chunk_size, executor=executor,
+                                 max_pending=2 * compression_workers)
+            if split:
+                output_bag = stack.enter_context(SplitWriter(
+                    os.path.join(output_path, outbag_name),
+                    split_size=int(split_size * (1 << 20)) if split_size else None,
+                    split_duration=int(split_duration * 1e9) if split_duration else None,
+                    **writer_kwargs))
+            elif output_format != 'bag':
+                output_bag = stack.enter_context(output_formats.WRITERS[output_format](
+                    full_bag_path, compression=compression, chunk_size=chunk_size))
+            else:
+                output_bag = stack.enter_context(BagWriter(full_bag_path, **writer_kwargs))
+            conn_map = register_connections(output_bag, bags, topics)
+            # the open bags count messages exactly, catalog chunk counts would include whole straddling chunks
+            total = count_messages(bags, topics, start_time, end_time)
+            if jobs > 1:
+                # merge time windows in parallel processes, then stitch their chunks together
+                steps = merge_sharded(output_bag, bags, topics, os.path.join(output_path, '.' + outbag_name), jobs,
+                                      compression=compression, chunk_size=chunk_size,
+                                      prefetch_bytes=prefetch_mb * (1 << 20), start_time=start_time, end_time=end_time,
+                                      mapped=mapped, validate=validate, stats=stats)
+            else:
+                # process messages across input bag(s) in a single pass
+                steps = write_merged(output_bag, bags, conn_map, topics=topics, start_time=start_time, end_time=end_time,
+                                     passthrough=passthrough, prefetch_bytes=prefetch_mb * (1 << 20), stats=stats,
+                                     dedup=deduplicator, pipeline=pipeline, validate=validate)
+            if stats is not None:
+                stats.seconds['setup'] += perf_counter() - stats.started
+            loop_started = perf_counter()
+            with tqdm(desc="Merging Bags", bar_format='{l_bar}{bar}{r_bar}', total=total,
+                      disable=on_progress is not None) as progress, profiled(profile_path):
+                done = 0
+                for count in steps:
+                    progress.update(count)
+                    if on_progress is not None:
+                        done += count
+                        on_progress(done, total)
+            # closing the output seals and compresses the last chunks and writes the index
+            close_started = perf_counter()
+        if deduplicator is not None:
+            dropped = deduplicator.report()
+            print(f"Dropped {sum(dropped.values())} duplicate messages" + "".join(f"\n  {topic}: {count}" for topic, count in dropped.items()))
+        if stats is not None:
+            stats.duplicates = deduplicator.report() if deduplicator is not None else {}
+            if jobs == 1:
+                # with jobs the merge loops of the windows were added up in their processes
+                stats.seconds['loop'] += close_started - loop_started
+            stats.seconds['close'] += perf_counter() - close_started
+            print(stats.summary())
+            stats.write_json(stats_json)
     except KeyboardInterrupt:
-        pass
+        # the output holds only part of the inputs, callers keeping track of merged inputs must not record them
+        return False
     finally:
         print("Done.")
+    return True
@@ -0,0 +1,366 @@
+"""
+
+Extends the rosbags rosbag1 Writer with the capabilities needed for merging.
+
+"""
+
+import os
+import struct
+from collections import defaultdict, deque
+from io import BytesIO
+from pathlib import Path
+
+from rosbags.interfaces import Connection
+from rosbags.rosbag1 import Writer, WriterError
+from rosbags.rosbag1.reader import ChunkInfo, RecordType
+from rosbags.rosbag1.writer import Header, WriteChunk, serialize_time, serialize_uint32
+from rosbags.typesys.msg import denormalize_msgtype
+
+from .bag_chunks import COMPRESSORS, raw_chunk_messages
+from .bag_index import IndexReader
+
+# the message data record header as the rosbags Header writes it (op, conn, time) and the data length
+MSGDATA_HEADER = struct.Struct('<L L3sB L5sL L5sLL L')
+# bytes on disk besides the payload: a message record header plus its 12 byte index entry
+MESSAGE_OVERHEAD = MSGDATA_HEADER.size + 12
+# an IDXDATA record header (ver, conn, count) with its data length
+IDXDATA_OVERHEAD = 55
+# a chunk record header (compression, size) with its data length
+CHUNK_OVERHEAD = 64
+# a CHUNK_INFO record (ver, chunk_pos, start_time, end_time, count) without its 8 bytes per connection
+CHUNK_INFO_OVERHEAD = 108
+
+
+class BagWriter(Writer):
+    """Rosbag1 writer which also accepts raw chunk records copied from other bags.
+
+    Sealed chunks are tracked as reader style ChunkInfo records so chunks written
+    from messages and chunks copied verbatim share one index. When an executor is
+    given, sealed chunks are compressed on it while the next chunk is being filled
+    and are written to disk in the order they were sealed.
+    """
+
+    def __init__(self, path, compression='none', chunk_size=None, executor=None, max_pending=4):
+        super().__init__(path)
+        if compression not in COMPRESSORS:
+            raise WriterError(f'Compression {compression!r} is not supported.')
+        self.compression_format = compression
+        self.compressor = COMPRESSORS[compression]
+        if chunk_size:
+            self.chunk_threshold = chunk_size
+        self.executor = executor if self.compressor else None
+        self.max_pending = max_pending
+        # sealed chunks waiting for their compressed data
+        self.pending = deque()
+        # chunk info of every chunk already on disk, in file order
+        self.chunk_infos = []
+
+    def write(self, connection, timestamp, data):
+        """Write a message like Writer.write, packing its record header in one go.
+
+        data may be any bytes-like object, memoryviews are written into the chunk
+        without being copied into bytes first.
+        """
+        connections = self.connections
+        if not self.bio or connection.id >= len(connections) or connections[connection.id] is not connection:
+            # let the rosbags writer check and report the unusual cases
+            super().write(connection, timestamp, data)
+            return
+        chunk = self.chunks[-1]
+        buffer = chunk.data
+        chunk.connections[connection.id].append((timestamp, buffer.tell()))
+        if timestamp < chunk.start:
+            chunk.start = timestamp
+        if timestamp > chunk.end:
+            chunk.end = timestamp
+        sec, nsec = divmod(timestamp, 1_000_000_000)
+        buffer.write(MSGDATA_HEADER.pack(38, 4, b'op=', RecordType.MSGDATA, 9, b'conn=', connection.id,
+                                         13, b'time=', sec, nsec, len(data)))
+        buffer.write(data)
+        if buffer.tell() > self.chunk_threshold:
+            self.write_chunk(chunk)
+
+    def write_chunk(self, chunk):
+        """Seal the open chunk and write it once it is compressed."""
+        size = chunk.data.tell()
+        if size == 0:
+            return
+        self.chunks = [x for x in self.chunks if x is not chunk]
+        self.chunks.append(WriteChunk(BytesIO(), -1, 2**64, 0, defaultdict(list)))
+        if self.compressor is None:
+            # uncompressed chunks are written straight from the chunk buffer
+            with chunk.data.getbuffer() as data:
+                self.write_sealed_chunk(chunk, size, data)
+            chunk.data.close()
+            return
+        data = chunk.data.getvalue()
+        chunk.data.close()
+        if self.executor is None:
+            self.write_sealed_chunk(chunk, size, self.compressor(data))
+        else:
+            self.pending.append((chunk, size, self.executor.submit(self.compressor, data)))
+            self.drain(self.max_pending)
+
+    def drain(self, limit=0):
+        """Write compressed chunks in order until at most limit of them are pending."""
+        while self.pending and (len(self.pending) > limit or self.pending[0][2].done()):
+            chunk, size, future = self.pending.popleft()
+            self.write_sealed_chunk(chunk, size, future.result())
+
+    def write_sealed_chunk(self, chunk, size, data):
+        """Write a chunk record with its index records and remember its chunk info."""
+        assert self.bio
+        chunk.pos = self.bio.tell()
+
+        header = Header()
+        header.set_string('compression', self.compression_format)
+        header.set_uint32('size', size)
+        header.write(self.bio, RecordType.CHUNK)
+        self.bio.write(serialize_uint32(len(data)))
+        self.bio.write(data)
+
+        for cid, items in chunk.connections.items():
+            header = Header()
+            header.set_uint32('ver', 1)
+            header.set_uint32('conn', cid)
+            header.set_uint32('count', len(items))
+            header.write(self.bio, RecordType.IDXDATA)
+            self.bio.write(serialize_uint32(len(items) * 12))
+            for time, offset in items:
+                self.bio.write(serialize_time(time) + serialize_uint32(offset))
+
+        self.chunk_infos.append(ChunkInfo(
+            chunk.pos,
+            chunk.start,
+            chunk.end + 1,
+            {cid: len(items) for cid, items in chunk.connections.items()},
+        ))
+
+    def flush_chunk(self):
+        """Seal the open chunk when it holds any message and write every pending chunk."""
+        if self.chunks[-1].connections:
+            self.write_chunk(self.chunks[-1])
+        self.drain()
+
+    def write_raw_chunk(self, raw):
+        """Write a chunk record and its index records from an already compressed RawChunk.
+
+        The connection ids inside the chunk must already match this writer.
+        """
+        assert self.bio
+        # messages written so far have to precede the copied chunk
+        self.flush_chunk()
+        pos = self.bio.tell()
+
+        header = Header()
+        header.set_string('compression', raw.compression)
+        header.set_uint32('size', raw.size)
+        header.write(self.bio, RecordType.CHUNK)
+        self.bio.write(serialize_uint32(len(raw.data)))
+        self.bio.write(raw.data)
+
+        for cid, entries in raw.index.items():
+            header = Header()
+            header.set_uint32('ver', 1)
+            header.set_uint32('conn', cid)
+            header.set_uint32('count', len(entries) // 12)
+            header.write(self.bio, RecordType.IDXDATA)
+            self.bio.write(serialize_uint32(len(entries)))
+            self.bio.write(entries)
+
+        self.chunk_infos.append(ChunkInfo(
+            pos,
+            raw.start_time,
+            raw.end_time,
+            {cid: len(entries) // 12 for cid, entries in raw.index.items()},
+        ))
+
+    def close(self):
+        """Close rosbag1 after writing.
+
+        Closes open chunks and writes the index from the collected chunk infos.
+        """
+        assert self.bio
+        self.write_chunk(self.chunks[-1])
+        self.drain()
+
+        index_pos = self.bio.tell()
+
+        for connection in self.connections:
+            self.write_connection(connection, self.bio)
+
+        for info in self.chunk_infos:
+            header = Header()
+            header.set_uint32('ver', 1)
+            header.set_uint64('chunk_pos', info.pos)
+            header.set_time('start_time', info.start_time if info.connection_counts else 0)
+            header.set_time('end_time', info.end_time - 1 if info.connection_counts else 0)
+            header.set_uint32('count', len(info.connection_counts))
+            header.write(self.bio, RecordType.CHUNK_INFO)
+            self.bio.write(serialize_uint32(len(info.connection_counts) * 8))
+            for cid, count in info.connection_counts.items():
+                self.bio.write(serialize_uint32(cid) + serialize_uint32(count))
+
+        self.bio.seek(13)
+        header = Header()
+        header.set_uint64('index_pos', index_pos)
+        header.set_uint32('conn_count', len(self.connections))
+        header.set_uint32('chunk_count', len(self.chunk_infos))
+        size = header.write(self.bio, RecordType.BAGHEADER)
+        padsize = 4096 - 4 - size
+        self.bio.write(serialize_uint32(padsize) + b' ' * padsize)
+
+        self.bio.close()
+
+
+class AppendWriter(BagWriter):
+    """Reopens a bag to write chunks after its existing ones, then rewrites its index.
+
+    The bag is truncated at cut_pos (by default where its index starts) and keeps
+    its connections and the chunks before that position. Closing writes the index
+    for the kept and the new chunks alike.
+    """
+
+    def __init__(self, path, cut_pos=None, **kwargs):
+        path = Path(path)
+        if not path.exists():
+            raise WriterError(f'{path} does not exist, there is nothing to append to.')
+        # the rosbags writer refuses existing paths, so it is set up on a free name first
+        super().__init__(path.with_name(f'.{path.name}.{os.getpid()}.append'), **kwargs)
+        self.path = path
+        self.cut_pos = cut_pos
+
+    def open(self):
+        """Reopen the bag, keeping its connections and the chunks before the cut."""
+        with IndexReader(self.path) as bag:
+            connections = bag.connections
+            chunk_infos = bag.chunk_infos
+            cut_pos = bag.index_pos if self.cut_pos is None else self.cut_pos
+        self.connections = [
+            Connection(x.id, x.topic, denormalize_msgtype(x.msgtype), x.msgdef, x.digest, -1, x.ext, self)
+            for x in connections
+        ]
+        self.chunk_infos = sorted((x for x in chunk_infos if x.pos < cut_pos), key=lambda x: x.pos)
+        self.bio = self.path.open('r+b')  # pylint: disable=consider-using-with
+        self.bio.seek(cut_pos)
+        self.bio.truncate()
+
+
+class SplitWriter:
+    """Writes a merge into consecutive bags bounded in size and/or duration.
+
+    Offers the part of the Writer interface used by the merge and rolls over from
+    <prefix>_0000.bag to <prefix>_0001.bag and so on whenever the open segment is
+    full. Sizes include the index records every segment ends with. Every segment
+    registers the same connections in the same order, so the connections returned
+    by add_connection stay valid across segments. A finished segment is closed,
+    index included, while the merge continues.
+    """
+
+    def __init__(self, prefix, split_size=None, split_duration=None, **writer_kwargs):
+        self.prefix = prefix
+        self.split_size = split_size
+        self.split_duration = split_duration
+        self.writer_kwargs = writer_kwargs
+        self.compression_format = writer_kwargs.get('compression', 'none')
+        self.paths = []
+        self.connection_args = []
+        self.connections = []
+        # bytes of the connection records in the index of every segment
+        self.connection_bytes = 0
+        self.writer = None
+        self.segment_start = None
+        # bytes of the chunk info records of the chunks the open segment has on disk, and how many were counted
+        self.info_bytes = 0
+        self.infos_counted = 0
+
+    def open(self):
+        self.roll()
+
+    def roll(self):
+        """Finalize the open segment and start the next one."""
+        if self.writer is not None:
+            self.writer.close()
+        self.paths.append(f'{self.prefix}_{len(self.paths):04d}.bag')
+        self.writer = BagWriter(self.paths[-1], **self.writer_kwargs)
+        self.writer.open()
+        for kwargs in self.connection_args:
+            self.writer.add_connection(**kwargs)
+        self.segment_start = None
+        self.info_bytes = 0
+        self.infos_counted = 0
+
+    def segment_size(self):
+        """Return the size the open segment would have when closed now."""
+        writer = self.writer
+        infos = writer.chunk_infos
+        for info in infos[self.infos_counted:]:
+            self.info_bytes += CHUNK_INFO_OVERHEAD + 8 * len(info.connection_counts)
+        self.infos_counted = len(infos)
+        size = writer.bio.tell() + self.connection_bytes + self.info_bytes
+        chunk = writer.chunks[-1]
+        if chunk.connections:
+            size += (CHUNK_OVERHEAD + chunk.data.tell() + CHUNK_INFO_OVERHEAD
+                     + sum(IDXDATA_OVERHEAD + 8 + 12 * len(x) for x in chunk.connections.values()))
+        return size
+
+    def full(self, timestamp, size):
+        """Check whether adding size bytes at timestamp would overflow the open segment."""
+        if self.segment_start is None:
+            return False
+        if self.split_duration is not None and timestamp - self.segment_start >= self.split_duration:
+            return True
+        if self.split_size is not None:
+            return self.segment_size() + size > self.split_size
+        return False
+
+    def add_connection(self, topic, msgtype, msgdef=None, md5sum=None, callerid=None, latching=None):
+        kwargs = dict(topic=topic, msgtype=msgtype, msgdef=msgdef, md5sum=md5sum, callerid=callerid, latching=latching)
+        connection = self.writer.add_connection(**kwargs)
+        record = BytesIO()
+        self.writer.write_connection(connection, record)
+        self.connection_bytes += record.tell()
+        self.connection_args.append(kwargs)
+        self.connections.append(connection)
+        return connection
+
+    def write(self, connection, timestamp, data):
+        size = len(data) + MESSAGE_OVERHEAD
+        if connection.id not in self.writer.chunks[-1].connections:
+            size += IDXDATA_OVERHEAD + 8
+        if self.full(timestamp, size):
+            self.roll()
+        if self.segment_start is None:
+            self.segment_start = timestamp
+        self.writer.write(self.writer.connections[connection.id], timestamp, data)
+
+    def write_raw_chunk(self, raw):
+        size = (CHUNK_OVERHEAD + len(raw.data) + CHUNK_INFO_OVERHEAD
+                + sum(IDXDATA_OVERHEAD + 8 + len(x) for x in raw.index.values()))
+        if self.full(raw.start_time, size):
+            self.roll()
+        start = raw.start_time if self.segment_start is None else self.segment_start
+        # end times of chunks are exclusive
+        too_long = self.split_duration is not None and raw.end_time - 1 - start >= self.split_duration
+        too_big = self.split_size is not None and self.segment_size() + size > self.split_size
+        if too_long or too_big:
+            # a chunk which does not fit into the segment is split message by message
+            for cid, timestamp, data in raw_chunk_messages(raw):
+                self.write(self.connections[cid], timestamp, data)
+            return
+        self.segment_start = start
+        self.writer.write_raw_chunk(raw)
+
+    def close(self):
+        self.writer.close()
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+__all__ = [BagWriter.__name__, AppendWriter.__name__, SplitWriter.__name__, 'COMPRESSORS']
@@ -0,0 +1,173 @@
+"""
+
+Runs a manifest of merge outputs, reading inputs shared by several outputs only once.
+
+A manifest (JSON, or YAML when PyYAML is installed) lists outputs, each with its own
+inputs, topics, time window and compression:
+
+    {
+      "output_path": "merged",
+      "inputs": ["recordings/"],
+      "outputs": [
+        {"name": "navigation", "topics": ["/odom", "/imu"], "compression": "lz4"},
+        {"name": "drive", "topics": ["/cmd_vel"], "start": "+60", "end": "+120"},
+        {"name": "other_day", "inputs": ["other_day/"]}
+      ]
+    }
+
+Outputs sharing an input form one job, which makes a single chronological pass over
+its inputs and routes every message to each output selecting it. Jobs with disjoint
+inputs run in parallel processes.
+
+"""
+
+import json
+import os
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+from typing import NamedTuple
+
+from tqdm import tqdm
+
+from .bag_index import resolve_time, time_ranges
+from .bag_stream import merge_messages, open_rosbag1, register_connections
+from .bag_writer import BagWriter
+
+try:
+    import yaml
+except ImportError:  # pragma: no cover
+    yaml = None
+
+
+class OutputSpec(NamedTuple):
+    """One output of a manifest, with its inputs expanded and its time window in nanoseconds."""
+
+    path: str
+    inputs: list
+    topics: list
+    start_time: int
+    end_time: int
+    compression: str
+    chunk_size: int
+
+
+def load_manifest(path):
+    """Read a JSON or YAML manifest."""
+    with open(path) as f:
+        if path.endswith(('.yaml', '.yml')):
+            if yaml is None:
+                raise ImportError('YAML manifests require PyYAML, install it with `pip install rosbag_merge[yaml]`.')
+            return yaml.safe_load(f)
+        return json.load(f)
+
+
+def expand_inputs(paths):
+    """Replace directories by the bags inside them, keeping the order of the given paths."""
+    result = []
+    for path in paths:
+        if os.path.isdir(path):
+            result.extend(sorted(entry.path for entry in os.scandir(path) if entry.name.endswith('.bag')))
+        else:
+            result.append(path)
+    return [os.path.normpath(x) for x in result]
+
+
+def plan_outputs(manifest, output_path='./', input_bags=()):
+    """Turn a manifest into OutputSpecs.
+
+    Outputs without inputs use the manifest inputs, or input_bags when the manifest
+    has none. Relative "+SECONDS" times count from the first message of the output inputs.
+    """
+    output_path = manifest.get('output_path', output_path)
+    default_inputs = manifest.get('inputs', input_bags)
+    outputs = []
+    for entry in manifest['outputs']:
+        inputs = expand_inputs(entry.get('inputs', default_inputs))
+        if not inputs:
+            raise ValueError(f"Output {entry['name']!r} has no input bags.")
+        times = [entry.get('start'), entry.get('end')]
+        first_time = None
+        if any(isinstance(x, str) and x.startswith('+') for x in times):
+            first_time = min(start for start, _ in time_ranges(inputs).values())
+        outputs.append(OutputSpec(
+            os.path.join(output_path, entry['name'] + '.bag'),
+            inputs,
+            entry.get('topics'),
+            *(resolve_time(x, first_time) for x in times),
+            entry.get('compression', manifest.get('compression', 'none')),
+            entry.get('chunk_size', manifest.get('chunk_size')),
+        ))
+    paths = [x.path for x in outputs]
+    if len(set(paths)) != len(paths):
+        raise ValueError('Every output of a manifest needs its own name.')
+    return outputs
+
+
+def group_jobs(outputs):
+    """Group outputs which share an input bag into jobs, so that jobs have disjoint inputs."""
+    groups = []
+    for output in outputs:
+        inputs = set(output.inputs)
+        joined = [x for x in groups if x[0] & inputs]
+        for group in joined:
+            groups.remove(group)
+            inputs |= group[0]
+        groups.append((inputs, [output for group in joined for output in group[1]] + [output]))
+    return [sorted(x[1], key=outputs.index) for x in groups]
+
+
+def run_job(outputs, progress=False):
+    """Write every output of one job in a single pass over their inputs, returns {output path: messages}."""
+    inputs = list(dict.fromkeys(path for output in outputs for path in output.inputs))
+    # the pass reads what any output needs, each output then filters its own messages
+    topics = None if any(x.topics is None for x in outputs) else sorted({t for x in outputs for t in x.topics})
+    starts = [x.start_time for x in outputs]
+    ends = [x.end_time for x in outputs]
+    start_time = None if None in starts else min(starts)
+    end_time = None if None in ends else max(ends)
+    counts = [0] * len(outputs)
+    with ExitStack() as stack:
+        bags = {path: stack.enter_context(open_rosbag1(path)) for path in inputs}
+        routes = defaultdict(list)
+        for index, output in enumerate(outputs):
+            writer = stack.enter_context(BagWriter(output.path, compression=output.compression,
+                                                   chunk_size=output.chunk_size))
+            conn_map = register_connections(writer, [bags[x] for x in output.inputs], output.topics)
+            for key, connection in conn_map.items():
+                routes[key].append((index, writer, connection, output.start_time, output.end_time))
+        messages = merge_messages(list(bags.values()), topics, start_time, end_time)
+        if progress:
+            messages = tqdm(messages, desc="Merging Bags", bar_format='{l_bar}{r_bar}')
+        for connection, timestamp, rawdata in messages:
+            for index, writer, out_connection, start, end in routes.get((id(connection.owner), connection.id), ()):
+                if (start is None or timestamp >= start) and (end is None or timestamp < end):
+                    writer.write(out_connection, timestamp, rawdata)
+                    counts[index] += 1
+    return {output.path: count for output, count in zip(outputs, counts)}
+
+
+def run_manifest(manifest_path, output_path='./', input_bags=(), jobs=1, exists_ok=True):
+    """Write every output of a manifest, returns {output path: messages}."""
+    outputs = plan_outputs(load_manifest(manifest_path), output_path, input_bags)
+    for output in outputs:
+        if os.path.exists(output.path):
+            if not exists_ok:
+                raise FileExistsError(f'Output bag {output.path!r} already exists.')
+            os.remove(output.path)
+        os.makedirs(os.path.dirname(output.path) or '.', exist_ok=True)
+    groups = group_jobs(outputs)
+    if jobs <= 1 or len(groups) == 1:
+        results = {}
+        for group in groups:
+            results.update(run_job(group, progress=True))
+        return results
+    results = {}
+    with ProcessPoolExecutor(min(jobs, len(groups))) as pool:
+        futures = [pool.submit(run_job, group) for group in groups]
+        for future in tqdm(as_completed(futures), desc="Merging Jobs", total=len(futures)):
+            results.update(future.result())
+    return results
+
+
+__all__ = [run_manifest.__name__, run_job.__name__, plan_outputs.__name__, OutputSpec.__name__]
@@ -0,0 +1,150 @@
+"""
+
+Persistent catalog of bag index metadata, so planning a merge does not reopen every input bag.
+
+Entries are keyed by the absolute bag path and are refreshed whenever the size or
+modification time of the file changes.
+
+"""
+
+import json
+import os
+import sqlite3
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple
+
+from rosbags.interfaces import Connection, ConnectionExtRosbag1
+from rosbags.rosbag1.reader import ChunkInfo
+
+from .bag_index import IndexReader
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS bags(
+  path TEXT PRIMARY KEY,
+  size INTEGER NOT NULL,
+  mtime_ns INTEGER NOT NULL,
+  start_time INTEGER NOT NULL,
+  end_time INTEGER NOT NULL,
+  message_count INTEGER NOT NULL,
+  connections TEXT NOT NULL,
+  chunk_infos TEXT NOT NULL,
+  index_pos INTEGER NOT NULL
+);
+"""
+# paths looked up per query, sqlite limits the number of bound parameters
+QUERY_BATCH = 500
+
+
+class BagMetadata(NamedTuple):
+    """Index metadata of one bag, shaped like an opened IndexReader for planning purposes."""
+
+    path: str
+    size: int
+    mtime_ns: int
+    start_time: int
+    end_time: int
+    message_count: int
+    connections: list
+    chunk_infos: list
+    # where the index records start, the end of the chunk data
+    index_pos: int
+
+
+def read_metadata(path, size, mtime_ns):
+    """Read the metadata of a bag from its index records."""
+    with IndexReader(path) as bag:
+        return BagMetadata(path, size, mtime_ns, bag.start_time, bag.end_time, bag.message_count,
+                           [x._replace(owner=None) for x in bag.connections], bag.chunk_infos, bag.index_pos)
+
+
+def encode_metadata(meta):
+    connections = [
+        [x.id, x.topic, x.msgtype, x.msgdef, x.digest, x.msgcount, x.ext.callerid, x.ext.latching]
+        for x in meta.connections
+    ]
+    chunk_infos = [[x.pos, x.start_time, x.end_time, list(x.connection_counts.items())] for x in meta.chunk_infos]
+    return (meta.path, meta.size, meta.mtime_ns, meta.start_time, meta.end_time, meta.message_count,
+            json.dumps(connections, separators=(',', ':')), json.dumps(chunk_infos, separators=(',', ':')),
+            meta.index_pos)
+
+
+def decode_metadata(row):
+    path, size, mtime_ns, start_time, end_time, message_count, connections, chunk_infos, index_pos = row
+    connections = [
+        Connection(cid, topic, msgtype, msgdef, digest, msgcount, ConnectionExtRosbag1(callerid, latching), None)
+        for cid, topic, msgtype, msgdef, digest, msgcount, callerid, latching in json.loads(connections)
+    ]
+    chunk_infos = [
+        ChunkInfo(pos, start, end, dict(counts))
+        for pos, start, end, counts in json.loads(chunk_infos)
+    ]
+    return BagMetadata(path, size, mtime_ns, start_time, end_time, message_count, connections, chunk_infos,
+                       index_pos)
+
+
+class Catalog:
+    """SQLite file caching the connections, message counts, time range and chunk layout of bags."""
+
+    def __init__(self, path, workers=8):
+        self.path = path
+        self.workers = workers
+        self.db = sqlite3.connect(path)
+        columns = [row[1] for row in self.db.execute('PRAGMA table_info(bags)')]
+        if columns and 'index_pos' not in columns:
+            # catalogs from before index_pos was kept are rebuilt, they only cache what the bags hold
+            self.db.execute('DROP TABLE bags')
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+    def load(self, paths):
+        """Return {path: BagMetadata}, rereading only bags which are new or changed since they were cataloged."""
+        keys = {path: os.path.abspath(path) for path in paths}
+        # only the rows of the requested bags are read, so a load does not grow with the catalog
+        unique = sorted(set(keys.values()))
+        cached = {}
+        for i in range(0, len(unique), QUERY_BATCH):
+            batch = unique[i:i + QUERY_BATCH]
+            query = f"SELECT * FROM bags WHERE path IN ({', '.join('?' * len(batch))})"
+            for row in self.db.execute(query, batch):
+                cached[row[0]] = row
+        result = {}
+        stale = []
+        for path, key in keys.items():
+            stat = os.stat(path)
+            row = cached.get(key)
+            if row is not None and row[1] == stat.st_size and row[2] == stat.st_mtime_ns:
+                result[path] = decode_metadata(row)._replace(path=path)
+            else:
+                stale.append((path, key, stat))
+        if stale:
+            with ThreadPoolExecutor(self.workers) as pool:
+                metas = list(pool.map(lambda x: read_metadata(x[1], x[2].st_size, x[2].st_mtime_ns), stale))
+            with self.db:
+                self.db.executemany('INSERT OR REPLACE INTO bags VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                    [encode_metadata(meta) for meta in metas])
+            for (path, _, _), meta in zip(stale, metas):
+                result[path] = meta._replace(path=path)
+        return result
+
+    def forget_missing(self):
+        """Drop the entries of bags which no longer exist."""
+        missing = [(row[0],) for row in self.db.execute('SELECT path FROM bags') if not os.path.exists(row[0])]
+        with self.db:
+            self.db.executemany('DELETE FROM bags WHERE path = ?', missing)
+        return len(missing)
+
+    def time_ranges(self, paths):
+        """Return {path: (start_time, end_time)} like bag_index.time_ranges, from the catalog."""
+        return {path: (meta.start_time, meta.end_time) for path, meta in self.load(paths).items()}
+
+
+__all__ = [Catalog.__name__, BagMetadata.__name__, read_metadata.__name__]
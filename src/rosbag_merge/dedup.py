@@ -0,0 +1,65 @@
+"""
+
+Drops messages recorded more than once by overlapping input bags.
+
+A message is a duplicate when another input already gave a message on the same topic
+with the same payload and the same timestamp, or with window set one at most window
+nanoseconds older, for recorders whose clocks stamp the same message slightly apart.
+Repeated payloads within one input are never dropped. Since the merge is chronological
+only the keys of the last window have to be remembered, so memory stays bounded by the
+message rate.
+
+"""
+
+from collections import Counter, deque
+
+
+class Deduplicator:
+    """Filters a chronological message stream, counting the dropped messages per topic."""
+
+    def __init__(self, window=0):
+        self.window = window
+        # (topic, payload length, payload hash) -> {source: timestamp it was last seen at}
+        self.seen = {}
+        # (timestamp, key, source) in the order keys were seen, for expiring them
+        self.order = deque()
+        self.dropped = Counter()
+
+    def is_duplicate(self, topic, timestamp, rawdata, source=None):
+        """Check one message of source (any hashable naming its input) and remember it."""
+        order = self.order
+        seen = self.seen
+        horizon = timestamp - self.window
+        while order and order[0][0] < horizon:
+            old_time, old_key, old_source = order.popleft()
+            sources = seen.get(old_key)
+            if sources is not None and sources.get(old_source) == old_time:
+                del sources[old_source]
+                if not sources:
+                    del seen[old_key]
+        # the builtin hash is a fast non cryptographic digest, stable within one run
+        key = (topic, len(rawdata), hash(rawdata))
+        sources = seen.setdefault(key, {})
+        if any(other != source for other in sources):
+            self.dropped[topic] += 1
+            return True
+        sources[source] = timestamp
+        order.append((timestamp, key, source))
+        return False
+
+    def filter(self, messages):
+        """Yield the messages of a chronological (connection, timestamp, rawdata) stream which are not duplicates.
+
+        Messages count as coming from different inputs when their connections have different owners.
+        """
+        is_duplicate = self.is_duplicate
+        for message in messages:
+            if not is_duplicate(message[0].topic, message[1], message[2], id(message[0].owner)):
+                yield message
+
+    def report(self):
+        """Return {topic: dropped messages}."""
+        return dict(sorted(self.dropped.items()))
+
+
+__all__ = [Deduplicator.__name__]
@@ -0,0 +1,225 @@
+"""
+
+Streams topics of bags into columnar Parquet or Arrow IPC files, one file per topic.
+
+Every message type is flattened once into a column schema; values are appended to
+per topic buffers which are written as record batches, so memory stays bounded by
+the batch size. Requires the optional pyarrow dependency (pip install rosbag_merge[export]).
+
+"""
+
+import os
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from contextlib import ExitStack
+
+from rosbags.serde import deserialize_ros1
+from rosbags.typesys import types
+from rosbags.typesys.base import Nodetype
+
+from .bag_index import IndexReader, count_indexed
+from .bag_stream import read_messages, select_connections
+from .msg_types import base_type_name, column_getters, flatten_columns, register_connection_types
+
+try:
+    import pyarrow as pa
+    import pyarrow.ipc
+    import pyarrow.parquet
+except ImportError:  # pragma: no cover
+    pa = None
+
+EXTENSIONS = {'parquet': '.parquet', 'arrow': '.arrow'}
+# messages between two progress reports of an export
+PROGRESS_STEP = 256
+
+
+def arrow_type(basetype):
+    """Return the arrow type of a ros base type."""
+    return {
+        'bool': pa.bool_(),
+        'byte': pa.uint8(),
+        'char': pa.uint8(),
+        'int8': pa.int8(),
+        'uint8': pa.uint8(),
+        'int16': pa.int16(),
+        'uint16': pa.uint16(),
+        'int32': pa.int32(),
+        'uint32': pa.uint32(),
+        'int64': pa.int64(),
+        'uint64': pa.uint64(),
+        'float32': pa.float32(),
+        'float64': pa.float64(),
+        'string': pa.string(),
+    }[basetype]
+
+
+def field_arrow_type(desc):
+    """Return the arrow type of a field description, messages become structs like message_to_dict builds them."""
+    if desc[0] == Nodetype.BASE:
+        return arrow_type(base_type_name(desc))
+    if desc[0] == Nodetype.NAME:
+        return message_arrow_type(desc[1])
+    return pa.list_(field_arrow_type(desc[1][0]))
+
+
+def message_arrow_type(msgtype):
+    """Return the arrow struct type of a registered message type."""
+    return pa.struct([pa.field(name, field_arrow_type(desc)) for name, desc in types.FIELDDEFS[msgtype][1]])
+
+
+def open_table_writer(path, schema, fmt='parquet'):
+    """Open a Parquet or Arrow IPC file writer accepting record batches of schema."""
+    if fmt == 'parquet':
+        return pyarrow.parquet.ParquetWriter(path, schema)
+    return pyarrow.ipc.new_file(path, schema)
+
+
+def topic_file_name(topic, msgtype=None):
+    """Return the file name stem for a topic, e.g. /gps/fix -> gps__fix."""
+    name = topic.strip('/').replace('/', '__')
+    return f"{name}.{msgtype.replace('/', '_')}" if msgtype else name
+
+
+class TopicWriter:
+    """Buffers the flattened columns of one topic and writes them as record batches."""
+
+    def __init__(self, path, msgtype, fmt='parquet', batch_rows=10000, batch_bytes=16 * (1 << 20)):
+        self.path = path
+        self.fmt = fmt
+        self.batch_rows = batch_rows
+        self.batch_bytes = batch_bytes
+        self.columns = flatten_columns(msgtype)
+        self.getters = column_getters(self.columns)
+        fields = [pa.field('timestamp', pa.int64())]
+        for column in self.columns:
+            if column.kind == 'value':
+                fields.append(pa.field(column.name, arrow_type(column.basetype)))
+            elif column.kind == 'list':
+                fields.append(pa.field(column.name, pa.list_(arrow_type(column.basetype))))
+            else:
+                # typed from the definition, a first batch of empty arrays tells nothing about their items
+                fields.append(pa.field(column.name, pa.list_(message_arrow_type(column.basetype))))
+        self.schema = pa.schema(fields)
+        self.writer = None
+        self.rows = [[] for _ in range(len(self.columns) + 1)]
+        self.buffered = 0
+
+    def append(self, timestamp, message, size):
+        self.rows[0].append(timestamp)
+        for values, getter in zip(self.rows[1:], self.getters):
+            values.append(getter(message))
+        self.buffered += size
+        if len(self.rows[0]) >= self.batch_rows or self.buffered >= self.batch_bytes:
+            self.flush()
+
+    def flush(self):
+        """Write the buffered rows as one record batch."""
+        if not self.rows[0]:
+            return
+        batch = pa.RecordBatch.from_arrays(
+            [pa.array(x, type=field.type) for x, field in zip(self.rows, self.schema)], schema=self.schema)
+        if self.writer is None:
+            self.writer = open_table_writer(self.path, self.schema, self.fmt)
+        self.writer.write_batch(batch)
+        self.rows = [[] for _ in range(len(self.columns) + 1)]
+        self.buffered = 0
+
+    def close(self):
+        self.flush()
+        if self.writer is not None:
+            self.writer.close()
+
+
+def export_topic_group(paths, topics, output_path, fmt='parquet', start_time=None, end_time=None,
+                       batch_rows=10000, on_progress=None):
+    """Export a group of topics in one pass over the bags, returns the written file paths.
+
+    on_progress(messages done, total) is called every few messages. When the export
+    fails or on_progress raises, the files written so far are removed.
+    """
+    connections = []
+    total = 0
+    for path in paths:
+        with IndexReader(path) as bag:
+            connections.extend(select_connections(bag, topics))
+            total += count_indexed([bag], topics, start_time, end_time)
+    register_connection_types(connections)
+    msgtypes = {}
+    for connection in connections:
+        msgtypes.setdefault(connection.topic, set()).add(connection.msgtype)
+
+    writers = {}
+    done = 0
+    try:
+        for connection, timestamp, rawdata in read_messages(paths, topics, start_time, end_time):
+            done += 1
+            if on_progress is not None and done % PROGRESS_STEP == 0:
+                on_progress(done, total)
+            key = (connection.topic, connection.msgtype)
+            writer = writers.get(key)
+            if writer is None:
+                suffix = connection.msgtype if len(msgtypes[connection.topic]) > 1 else None
+                file_path = os.path.join(output_path, topic_file_name(connection.topic, suffix) + EXTENSIONS[fmt])
+                writer = writers[key] = TopicWriter(file_path, connection.msgtype, fmt, batch_rows)
+            writer.append(timestamp, deserialize_ros1(rawdata, connection.msgtype), len(rawdata))
+    except BaseException:
+        for writer in writers.values():
+            writer.close()
+            if os.path.exists(writer.path):
+                os.remove(writer.path)
+        raise
+    for writer in writers.values():
+        writer.close()
+    if on_progress is not None:
+        on_progress(done, total)
+    return [writer.path for writer in writers.values()]
+
+
+def export_topics(paths, output_path, topics=None, fmt='parquet', jobs=1, start_time=None, end_time=None,
+                  batch_rows=10000, on_progress=None):
+    """Export every selected topic of paths into its own columnar file in output_path.
+
+    Topics are spread over jobs processes, each reading only its own topics.
+    Returns the written file paths. on_progress(messages done, total) is called
+    every few messages, with jobs whenever a process finished its topics.
+    """
+    if pa is None:
+        raise ImportError('Exporting topics requires pyarrow, install it with `pip install rosbag_merge[export]`.')
+    if fmt not in EXTENSIONS:
+        raise ValueError(f'Export format {fmt!r} is not supported.')
+    all_topics = set()
+    for path in paths:
+        with IndexReader(path) as bag:
+            all_topics.update(x.topic for x in select_connections(bag, topics))
+    all_topics = sorted(all_topics)
+    if not all_topics:
+        return []
+    jobs = max(min(jobs, len(all_topics)), 1)
+    groups = [all_topics[i::jobs] for i in range(jobs)]
+    if jobs == 1:
+        return export_topic_group(paths, groups[0], output_path, fmt, start_time, end_time, batch_rows, on_progress)
+    with ProcessPoolExecutor(jobs) as pool:
+        futures = {pool.submit(export_topic_group, paths, group, output_path, fmt, start_time, end_time, batch_rows):
+                   group for group in groups}
+        if on_progress is not None:
+            with ExitStack() as stack:
+                bags = [stack.enter_context(IndexReader(path)) for path in paths]
+                totals = {future: count_indexed(bags, group, start_time, end_time) for future, group in futures.items()}
+            done = 0
+            try:
+                for future in as_completed(futures):
+                    done += totals[future]
+                    on_progress(done, sum(totals.values()))
+            except BaseException:
+                # topic groups not started yet are dropped, running ones finish and their files are removed
+                for future in futures:
+                    future.cancel()
+                pool.shutdown()
+                for future in futures:
+                    if not future.cancelled() and future.exception() is None:
+                        for file_path in future.result():
+                            os.remove(file_path)
+                raise
+        return [file_path for future in futures for file_path in future.result()]
+
+
+__all__ = [export_topics.__name__, TopicWriter.__name__]
@@ -0,0 +1,196 @@
+"""
+
+Summarizes a set of input bags from their index records without reading any message data.
+
+Message counts, time spans, rates, gaps and sizes per topic come from the connection
+and chunk info records at the end of every bag, so a summary costs a few reads per
+bag regardless of its size. Time spans and gaps are known to chunk granularity and
+bytes are the on disk chunk bytes shared out by message count. Bags are summarized
+in parallel processes; the connections the merge would have to reconcile are listed
+as conflicts.
+
+"""
+
+import json
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+
+from .bag_index import IndexReader
+from .bag_stream import connection_digest
+
+
+def coalesce(spans, gap):
+    """Merge (start, end) spans into sorted disjoint spans, joining spans less than gap apart."""
+    merged = []
+    for start, end in sorted(spans):
+        if merged and start - merged[-1][1] < gap:
+            merged[-1][1] = max(merged[-1][1], end)
+        else:
+            merged.append([start, end])
+    return merged
+
+
+def summarize_bag(bag, gap):
+    """Summarize one bag from an opened IndexReader or catalog BagMetadata, as plain data."""
+    infos = sorted(bag.chunk_infos, key=lambda x: x.pos)
+    connections = {
+        x.id: {
+            'topic': x.topic, 'msgtype': x.msgtype, 'md5sum': connection_digest(x),
+            'callerid': x.ext.callerid, 'latching': x.ext.latching, 'messages': 0, 'bytes': 0,
+        }
+        for x in bag.connections
+    }
+    spans = defaultdict(list)
+    for i, info in enumerate(infos):
+        # the last chunk ends where the index starts
+        end_pos = infos[i + 1].pos if i + 1 < len(infos) else bag.index_pos
+        size = max(end_pos - info.pos, 0)
+        messages = sum(info.connection_counts.values())
+        for cid, count in info.connection_counts.items():
+            if not count or cid not in connections:
+                continue
+            connection = connections[cid]
+            connection['messages'] += count
+            connection['bytes'] += size * count // messages
+            spans[connection['topic']].append((info.start_time, info.end_time))
+    return {
+        'path': str(bag.path),
+        'start_time': min((x.start_time for x in infos if x.connection_counts), default=None),
+        'end_time': max((x.end_time for x in infos if x.connection_counts), default=None),
+        'chunks': len(infos),
+        'connections': list(connections.values()),
+        'spans': {topic: coalesce(x, gap) for topic, x in spans.items()},
+    }
+
+
+def read_summary(path, gap):
+    with IndexReader(path) as bag:
+        return summarize_bag(bag, gap)
+
+
+def find_conflicts(summaries):
+    """List the topics whose connections differ in message type, definition or latching across inputs.
+
+    Differing caller ids are left out, every recorder has its own and the output
+    simply keeps a connection per caller id.
+    """
+    variants = defaultdict(lambda: defaultdict(set))
+    for summary in summaries:
+        for x in summary['connections']:
+            key = (x['msgtype'], x['md5sum'], x['latching'])
+            variants[x['topic']][key].add(summary['path'])
+    conflicts = []
+    for topic, keys in sorted(variants.items()):
+        if len(keys) < 2:
+            continue
+        if len({x[0] for x in keys}) > 1:
+            kind = 'msgtype'
+        elif len({x[1] for x in keys}) > 1:
+            kind = 'definition'
+        else:
+            kind = 'latching'
+        conflicts.append({
+            'topic': topic,
+            'kind': kind,
+            'variants': [
+                {'msgtype': msgtype, 'md5sum': md5sum, 'latching': latching, 'bags': sorted(paths)}
+                for (msgtype, md5sum, latching), paths in sorted(keys.items(), key=lambda x: str(x[0]))
+            ],
+        })
+    return conflicts
+
+
+def collect_info(paths, jobs=None, gap=1.0, catalog=None, on_progress=None):
+    """Summarize the bags at paths per topic, reading only their indexes.
+
+    gap is the shortest stretch in seconds without messages reported as a gap.
+    With a Catalog, cached metadata is used instead of reading the indexes.
+    on_progress(bags done, total) is called as the bags are summarized.
+    """
+    gap_ns = int(gap * 1e9)
+    summaries = []
+    if catalog is not None:
+        # bags are loaded a few at a time, so uncached bags report progress as they are read
+        step = max(catalog.workers, 1)
+        for i in range(0, len(paths), step):
+            summaries.extend(summarize_bag(meta, gap_ns) for meta in catalog.load(paths[i:i + step]).values())
+            if on_progress is not None:
+                on_progress(len(summaries), len(paths))
+    else:
+        with ProcessPoolExecutor(jobs) as pool:
+            for summary in pool.map(read_summary, paths, [gap_ns] * len(paths)):
+                summaries.append(summary)
+                if on_progress is not None:
+                    on_progress(len(summaries), len(paths))
+
+    topics = {}
+    spans = defaultdict(list)
+    for summary in summaries:
+        for x in summary['connections']:
+            topic = topics.setdefault(x['topic'], {'msgtypes': set(), 'messages': 0, 'bytes': 0, 'connections': 0})
+            topic['msgtypes'].add(x['msgtype'])
+            topic['messages'] += x['messages']
+            topic['bytes'] += x['bytes']
+            topic['connections'] += 1
+        for topic, topic_spans in summary['spans'].items():
+            spans[topic].extend(topic_spans)
+
+    for name, topic in topics.items():
+        merged = coalesce(spans[name], gap_ns)
+        start, end = (merged[0][0], merged[-1][1]) if merged else (None, None)
+        duration = (end - start) / 1e9 if merged else 0.0
+        topic.update({
+            'msgtypes': sorted(topic['msgtypes']),
+            'start_time': start,
+            'end_time': end,
+            'rate_hz': round(topic['messages'] / duration, 3) if duration and topic['messages'] > 1 else None,
+            'gaps': [[a[1], b[0]] for a, b in zip(merged, merged[1:])],
+        })
+    starts = [x['start_time'] for x in summaries if x['start_time'] is not None]
+    ends = [x['end_time'] for x in summaries if x['end_time'] is not None]
+    coverage = coalesce([span for x in spans.values() for span in x], gap_ns)
+    return {
+        'bags': len(summaries),
+        'chunks': sum(x['chunks'] for x in summaries),
+        'messages': sum(x['messages'] for x in topics.values()),
+        'bytes': sum(x['bytes'] for x in topics.values()),
+        'start_time': min(starts, default=None),
+        'end_time': max(ends, default=None),
+        'gaps': [[a[1], b[0]] for a, b in zip(coverage, coverage[1:])],
+        'topics': dict(sorted(topics.items())),
+        'conflicts': find_conflicts(summaries),
+    }
+
+
+def format_info(info):
+    """Render collect_info output as a text report."""
+    duration = (info['end_time'] - info['start_time']) / 1e9 if info['start_time'] is not None else 0.0
+    lines = [f"{info['bags']} bags, {info['chunks']} chunks, {info['messages']} messages, "
+             f"{info['bytes'] / (1 << 20):.1f} MiB, {duration:.1f}s"]
+    if info['start_time'] is not None:
+        lines.append(f"start {info['start_time'] / 1e9:.3f}, end {info['end_time'] / 1e9:.3f}")
+    width = max([len(x) for x in info['topics']] + [5])
+    lines.append(f"{'topic':<{width}}  {'messages':>9}  {'rate Hz':>9}  {'MiB':>9}  type")
+    for name, topic in info['topics'].items():
+        rate = f"{topic['rate_hz']:.2f}" if topic['rate_hz'] is not None else '-'
+        lines.append(f"{name:<{width}}  {topic['messages']:>9}  {rate:>9}  {topic['bytes'] / (1 << 20):>9.2f}  "
+                     + ', '.join(topic['msgtypes']))
+    for start, end in info['gaps']:
+        lines.append(f"gap in all inputs: {(end - start) / 1e9:.1f}s from {start / 1e9:.3f}")
+    for name, topic in info['topics'].items():
+        for start, end in topic['gaps']:
+            lines.append(f"gap in {name}: {(end - start) / 1e9:.1f}s from {start / 1e9:.3f}")
+    for conflict in info['conflicts']:
+        variants = '; '.join(
+            f"{x['msgtype']} {x['md5sum']} latching={x['latching']} in {len(x['bags'])} bags"
+            for x in conflict['variants'])
+        lines.append(f"conflict ({conflict['kind']}) on {conflict['topic']}: {variants}")
+    return '\n'.join(lines)
+
+
+def write_json(info, path):
+    with open(path, 'w') as f:
+        json.dump(info, f, indent=2)
+
+
+__all__ = [collect_info.__name__, format_info.__name__, summarize_bag.__name__, find_conflicts.__name__]
@@ -6,7 +6,8 @@ import sys
 
 from icecream import ic
 
-from . import bag_stream
+from . import bag_append, bag_index, bag_stream, batch, info, pipeline, reindex
+from .catalog import Catalog
 
 ic.configureOutput(includeContext=True)
 
@@ -31,8 +32,9 @@ def refine_args(args: argparse.Namespace) -> argparse.Namespace:
     # input files into the respective args Namespace
     if len(args.input_paths):
         for path in args.input_paths:
-            for f in os.listdir(path):
-                full_file_path = os.path.join(path, f)
+            for entry in os.scandir(path):
+                f = entry.name
+                full_file_path = entry.path
                 if (f.endswith(".csv")):
                     if "input_csvs" not in args:
                         args.input_csvs = []
@@ -41,11 +43,17 @@ def refine_args(args: argparse.Namespace) -> argparse.Namespace:
                     if "input_bags" not in args:
                         args.input_bags = []
                     args.input_bags.append(full_file_path)
+    # bags without a readable index are replaced by reindexed copies before anything reads them
+    if getattr(args, 'reindex', False) and getattr(args, 'input_bags', None):
+        output_dir = os.path.join(args.output_path, reindex.REINDEX_DIR) if args.output_path else None
+        jobs = getattr(args, 'jobs', 1)
+        args.input_bags = reindex.reindex_bags(args.input_bags, output_dir, jobs=jobs if jobs > 1 else None)
     # TODO, if outpath, then join outpath with out file paths, must also do with the csv writer
     no_outbag_actions = (not args.outbag_name) and (args.write_bag)
     if (no_outbag_actions):
         ic("Writing bags requires an outbag suffix.")
-    no_input_files = (("input_bags" not in args) or (not len(args.input_bags)))
+    # a manifest may name its own inputs
+    no_input_files = (("input_bags" not in args) or (not len(args.input_bags))) and not getattr(args, 'manifest', None)
     args.write_bag = True if args.output_path and args.outbag_name else False
     requesting_write_without_output_path = not args.output_path and (
         args.merge_csvs or args.write_csvs or args.write_bag)
@@ -62,6 +70,19 @@ def refine_args(args: argparse.Namespace) -> argparse.Namespace:
     return retval
 
 
+def resolve_times(args: argparse.Namespace, metadata: dict = None) -> 'tuple[int, int]':
+    # Resolve the time window options, reading only the bag indexes (or the catalog metadata) when a relative time is given
+    values = [getattr(args, 'start', None), getattr(args, 'end', None)]
+    first_time = None
+    if any(x is not None and x.startswith('+') for x in values):
+        if metadata is not None:
+            ranges = {path: (meta.start_time, meta.end_time) for path, meta in metadata.items()}
+        else:
+            ranges = bag_index.time_ranges(args.input_bags)
+        first_time = min(start for start, _ in ranges.values())
+    return tuple(bag_index.resolve_time(x, first_time) for x in values)
+
+
 def create_parser() -> argparse.ArgumentParser:
     # Creates the appropriate argument parser (separated out to enable printing helps, etc.)
     # create an argument parser to read arguments from the command line
@@ -105,12 +126,200 @@ def create_parser() -> argparse.ArgumentParser:
                         default=None,
                         required=False,
                         )
+    parser.add_argument('--topic-pattern', '-tp',
+                        type=str,
+                        nargs='+',
+                        help='Glob patterns (or regular expressions prefixed with "re:") of topics to include, e.g. "/camera/*".',
+                        default=None,
+                        )
+    parser.add_argument('--type',
+                        type=str,
+                        nargs='+',
+                        help='Only include topics whose message type matches one of these glob patterns, e.g. "sensor_msgs/msg/*".',
+                        default=None,
+                        )
+    parser.add_argument('--throttle',
+                        type=str,
+                        nargs='+',
+                        help='Keep at most HZ messages per second of the topics matching TOPIC_PATTERN, e.g. "/imu=100".',
+                        default=None,
+                        )
+    parser.add_argument('--decimate',
+                        type=str,
+                        nargs='+',
+                        help='Keep every Nth message of the topics matching TOPIC_PATTERN, e.g. "/camera/*=10".',
+                        default=None,
+                        )
+    parser.add_argument('--transform',
+                        type=str,
+                        nargs='+',
+                        help='module:function called as function(connection, timestamp, rawdata) for every merged message, returning (timestamp, rawdata) or None to drop it.',
+                        default=None,
+                        )
     parser.add_argument('--exists-ok', '-eo',
                         type=bool,
                         help='A true value will remove the file and prevent rosbags exception if the file exists.',
                         default=True,
                         required=False,
                         )
+    parser.add_argument('--start',
+                        type=str,
+                        help='Only merge messages at or after this time. Unix seconds, or "+SECONDS" relative to the first input message.',
+                        default=None,
+                        )
+    parser.add_argument('--end',
+                        type=str,
+                        help='Only merge messages before this time. Unix seconds, or "+SECONDS" relative to the first input message.',
+                        default=None,
+                        )
+    parser.add_argument('--export',
+                        type=str,
+                        choices=['parquet', 'arrow'],
+                        help='Export every selected topic into its own Parquet or Arrow IPC file in the output path.',
+                        default=None,
+                        )
+    parser.add_argument('--align',
+                        type=str,
+                        nargs='+',
+                        help='Write a table of these TOPIC or TOPIC:FIELD values sampled as of a common time grid, e.g. /imu:angular_velocity.z.',
+                        default=None,
+                        )
+    parser.add_argument('--align-rate',
+                        type=float,
+                        help='Rate in Hz of the --align time grid.',
+                        default=10.0,
+                        )
+    parser.add_argument('--align-tolerance',
+                        type=float,
+                        help='Leave --align values older than this many seconds empty instead of carrying them forward.',
+                        default=None,
+                        )
+    parser.add_argument('--align-format',
+                        type=str,
+                        choices=['parquet', 'arrow'],
+                        help='File format of the --align table.',
+                        default='parquet',
+                        )
+    parser.add_argument('--align-name',
+                        type=str,
+                        help='File name of the --align table in the output path, without extension.',
+                        default='aligned',
+                        )
+    parser.add_argument('--info',
+                        action='store_true',
+                        help='Print per topic counts, rates, gaps, sizes and connection conflicts of the input bags, read from their indexes only, instead of merging.',
+                        )
+    parser.add_argument('--info-json',
+                        type=str,
+                        help='Also write the --info summary to this JSON file.',
+                        default=None,
+                        )
+    parser.add_argument('--info-gap',
+                        type=float,
+                        help='Shortest stretch in seconds without messages that --info reports as a gap.',
+                        default=1.0,
+                        )
+    parser.add_argument('--manifest',
+                        type=str,
+                        help='JSON or YAML file listing several output bags, each with its own inputs, topics, time window and compression. Shared inputs are read once.',
+                        default=None,
+                        )
+    parser.add_argument('--serve',
+                        type=str,
+                        help='Run as a service accepting merge, export and info jobs as JSON, on HOST:PORT over HTTP or on the path of a UNIX socket, instead of merging.',
+                        default=None,
+                        )
+    parser.add_argument('--serve-workers',
+                        type=int,
+                        help='Number of worker processes of --serve, each running one job at a time. Defaults to the number of CPUs.',
+                        default=None,
+                        )
+    parser.add_argument('--catalog',
+                        type=str,
+                        help='SQLite file caching the index metadata of input bags across runs. Created when missing.',
+                        default=None,
+                        )
+    parser.add_argument('--output-format', '-of',
+                        type=str,
+                        choices=['bag', 'mcap', 'rosbag2'],
+                        help='Write the merge as a rosbag1 file, an indexed MCAP file (ROS1 encoded) or a rosbag2 bag directory (CDR encoded).',
+                        default='bag',
+                        )
+    parser.add_argument('--compression', '-c',
+                        type=str,
+                        choices=['none', 'bz2', 'lz4', 'zstd'],
+                        help='Compression of the chunks written to the output bag. bag supports none, bz2 and lz4 (default none), mcap none, lz4 and zstd (default zstd), rosbag2 none and zstd (default none).',
+                        default=None,
+                        )
+    parser.add_argument('--chunk-size',
+                        type=int,
+                        help='Uncompressed size in bytes after which an output chunk is sealed.',
+                        default=None,
+                        )
+    parser.add_argument('--compression-workers', '-cw',
+                        type=int,
+                        help='Number of processes compressing sealed output chunks. 0 compresses on the merging thread.',
+                        default=0,
+                        )
+    parser.add_argument('--jobs', '-j',
+                        type=int,
+                        help='Number of processes merging separate time windows of the inputs in parallel.',
+                        default=1,
+                        )
+    parser.add_argument('--prefetch-mb',
+                        type=int,
+                        help='Read every input bag on its own thread, buffering at most this many MiB of messages in total. 0 disables prefetching.',
+                        default=0,
+                        )
+    parser.add_argument('--no-mmap',
+                        action='store_true',
+                        help='Read input bags through file reads instead of memory mapping them.',
+                        )
+    parser.add_argument('--split-size',
+                        type=float,
+                        help='Roll over to a new output bag <outbag_name>_NNNN.bag after this many MiB.',
+                        default=None,
+                        )
+    parser.add_argument('--split-duration',
+                        type=float,
+                        help='Roll over to a new output bag <outbag_name>_NNNN.bag after this many seconds of data.',
+                        default=None,
+                        )
+    parser.add_argument('--stats-json',
+                        type=str,
+                        help='Write the time spent setting up, reading, merging, writing and closing, per input and per topic counts and peak memory of the merge to this JSON file.',
+                        default=None,
+                        )
+    parser.add_argument('--profile',
+                        type=str,
+                        help='Run the merge loop under cProfile and dump the stats to this file (and a cumulative time listing to <file>.txt).',
+                        default=None,
+                        )
+    parser.add_argument('--dedup',
+                        action='store_true',
+                        help='Drop messages which an overlapping input already recorded with the same topic, timestamp and payload.',
+                        )
+    parser.add_argument('--dedup-window',
+                        type=float,
+                        help='With --dedup, also drop identical messages of different inputs whose timestamps are up to this many seconds apart, for recorders with skewed clocks (disables chunk passthrough).',
+                        default=0.0,
+                        )
+    parser.add_argument('--append',
+                        action='store_true',
+                        help='Only merge inputs the output bag does not hold yet (tracked in <outbag_name>.bag.inputs.json), appending them or re-merging just the time range they overlap.',
+                        )
+    parser.add_argument('--validate-order',
+                        action='store_true',
+                        help='Check that every merged message is at least as new as the one before it.',
+                        )
+    parser.add_argument('--reindex',
+                        action='store_true',
+                        help='Recover input bags without a readable index (unfinished recordings, partial copies) into indexed copies in <output_path>/.reindexed and merge those.',
+                        )
+    parser.add_argument('--no-passthrough',
+                        action='store_true',
+                        help='Merge every message instead of copying chunks that do not interleave with other inputs.',
+                        )
     return parser
 
 
@@ -123,12 +332,88 @@ def parse_args(args) -> argparse.Namespace:
 def main(args: argparse.Namespace = None):
     if not args:
         args = parse_args(sys.argv[1:])
+    # a service takes its inputs from the jobs it is sent
+    if getattr(args, 'serve', None):
+        # the service, export and align modules pull in asyncio, multiprocessing, pyarrow and numpy,
+        # they are only imported by the runs using them so every other run starts quicker
+        from . import service
+        service.main(args.serve, workers=getattr(args, 'serve_workers', None), catalog_path=getattr(args, 'catalog', None))
+        return
     # Refine arguments here so simplified args can be used.
     args = refine_args(args)
     if args is None:
         return  # Invalid arguments, return
-    bag_stream.main(input_bags=args.input_bags, output_path=args.output_path, outbag_name=args.outbag_name, topics=args.topics, exists_ok=args.exists_ok
-                    )
+    if getattr(args, 'manifest', None):
+        batch.run_manifest(args.manifest, output_path=args.output_path, input_bags=getattr(args, 'input_bags', []),
+                           jobs=getattr(args, 'jobs', 1), exists_ok=args.exists_ok)
+        print("Done.")
+        return
+    if getattr(args, 'info', False) or getattr(args, 'info_json', None):
+        catalog = Catalog(args.catalog) if getattr(args, 'catalog', None) else None
+        jobs = getattr(args, 'jobs', 1)
+        summary = info.collect_info(args.input_bags, jobs=jobs if jobs > 1 else None,
+                                    gap=getattr(args, 'info_gap', 1.0), catalog=catalog)
+        print(info.format_info(summary))
+        if getattr(args, 'info_json', None):
+            info.write_json(summary, args.info_json)
+        if catalog:
+            catalog.close()
+        return
+    # topic patterns and type filters become a plain topic list read from the bag indexes
+    args.topics = pipeline.resolve_topics(args.input_bags, args.topics, getattr(args, 'topic_pattern', None),
+                                          getattr(args, 'type', None))
+    catalog = Catalog(args.catalog) if getattr(args, 'catalog', None) else None
+    # the catalog is read once per run, the time window and the merge plan share it
+    metadata = catalog.load(args.input_bags) if catalog else None
+    start_time, end_time = resolve_times(args, metadata)
+    if getattr(args, 'export', None):
+        from . import export
+        export.export_topics(bag_index.prune_bags(args.input_bags, start_time, end_time), args.output_path, topics=args.topics,
+                      fmt=args.export, jobs=getattr(args, 'jobs', 1), start_time=start_time, end_time=end_time)
+    if getattr(args, 'align', None):
+        from . import align, export
+        align_format = getattr(args, 'align_format', 'parquet')
+        tolerance = getattr(args, 'align_tolerance', None)
+        align.align_topics(bag_index.prune_bags(args.input_bags, start_time, end_time),
+                           os.path.join(args.output_path, getattr(args, 'align_name', 'aligned') + export.EXTENSIONS[align_format]),
+                           args.align, rate=getattr(args, 'align_rate', 10.0), start_time=start_time, end_time=end_time,
+                           tolerance=int(tolerance * 1e9) if tolerance is not None else None, fmt=align_format)
+    if args.outbag_name and getattr(args, 'append', False):
+        if start_time is not None or end_time is not None or getattr(args, 'split_size', None) or getattr(args, 'split_duration', None):
+            raise ValueError('--append merges whole inputs into one bag, it cannot be combined with --start/--end or --split-*.')
+        bag_append.main(input_bags=args.input_bags, topics=args.topics, output_path=args.output_path, outbag_name=args.outbag_name,
+                        passthrough=not getattr(args, 'no_passthrough', False),
+                        compression=getattr(args, 'compression', None) or 'none',
+                        chunk_size=getattr(args, 'chunk_size', None),
+                        prefetch_mb=getattr(args, 'prefetch_mb', 0),
+                        )
+    elif args.outbag_name:
+        bag_stream.main(input_bags=args.input_bags, output_path=args.output_path, outbag_name=args.outbag_name, topics=args.topics, exists_ok=args.exists_ok,
+                        passthrough=not getattr(args, 'no_passthrough', False),
+                        compression=getattr(args, 'compression', None),
+                        chunk_size=getattr(args, 'chunk_size', None),
+                        compression_workers=getattr(args, 'compression_workers', 0),
+                        prefetch_mb=getattr(args, 'prefetch_mb', 0),
+                        jobs=getattr(args, 'jobs', 1),
+                        start_time=start_time,
+                        end_time=end_time,
+                        catalog=catalog,
+                        metadata=metadata,
+                        split_size=getattr(args, 'split_size', None),
+                        split_duration=getattr(args, 'split_duration', None),
+                        stats_json=getattr(args, 'stats_json', None),
+                        profile_path=getattr(args, 'profile', None),
+                        dedup=getattr(args, 'dedup', False),
+                        dedup_window=getattr(args, 'dedup_window', 0.0),
+                        output_format=getattr(args, 'output_format', 'bag'),
+                        mapped=not getattr(args, 'no_mmap', False),
+                        validate=getattr(args, 'validate_order', False),
+                        pipeline=pipeline.build_pipeline(throttle=getattr(args, 'throttle', None),
+                                                         decimate=getattr(args, 'decimate', None),
+                                                         transforms=getattr(args, 'transform', None)),
+                        )
+    if catalog:
+        catalog.close()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,138 @@
+"""
+
+Reads rosbag1 messages as memoryview slices of a memory mapped input bag.
+
+The rosbags reader copies every chunk it visits into a new bytes object and then
+copies every message out of it once more. Mapping the bag instead lets messages of
+uncompressed chunks be handed on as slices of the mapping, so their data is not
+copied until the writer puts it into its output chunk. Compressed chunks are
+decompressed once and their messages are slices of the decompressed data. Pages of
+chunks the reader moved past are given back, so mapped inputs do not add up in the
+resident set. Read ahead on a prefetch thread, the pages of every chunk are faulted
+in on that thread and given back only once the consumer is done with the chunk.
+
+"""
+
+import heapq
+import mmap
+from collections import deque
+
+from rosbags.rosbag1 import Reader, ReaderError
+from rosbags.rosbag1.reader import RecordType
+
+from .bag_chunks import DECOMPRESSORS, unpack_uint32
+
+# the decompressor of uncompressed chunks passes data through and is skipped
+COMPRESSED = (DECOMPRESSORS['bz2'], DECOMPRESSORS['lz4'])
+
+
+def parse_record_header(data, pos):
+    """Return (op, conn, position after the header) of the record header at pos of a chunk."""
+    end = pos + 4 + unpack_uint32(data, pos)[0]
+    pos += 4
+    op = conn = None
+    while pos < end:
+        size = unpack_uint32(data, pos)[0]
+        pos += 4
+        # fields may come in any order, only op and conn are needed
+        if size == 4 and data[pos:pos + 3] == b'op=':
+            op = data[pos + 3]
+        elif size == 9 and data[pos:pos + 5] == b'conn=':
+            conn = unpack_uint32(data, pos + 5)[0]
+        pos += size
+    return op, conn, end
+
+
+class MappedReader(Reader):
+    """Rosbag1 reader yielding message data as read-only memoryviews instead of bytes.
+
+    The views stay valid after the bag is closed, the mapping is only unmapped once
+    the last of them is gone.
+    """
+
+    def __init__(self, path):
+        super().__init__(path)
+        self.map = None
+        self.view = None
+        # set by a prefetching consumer, pages are then faulted in here and kept until release_pages
+        self.hold_pages = False
+        # chunks moved past while holding pages, and how many there have been in total
+        self.held = deque()
+        self.held_total = 0
+
+    def open(self):
+        super().open()
+        self.map = mmap.mmap(self.bio.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.map)
+        if hasattr(self.map, 'madvise'):
+            self.map.madvise(mmap.MADV_SEQUENTIAL)
+
+    def drop_pages(self, chunk):
+        """Drop the pages of a chunk from the resident set, they are read again from the file when touched."""
+        if hasattr(self.map, 'madvise'):
+            start = chunk.datapos - chunk.datapos % mmap.PAGESIZE
+            self.map.madvise(mmap.MADV_DONTNEED, start, chunk.datapos + chunk.datasize - start)
+
+    def release_pages(self, held_total):
+        """Drop the pages of the held chunks up to the held_total-th, the consumer is done with them."""
+        while self.held and self.held_total - len(self.held) < held_total:
+            self.drop_pages(self.held.popleft())
+
+    def close(self):
+        # Reader.open closes the bag itself when it fails, before anything was mapped
+        if self.map is not None:
+            self.view.release()
+            self.view = None
+            try:
+                self.map.close()
+            except BufferError:
+                # messages still referencing the mapping keep it alive until they are collected
+                pass
+            self.map = None
+        super().close()
+
+    def messages(self, connections=(), start=None, stop=None):
+        """Read messages from bag like Reader.messages, with memoryview message data."""
+        if not self.bio:
+            raise ReaderError('Rosbag is not open.')
+        if not connections:
+            connections = self.connections
+        connmap = {x.id: x for x in self.connections}
+
+        chunk = None
+        chunk_pos = -1
+        data = None
+        for entry in heapq.merge(*[self.indexes[x.id] for x in connections]):
+            if start and entry.time < start:
+                continue
+            if stop and entry.time >= stop:
+                return
+            if entry.chunk_pos != chunk_pos:
+                if chunk is not None and self.hold_pages:
+                    self.held.append(chunk)
+                    self.held_total += 1
+                elif chunk is not None:
+                    self.drop_pages(chunk)
+                chunk_pos = entry.chunk_pos
+                chunk = self.chunks[chunk_pos]
+                data = self.view[chunk.datapos:chunk.datapos + chunk.datasize]
+                if chunk.decompressor in COMPRESSED:
+                    data = memoryview(chunk.decompressor(data))
+                elif self.hold_pages:
+                    # reading a byte of every page does the file reads here instead of on the consumer
+                    bytes(data[::mmap.PAGESIZE])
+
+            pos = entry.offset
+            while True:
+                op, conn, pos = parse_record_header(data, pos)
+                size = unpack_uint32(data, pos)[0]
+                pos += 4
+                if op != RecordType.CONNECTION:
+                    break
+                pos += size
+            if op != RecordType.MSGDATA:
+                raise ReaderError('Expected to find message data.')
+            yield connmap[conn], entry.time, data[pos:pos + size]
+
+
+__all__ = [MappedReader.__name__]
@@ -0,0 +1,108 @@
+"""
+
+Merges the time ordered message streams of several inputs batch by batch.
+
+Every input is read in batches of (connection, timestamp, rawdata) messages. All
+messages older than the end of the batch ending first are merged at once: each
+input contributes one slice found by bisection and the slices are merged by a
+stable sort, which runs in C and merges presorted runs in linear time. A window
+holding a single slice is passed on without comparisons, the last active input
+is passed on as it is and inputs which do not overlap in time at all are
+concatenated.
+
+"""
+
+from bisect import bisect_left, bisect_right
+from itertools import chain, islice
+from operator import itemgetter
+
+BATCH_SIZE = 1024
+
+
+def batched(messages, size=BATCH_SIZE):
+    """Group a message iterator into lists of at most size messages."""
+    messages = iter(messages)
+    return iter(lambda: list(islice(messages, size)), [])
+
+
+def disjoint_order(ranges):
+    """Return the order in which inputs with (first, last) timestamps can be concatenated, None when they overlap.
+
+    Equal timestamps at a boundary are fine as long as the earlier input comes first,
+    like heapq.merge orders them.
+    """
+    order = sorted(range(len(ranges)), key=lambda i: (ranges[i][0], i))
+    for a, b in zip(order, order[1:]):
+        if ranges[a][1] > ranges[b][0] or (ranges[a][1] == ranges[b][0] and a > b):
+            return None
+    return order
+
+
+def merge_batches(sources, ranges=None):
+    """Merge sources, iterators of time ordered message batches, into time ordered batches.
+
+    Messages with equal timestamps keep the order of their sources, like heapq.merge.
+    With ranges, the (first, last) timestamp of every source, sources which do not
+    overlap are concatenated without looking at their messages.
+    """
+    sources = [iter(x) for x in sources]
+    if ranges is not None:
+        order = disjoint_order(ranges)
+        if order is not None:
+            for i in order:
+                yield from sources[i]
+            return
+
+    # source -> [batch, timestamps of batch, position of the first message not passed on yet], in source order
+    heads = {}
+
+    def advance(i):
+        for batch in sources[i]:
+            if batch:
+                heads[i] = [batch, [x[1] for x in batch], 0]
+                return
+        heads.pop(i, None)
+
+    for i in range(len(sources)):
+        advance(i)
+    while len(heads) > 1:
+        # no input has messages older than the end of the batch ending first left to read
+        boundary = min(head[1][-1] for head in heads.values())
+        parts = []
+        for i, head in list(heads.items()):
+            batch, times, pos = head
+            cut = bisect_left(times, boundary, pos)
+            if cut > pos:
+                parts.append(batch if pos == 0 and cut == len(batch) else batch[pos:cut])
+                head[2] = cut
+                if cut == len(batch):
+                    advance(i)
+        if not parts:
+            # every input is at the boundary, the first of them passes on its messages at it
+            i, (batch, times, pos) = next((i, x) for i, x in heads.items() if x[1][x[2]] == boundary)
+            cut = bisect_right(times, boundary, pos)
+            parts.append(batch[pos:cut])
+            heads[i][2] = cut
+            if cut == len(batch):
+                advance(i)
+        # runs of one input need no comparisons, interleaving runs are merged by a stable sort in C,
+        # which keeps equal timestamps in source order
+        yield parts[0] if len(parts) == 1 else sorted(chain.from_iterable(parts), key=itemgetter(1))
+    for i, (batch, _, pos) in heads.items():
+        # the last active input needs no comparisons
+        yield batch[pos:] if pos else batch
+        yield from sources[i]
+
+
+def validated(batches):
+    """Pass batches on, raising ValueError when a message is older than the message before it."""
+    previous = 0
+    for batch in batches:
+        for _, timestamp, _ in batch:
+            if timestamp < previous:
+                raise ValueError(f'Merged messages are out of order: {timestamp} follows {previous}.')
+            previous = timestamp
+        yield batch
+
+
+__all__ = [merge_batches.__name__, batched.__name__, validated.__name__, disjoint_order.__name__]
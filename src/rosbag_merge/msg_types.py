@@ -0,0 +1,91 @@
+"""
+
+Helps turn the message definitions stored in bags into rosbags types and flat column schemas.
+
+"""
+
+from operator import attrgetter
+from typing import NamedTuple
+
+from rosbags.typesys import TypesysError, get_types_from_msg, register_types, types
+from rosbags.typesys.base import Nodetype
+
+
+class Column(NamedTuple):
+    """One flattened field of a message type."""
+
+    # dotted field path, e.g. 'header.stamp.sec'
+    name: str
+    # 'value' for base types, 'list' for arrays of base types, 'messages' for arrays of messages
+    kind: str
+    # ros base type of value and list columns, message type of messages columns
+    basetype: str
+
+
+def register_connection_types(connections):
+    """Register the message types of connections with the rosbags type system.
+
+    Types shipped with rosbags take precedence over a differing definition in a bag.
+    """
+    for connection in connections:
+        if connection.msgtype in types.FIELDDEFS:
+            continue
+        try:
+            register_types(get_types_from_msg(connection.msgdef, connection.msgtype))
+        except TypesysError:
+            # one of the dependencies is known with a different definition
+            pass
+
+
+def base_type_name(desc):
+    """Return the ros base type of a base type field description (bounded strings are strings)."""
+    return desc[1] if isinstance(desc[1], str) else 'string'
+
+
+def flatten_columns(msgtype, prefix=''):
+    """Flatten a registered message type into columns, nested messages become dotted names."""
+    columns = []
+    for name, desc in types.FIELDDEFS[msgtype][1]:
+        path = prefix + name
+        if desc[0] == Nodetype.BASE:
+            columns.append(Column(path, 'value', base_type_name(desc)))
+        elif desc[0] == Nodetype.NAME:
+            columns.extend(flatten_columns(desc[1], path + '.'))
+        else:
+            subdesc = desc[1][0]
+            if subdesc[0] == Nodetype.BASE:
+                columns.append(Column(path, 'list', base_type_name(subdesc)))
+            else:
+                columns.append(Column(path, 'messages', subdesc[1]))
+    return columns
+
+
+def message_to_dict(message):
+    """Convert a deserialized message into nested dicts and lists."""
+    result = {}
+    for name, desc in types.FIELDDEFS[message.__msgtype__][1]:
+        value = getattr(message, name)
+        if desc[0] == Nodetype.NAME:
+            value = message_to_dict(value)
+        elif desc[0] in (Nodetype.ARRAY, Nodetype.SEQUENCE):
+            value = [message_to_dict(x) for x in value] if desc[1][0][0] == Nodetype.NAME else list(value)
+        result[name] = value
+    return result
+
+
+def column_getters(columns):
+    """Return one callable per column extracting its value from a deserialized message."""
+    getters = []
+    for column in columns:
+        getter = attrgetter(column.name)
+        if column.kind == 'list':
+            getters.append(lambda msg, getter=getter: list(getter(msg)))
+        elif column.kind == 'messages':
+            getters.append(lambda msg, getter=getter: [message_to_dict(x) for x in getter(msg)])
+        else:
+            getters.append(getter)
+    return getters
+
+
+__all__ = [Column.__name__, register_connection_types.__name__, flatten_columns.__name__,
+           message_to_dict.__name__, column_getters.__name__]
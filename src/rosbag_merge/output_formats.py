@@ -0,0 +1,176 @@
+"""
+
+Writes the merged message stream into MCAP or rosbag2 instead of a rosbag1 file.
+
+Both formats keep per chunk (MCAP) or per message (rosbag2 sqlite) indexes plus a
+summary which readers load without scanning the file, so large merged outputs can be
+opened and seeked by time and topic cheaply. MCAP keeps the ROS1 serialization and
+message definitions as they are and requires the optional mcap dependency
+(pip install rosbag_merge[mcap]). rosbag2 converts every message to CDR.
+
+"""
+
+import os
+
+from rosbags.convert.converter import LATCH
+from rosbags.interfaces import Connection, ConnectionExtRosbag1
+from rosbags.rosbag2 import Writer as Rosbag2Writer, WriterError
+from rosbags.serde import ros1_to_cdr
+from rosbags.typesys.msg import denormalize_msgtype, normalize_msgtype
+
+from .msg_types import register_connection_types
+
+try:
+    from mcap.writer import CompressionType, Writer as McapWriter
+except ImportError:  # pragma: no cover
+    McapWriter = None
+
+EXTENSIONS = {'bag': '.bag', 'mcap': '.mcap', 'rosbag2': ''}
+# compression used when none is picked, MCAP readers expect zstd chunks
+DEFAULT_COMPRESSION = {'bag': 'none', 'mcap': 'zstd', 'rosbag2': 'none'}
+
+
+class FormatWriter:
+    """Offers the part of the rosbag1 Writer interface the merge uses on top of another format.
+
+    Connections are handed out like rosbag1 connections, so register_connections and
+    the merge loop work unchanged.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.connections = []
+
+    def add_connection(self, topic, msgtype, msgdef=None, md5sum=None, callerid=None, latching=None):
+        connection = Connection(len(self.connections), topic, normalize_msgtype(msgtype), msgdef, md5sum, -1,
+                                ConnectionExtRosbag1(callerid, latching), self)
+        self.connections.append(connection)
+        return connection
+
+    def __enter__(self):
+        self.open()
+        return self
+
+    def __exit__(self, exc_type, exc_val, exc_tb):
+        self.close()
+        return False
+
+
+class McapBagWriter(FormatWriter):
+    """Writes ROS1 encoded messages into a chunked and indexed MCAP file."""
+
+    def __init__(self, path, compression='zstd', chunk_size=None):
+        if McapWriter is None:
+            raise ImportError('Writing MCAP requires mcap, install it with `pip install rosbag_merge[mcap]`.')
+        if compression not in ('none', 'lz4', 'zstd'):
+            raise WriterError(f'Compression {compression!r} is not supported for MCAP.')
+        super().__init__(path)
+        self.compression = {'none': CompressionType.NONE, 'lz4': CompressionType.LZ4,
+                            'zstd': CompressionType.ZSTD}[compression]
+        self.chunk_size = chunk_size or 1 << 20
+        self.file = None
+        self.writer = None
+        self.schemas = {}
+        self.channels = []
+        self.sequence = 0
+
+    def open(self):
+        self.file = open(self.path, 'xb')  # pylint: disable=consider-using-with
+        self.writer = McapWriter(self.file, chunk_size=self.chunk_size, compression=self.compression)
+        self.writer.start(profile='ros1', library='rosbag_merge')
+
+    def add_connection(self, topic, msgtype, msgdef=None, md5sum=None, callerid=None, latching=None):
+        connection = super().add_connection(topic, msgtype, msgdef, md5sum, callerid, latching)
+        schema = (connection.msgtype, msgdef)
+        if schema not in self.schemas:
+            self.schemas[schema] = self.writer.register_schema(
+                name=denormalize_msgtype(connection.msgtype), encoding='ros1msg', data=(msgdef or '').encode())
+        metadata = {'md5sum': md5sum or ''}
+        if callerid is not None:
+            metadata['callerid'] = callerid
+        if latching is not None:
+            # the ros1 profile spells latching as a boolean string
+            metadata['latching'] = 'true' if latching else 'false'
+        self.channels.append(self.writer.register_channel(
+            topic=topic, message_encoding='ros1', schema_id=self.schemas[schema], metadata=metadata))
+        return connection
+
+    def write(self, connection, timestamp, data):
+        self.writer.add_message(channel_id=self.channels[connection.id], log_time=timestamp, data=data,
+                                publish_time=timestamp, sequence=self.sequence)
+        self.sequence += 1
+
+    def close(self):
+        self.writer.finish()
+        self.file.close()
+
+
+class Rosbag2BagWriter(FormatWriter):
+    """Converts messages to CDR and writes them into a rosbag2 (sqlite3) bag directory."""
+
+    def __init__(self, path, compression='none', chunk_size=None):
+        if compression not in ('none', 'zstd'):
+            raise WriterError(f'Compression {compression!r} is not supported for rosbag2.')
+        super().__init__(path)
+        self.writer = Rosbag2Writer(path)
+        if compression == 'zstd':
+            # per message compression keeps messages individually addressable
+            self.writer.set_compression(Rosbag2Writer.CompressionMode.MESSAGE, Rosbag2Writer.CompressionFormat.ZSTD)
+        # ros1 connections differing only in callerid share a rosbag2 connection
+        self.topics = {}
+        self.targets = []
+
+    def open(self):
+        self.writer.open()
+
+    def add_connection(self, topic, msgtype, msgdef=None, md5sum=None, callerid=None, latching=None):
+        connection = super().add_connection(topic, msgtype, msgdef, md5sum, callerid, latching)
+        key = (topic, connection.msgtype, bool(latching))
+        if key not in self.topics:
+            register_connection_types([connection])
+            # latched topics are offered transient local, so late subscribers still get their last message on replay
+            self.topics[key] = self.writer.add_connection(topic, connection.msgtype,
+                                                          offered_qos_profiles=LATCH if latching else '')
+        self.targets.append(self.topics[key])
+        return connection
+
+    def write(self, connection, timestamp, data):
+        self.writer.write(self.targets[connection.id], timestamp, ros1_to_cdr(data, connection.msgtype))
+
+    def close(self):
+        self.writer.close()
+
+
+WRITERS = {'mcap': McapBagWriter, 'rosbag2': Rosbag2BagWriter}
+
+
+def is_rosbag2_output(path):
+    """Check whether the directory path holds a rosbag2 bag as written here, metadata.yaml and .db3 files only."""
+    names = os.listdir(path)
+    return 'metadata.yaml' in names and all(
+        name == 'metadata.yaml' or (name.endswith('.db3') and os.path.isfile(os.path.join(path, name)))
+        for name in names)
+
+
+def remove_output(path, input_paths=()):
+    """Remove an output file, or an output bag directory for rosbag2.
+
+    A directory is only removed when it holds a rosbag2 bag and nothing else, and none
+    of input_paths. Otherwise a ValueError is raised and nothing is deleted.
+    """
+    if os.path.isdir(path):
+        root = os.path.realpath(path)
+        for input_path in input_paths:
+            real = os.path.realpath(input_path)
+            if real == root or real.startswith(root + os.sep):
+                raise ValueError(f'The output {path} holds the input {input_path}, choose another --outbag_name or --output_path.')
+        if not is_rosbag2_output(path):
+            raise ValueError(f'The output {path} exists and is not a rosbag2 bag, remove it or choose another --outbag_name.')
+        for name in os.listdir(path):
+            os.remove(os.path.join(path, name))
+        os.rmdir(path)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+__all__ = [McapBagWriter.__name__, Rosbag2BagWriter.__name__, remove_output.__name__, 'WRITERS', 'EXTENSIONS', 'DEFAULT_COMPRESSION']
@@ -0,0 +1,192 @@
+"""
+
+Reduces and transforms the merged message stream between the merge and the output writer.
+
+Topic patterns and message type filters are resolved once against the connections of
+the inputs into a plain topic list, so unwanted connections are never read. Stages
+which look at every message (throttling, decimation, user transforms) run on batches
+of messages and decide per connection only once which of them apply.
+
+"""
+
+import fnmatch
+import importlib
+import re
+
+from .bag_index import IndexReader
+from .merge import BATCH_SIZE
+
+
+def compile_pattern(pattern):
+    """Compile a topic or type pattern, a glob unless it starts with 're:'."""
+    if pattern.startswith('re:'):
+        return re.compile(pattern[3:])
+    return re.compile(fnmatch.translate(pattern))
+
+
+def resolve_topics(paths, topics=None, patterns=None, types=None):
+    """Return the topics of paths selected by exact topics, topic patterns and message type patterns.
+
+    Returns topics unchanged when neither patterns nor types are given (None selects every topic).
+    """
+    if not patterns and not types:
+        return topics
+    connections = []
+    for path in paths:
+        with IndexReader(path) as bag:
+            connections.extend(bag.connections)
+    topic_patterns = [compile_pattern(x) for x in patterns or []]
+    type_patterns = [compile_pattern(x) for x in types or []]
+    selected = set()
+    for connection in connections:
+        by_topic = (topics is None and not topic_patterns) or connection.topic in (topics or ())
+        by_topic = by_topic or any(x.fullmatch(connection.topic) for x in topic_patterns)
+        by_type = not type_patterns or any(x.fullmatch(connection.msgtype) for x in type_patterns)
+        if by_topic and by_type:
+            selected.add(connection.topic)
+    return sorted(selected)
+
+
+class Stage:
+    """A batch stage applying to the connections whose topic matches pattern (all when None)."""
+
+    def __init__(self, pattern=None):
+        self.pattern = compile_pattern(pattern) if pattern else None
+        self.matches = {}
+
+    def applies(self, connection):
+        """Check once per connection whether the stage applies to it."""
+        key = (id(connection.owner), connection.id)
+        applies = self.matches.get(key)
+        if applies is None:
+            applies = self.matches[key] = self.pattern is None or bool(self.pattern.fullmatch(connection.topic))
+        return applies
+
+    def process(self, batch):
+        """Return the messages of batch to keep, in order."""
+        raise NotImplementedError
+
+
+class Throttle(Stage):
+    """Keeps rate messages per second of every matching topic, on average.
+
+    Every kept message moves the next slot on by one period from the previous slot, so
+    jittery timestamps do not lower the kept rate. After a gap the slot is caught up to
+    one period behind the message, so at most one extra message is kept.
+    """
+
+    def __init__(self, pattern, rate):
+        super().__init__(pattern)
+        self.period = int(1e9 / rate)
+        self.next_time = {}
+
+    def process(self, batch):
+        kept = []
+        next_time = self.next_time
+        for message in batch:
+            connection, timestamp = message[0], message[1]
+            if self.applies(connection):
+                slot = next_time.get(connection.topic, timestamp)
+                if timestamp < slot:
+                    continue
+                next_time[connection.topic] = max(slot + self.period, timestamp - self.period)
+            kept.append(message)
+        return kept
+
+
+class Decimate(Stage):
+    """Keeps every factor-th message of every matching topic, starting with the first."""
+
+    def __init__(self, pattern, factor):
+        super().__init__(pattern)
+        self.factor = factor
+        self.counts = {}
+
+    def process(self, batch):
+        kept = []
+        counts = self.counts
+        for message in batch:
+            connection = message[0]
+            if self.applies(connection):
+                count = counts.get(connection.topic, 0)
+                counts[connection.topic] = count + 1
+                if count % self.factor:
+                    continue
+            kept.append(message)
+        return kept
+
+
+class Transform(Stage):
+    """Applies function(connection, timestamp, rawdata) to matching messages.
+
+    The function returns the (timestamp, rawdata) to write, or None to drop the message.
+    The connection cannot change since it decides where the message is written. rawdata
+    is passed as bytes even when the reader yields memoryviews.
+    """
+
+    def __init__(self, function, pattern=None):
+        super().__init__(pattern)
+        self.function = function
+
+    def process(self, batch):
+        kept = []
+        function = self.function
+        for message in batch:
+            if self.applies(message[0]):
+                result = function(message[0], message[1], bytes(message[2]))
+                if result is None:
+                    continue
+                message = (message[0], *result)
+            kept.append(message)
+        return kept
+
+
+class Pipeline:
+    """Runs stages in order over batches of a chronological (connection, timestamp, rawdata) stream."""
+
+    def __init__(self, stages, batch_size=BATCH_SIZE):
+        self.stages = list(stages)
+        self.batch_size = batch_size
+
+    def batches(self, messages):
+        """Yield (kept messages, number of messages consumed) for every batch of messages."""
+        batch = []
+        for message in messages:
+            batch.append(message)
+            if len(batch) >= self.batch_size:
+                yield self.process(batch), len(batch)
+                batch = []
+        if batch:
+            yield self.process(batch), len(batch)
+
+    def process(self, batch):
+        for stage in self.stages:
+            batch = stage.process(batch)
+        return batch
+
+
+def parse_rule(rule, convert):
+    """Split a 'TOPIC_PATTERN=VALUE' rule into (pattern, convert(value))."""
+    pattern, _, value = rule.rpartition('=')
+    if not pattern:
+        raise ValueError(f'Rule {rule!r} is not of the form TOPIC_PATTERN=VALUE.')
+    return pattern, convert(value)
+
+
+def load_function(spec):
+    """Import a 'module:function' (or 'module.function') spec."""
+    module, _, name = spec.rpartition(':') if ':' in spec else spec.rpartition('.')
+    return getattr(importlib.import_module(module), name)
+
+
+def build_pipeline(throttle=None, decimate=None, transforms=None, batch_size=BATCH_SIZE):
+    """Build a Pipeline from command line style rules, returns None when there is nothing to do."""
+    # cheap reductions first so transforms see fewer messages
+    stages = [Throttle(*parse_rule(rule, float)) for rule in throttle or []]
+    stages += [Decimate(*parse_rule(rule, int)) for rule in decimate or []]
+    stages += [Transform(load_function(spec)) for spec in transforms or []]
+    return Pipeline(stages, batch_size) if stages else None
+
+
+__all__ = [Pipeline.__name__, Stage.__name__, Throttle.__name__, Decimate.__name__, Transform.__name__,
+           resolve_topics.__name__, build_pipeline.__name__]
@@ -0,0 +1,106 @@
+"""
+
+Reads input bags on background threads so file reads and chunk decompression
+overlap with the merge and the output writer.
+
+"""
+
+import threading
+from collections import deque
+
+from .mapped_reader import MappedReader
+
+
+class PrefetchReader:
+    """Reads the messages of one open bag on a worker thread into a byte bounded queue of batches.
+
+    The worker stops reading while more than max_bytes of message data are queued or
+    still being consumed, so large messages cannot grow memory without bound. A
+    memory mapped bag reads its pages on the worker thread and gives them back once
+    the batches holding their messages were consumed.
+    """
+
+    def __init__(self, bag, connections, start_time=None, end_time=None, max_bytes=64 * (1 << 20), batch_bytes=1 << 20):
+        self.bag = bag
+        self.connections = connections
+        self.start_time = start_time
+        self.end_time = end_time
+        self.max_bytes = max_bytes
+        self.batch_bytes = min(batch_bytes, max(max_bytes // 4, 1))
+        self.batches = deque()
+        self.buffered = 0
+        self.done = False
+        self.stopped = False
+        self.error = None
+        self.cond = threading.Condition()
+        self.thread = threading.Thread(target=self.run, name=f'prefetch {bag.path.name}', daemon=True)
+        self.mapped = isinstance(bag, MappedReader)
+        if self.mapped:
+            bag.hold_pages = True
+
+    def run(self):
+        """Worker thread body, reads batches of messages until the bag is exhausted or stopped."""
+        batch, size = [], 0
+        try:
+            for message in self.bag.messages(connections=self.connections, start=self.start_time, stop=self.end_time):
+                batch.append(message)
+                size += len(message[2])
+                if size >= self.batch_bytes:
+                    if not self.put(batch, size):
+                        return
+                    batch, size = [], 0
+            if batch:
+                self.put(batch, size)
+        except Exception as err:  # pylint: disable=broad-except
+            # handed to the consuming thread which raises it after the queued batches
+            self.error = err
+        finally:
+            with self.cond:
+                self.done = True
+                self.cond.notify_all()
+
+    def put(self, batch, size):
+        """Queue a batch once the memory budget allows it, returns False when stopped."""
+        with self.cond:
+            # a batch larger than the whole budget still passes when nothing else is queued
+            while self.buffered and self.buffered + size > self.max_bytes and not self.stopped:
+                self.cond.wait()
+            if self.stopped:
+                return False
+            # chunks the reader moved past so far hold no message of later batches
+            self.batches.append((batch, size, self.bag.held_total if self.mapped else 0))
+            self.buffered += size
+            self.cond.notify_all()
+        return True
+
+    def stop(self):
+        """Stop the worker thread and wait for it to leave the bag."""
+        with self.cond:
+            self.stopped = True
+            self.cond.notify_all()
+        if self.thread.is_alive():
+            self.thread.join()
+
+    def __iter__(self):
+        self.thread.start()
+        try:
+            while True:
+                with self.cond:
+                    while not self.batches and not self.done:
+                        self.cond.wait()
+                    if not self.batches:
+                        if self.error is not None:
+                            raise self.error
+                        return
+                    batch, size, held_total = self.batches.popleft()
+                yield from batch
+                if self.mapped:
+                    self.bag.release_pages(held_total)
+                with self.cond:
+                    self.buffered -= size
+                    self.cond.notify_all()
+        finally:
+            self.stop()
+
+
+__all__ = [PrefetchReader.__name__]
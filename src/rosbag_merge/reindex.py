@@ -0,0 +1,280 @@
+"""
+
+Recovers rosbag1 files whose recording did not finish, without a ROS install.
+
+A recorder writes the index of a bag only when it closes it, so a crashed recorder
+or a partial copy leaves a bag which cannot be opened. The records of such a bag are
+scanned from the start instead: every complete chunk is copied as is with an index
+built from its records, the complete messages of a cut off last chunk go into a
+new chunk, and a new index is written. The original file is left untouched.
+
+"""
+
+import hashlib
+import os
+from bz2 import BZ2Decompressor
+from collections import defaultdict
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from lz4.frame import LZ4FrameDecompressor
+from rosbags.interfaces import Connection, ConnectionExtRosbag1
+from rosbags.rosbag1 import Reader, ReaderError, WriterError
+from rosbags.rosbag1.reader import Chunk, ChunkInfo, Header, IndexData, RecordType, normalize, read_bytes, read_uint32
+from rosbags.typesys.msg import normalize_msgtype
+
+from .bag_chunks import DECOMPRESSORS, INDEX_ENTRY, RawChunk, remap_raw_chunk
+from .bag_index import IndexReader
+from .bag_stream import register_connections
+from .bag_writer import BagWriter
+
+REINDEX_DIR = '.reindexed'
+# decompressors which return what they can of cut off data
+PARTIAL_DECOMPRESSORS = {'none': lambda: None, 'bz2': BZ2Decompressor, 'lz4': LZ4FrameDecompressor}
+
+
+def read_records(bio, end):
+    """Yield (record position, header, data position, data size) of the complete records of bio before end."""
+    while True:
+        pos = bio.tell()
+        try:
+            header = Header.read(bio)
+            size = read_uint32(bio)
+        except ReaderError:
+            return
+        datapos = bio.tell()
+        if datapos + size > end:
+            return
+        yield pos, header, datapos, size
+        bio.seek(datapos + size)
+
+
+def read_connection(header, data_header, owner):
+    """Build a Connection from the header and the data of a connection record."""
+    return Connection(
+        header.get_uint32('conn'),
+        normalize(header.get_string('topic')),
+        normalize_msgtype(data_header.get_string('type')),
+        data_header.get_string('message_definition'),
+        data_header.get_string('md5sum'),
+        0,
+        ConnectionExtRosbag1(
+            data_header.get_string('callerid') if 'callerid' in data_header else None,
+            int(data_header.get_string('latching')) if 'latching' in data_header else None,
+        ),
+        owner,
+    )
+
+
+def decompress_partial(compression, data):
+    """Decompress as much as possible of the cut off data of a chunk."""
+    decompressor = PARTIAL_DECOMPRESSORS[compression]()
+    if decompressor is None:
+        return data
+    try:
+        return decompressor.decompress(data)
+    except (OSError, RuntimeError, EOFError):
+        return b''
+
+
+class ScanReader(Reader):
+    """Rosbag1 reader which rebuilds connections, chunk infos and indexes by scanning every record.
+
+    Works on bags without or with a damaged index. Messages of complete chunks are
+    read like from any indexed bag, the complete messages of a cut off last chunk are
+    kept in tail as (connection id, timestamp, rawdata).
+    """
+
+    def open(self):
+        """Open rosbag and scan its records."""
+        try:
+            self.bio = self.path.open('rb')  # pylint: disable=consider-using-with
+        except OSError as err:
+            raise ReaderError(f'Could not open file {str(self.path)!r}: {err.strerror}.') from err
+
+        try:
+            if self.bio.readline() != b'#ROSBAG V2.0\n':
+                raise ReaderError('File magic is invalid or bag version is not supported.')
+            Header.read(self.bio, RecordType.BAGHEADER)
+            self.bio.seek(read_uint32(self.bio), os.SEEK_CUR)
+        except ReaderError:
+            self.close()
+            raise
+
+        file_size = os.fstat(self.bio.fileno()).st_size
+        # chunk position -> (compression, uncompressed size)
+        self.chunk_formats = {}
+        self.tail = []
+        connections = {}
+        indexes = defaultdict(list)
+        for pos, header, datapos, size in self.scan(file_size):
+            try:
+                op = header.get_uint8('op')
+                if op == RecordType.CONNECTION:
+                    # the connection data is laid out like a header, its size being the data size
+                    self.bio.seek(datapos - 4)
+                    connection = read_connection(header, Header.read(self.bio), self)
+                    connections.setdefault(connection.id, connection)
+                elif op == RecordType.CHUNK:
+                    compression = header.get_string('compression')
+                    self.bio.seek(datapos)
+                    raw = self.bio.read(size)
+                    if datapos + size <= file_size:
+                        data = DECOMPRESSORS[compression](raw)
+                    else:
+                        data = decompress_partial(compression, raw)
+            except (ReaderError, KeyError, OSError, RuntimeError, ValueError):
+                # whatever follows a damaged record cannot be trusted
+                break
+            if op != RecordType.CHUNK:
+                continue
+            messages = self.scan_chunk(data, connections)
+            if datapos + size > file_size:
+                self.tail = [(cid, time, data[start:end]) for cid, time, _, start, end in messages]
+                break
+            if not messages:
+                continue
+            counts = defaultdict(int)
+            for cid, time, offset, _, _ in messages:
+                indexes[cid].append(IndexData(time, pos, offset))
+                counts[cid] += 1
+            self.chunk_infos.append(ChunkInfo(pos, min(x[1] for x in messages), max(x[1] for x in messages) + 1,
+                                              dict(counts)))
+            self.chunks[pos] = Chunk(size, datapos, DECOMPRESSORS[compression])
+            self.chunk_formats[pos] = (compression, len(data))
+
+        self.connections = [Connection(*x[0:5], len(indexes[x.id]), *x[6:]) for _, x in sorted(connections.items())]
+        self.indexes = {x.id: sorted(indexes[x.id]) for x in self.connections}
+
+    def scan(self, file_size):
+        """Yield the top level records of the bag, the last one possibly cut off."""
+        bio = self.bio
+        while True:
+            pos = bio.tell()
+            try:
+                header = Header.read(bio)
+                size = read_uint32(bio)
+            except ReaderError:
+                return
+            datapos = bio.tell()
+            yield pos, header, datapos, size
+            if datapos + size >= file_size:
+                return
+            bio.seek(datapos + size)
+
+    def scan_chunk(self, data, connections):
+        """Return (connection id, timestamp, record offset, data start, data end) of the complete messages of chunk data.
+
+        Connection records found in the chunk are added to connections.
+        """
+        messages = []
+        bio = BytesIO(data)
+        for pos, header, datapos, size in read_records(bio, len(data)):
+            try:
+                op = header.get_uint8('op')
+                if op == RecordType.CONNECTION:
+                    bio.seek(datapos - 4)
+                    connection = read_connection(header, Header.read(bio), self)
+                    connections.setdefault(connection.id, connection)
+                elif op == RecordType.MSGDATA and header.get_uint32('conn') in connections:
+                    # a message can only be written out when its connection record was found
+                    messages.append((header.get_uint32('conn'), header.get_time('time'), pos, datapos,
+                                     datapos + size))
+            except ReaderError:
+                break
+        return messages
+
+    def raw_chunk(self, chunk_info):
+        """Return a complete chunk as RawChunk with index records built from the scan."""
+        chunk = self.chunks[chunk_info.pos]
+        self.bio.seek(chunk.datapos)
+        data = read_bytes(self.bio, chunk.datasize)
+        index = {
+            cid: b''.join(INDEX_ENTRY.pack(*divmod(x.time, 1_000_000_000), x.offset)
+                          for x in self.indexes[cid] if x.chunk_pos == chunk_info.pos)
+            for cid in chunk_info.connection_counts
+        }
+        compression, size = self.chunk_formats[chunk_info.pos]
+        return RawChunk(compression, size, data, chunk_info.start_time, chunk_info.end_time, index)
+
+    def chunk_messages(self, chunk_info):
+        """Return (connection id, timestamp, rawdata) of the messages of a complete chunk in time order."""
+        chunk = self.chunks[chunk_info.pos]
+        self.bio.seek(chunk.datapos)
+        data = chunk.decompressor(read_bytes(self.bio, chunk.datasize))
+        messages = self.scan_chunk(data, {x.id: x for x in self.connections})
+        return sorted(((cid, time, data[start:end]) for cid, time, _, start, end in messages), key=lambda x: x[1])
+
+
+def needs_reindex(path):
+    """Check whether a bag lacks a readable index."""
+    try:
+        with IndexReader(path) as bag:
+            return bag.index_pos > os.path.getsize(path)
+    except ReaderError:
+        return True
+
+
+def reindex_bag(path, output_path):
+    """Write the recoverable content of the bag at path into a new indexed bag at output_path.
+
+    Returns the number of messages recovered.
+    """
+    if os.path.exists(output_path):
+        os.remove(output_path)
+    with ScanReader(path) as bag:
+        # messages which cannot be copied with their chunk are written with the compression of the first chunk
+        compression = next(iter(bag.chunk_formats.values()), ('none', 0))[0]
+        with BagWriter(output_path, compression=compression) as writer:
+            conn_map = register_connections(writer, [bag])
+            id_map = {cid: conn.id for (_, cid), conn in conn_map.items()}
+            for chunk_info in sorted(bag.chunk_infos, key=lambda x: x.pos):
+                raw = remap_raw_chunk(bag.raw_chunk(chunk_info), id_map)
+                if raw is not None:
+                    writer.write_raw_chunk(raw)
+                    continue
+                # compressed chunks whose connection ids change are written message by message
+                for cid, timestamp, data in bag.chunk_messages(chunk_info):
+                    writer.write(conn_map[id(bag), cid], timestamp, data)
+            for cid, timestamp, data in sorted(bag.tail, key=lambda x: x[1]):
+                writer.write(conn_map[id(bag), cid], timestamp, data)
+        return sum(len(x) for x in bag.indexes.values()) + len(bag.tail)
+
+
+def reindex_path(path, output_dir=None):
+    """Return where the reindexed copy of path is written, a .reindexed directory next to it by default.
+
+    In a shared output_dir copies go into a subdirectory named after a digest of the
+    source directory, so bags of the same name from different directories do not collide.
+    """
+    source_dir = os.path.dirname(os.path.abspath(path))
+    if output_dir is None:
+        return os.path.join(source_dir, REINDEX_DIR, os.path.basename(path))
+    digest = hashlib.sha1(source_dir.encode()).hexdigest()[:12]
+    return os.path.join(output_dir, digest, os.path.basename(path))
+
+
+def reindex_bags(paths, output_dir=None, jobs=None, check=True):
+    """Reindex every bag of paths lacking a readable index in a process pool.
+
+    Returns paths with every reindexed bag replaced by its indexed copy and prints
+    what was recovered. Bags which cannot be recovered at all are reported and left
+    out. With check False every bag is reindexed. jobs defaults to the number of CPUs.
+    """
+    failed = set()
+    with ProcessPoolExecutor(jobs) as pool:
+        broken = list(pool.map(needs_reindex, paths)) if check else [True] * len(paths)
+        targets = {path: reindex_path(path, output_dir) for path, bad in zip(paths, broken) if bad}
+        for target in set(targets.values()):
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+        futures = {path: pool.submit(reindex_bag, path, target) for path, target in targets.items()}
+        for path, future in futures.items():
+            try:
+                print(f"Reindexed {path}: recovered {future.result()} messages into {targets[path]}")
+            except (ReaderError, WriterError, OSError) as err:
+                print(f"Could not reindex {path}, leaving it out: {err}")
+                failed.add(path)
+    return [targets.get(path, path) for path in paths if path not in failed]
+
+
+__all__ = [ScanReader.__name__, needs_reindex.__name__, reindex_bag.__name__, reindex_bags.__name__]
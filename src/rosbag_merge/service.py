@@ -0,0 +1,329 @@
+"""
+
+Runs merge, export and info jobs for many clients from one long running process.
+
+Clients submit jobs as JSON over a UNIX socket (one JSON request per line) or over
+HTTP. Jobs wait in a queue and run on a bounded pool of worker processes which
+stay up between jobs, so imports, registered message types and the bag metadata
+catalog are paid for once per worker instead of once per job. Running jobs report
+their progress and can be cancelled.
+
+Requests over the UNIX socket look like {"op": "submit", "kind": "merge", "args": {...}},
+{"op": "status", "id": ...}, {"op": "wait", "id": ...}, {"op": "cancel", "id": ...} and
+{"op": "list"}. Over HTTP they are POST /jobs (body {"kind": ..., "args": ...}),
+GET /jobs, GET /jobs/<id>, GET /jobs/<id>?wait=1 and DELETE /jobs/<id>.
+
+"""
+
+import asyncio
+import glob
+import itertools
+import json
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from . import bag_stream, export, info, output_formats
+from .catalog import Catalog
+
+# seconds between progress reports (and cancellation checks) of a running job
+PROGRESS_INTERVAL = 0.2
+# finished jobs kept for status requests
+KEEP_FINISHED = 1000
+# operations a request can ask for, all but submit and list refer to a job id
+OPERATIONS = ('submit', 'list', 'status', 'wait', 'cancel')
+
+
+class JobCancelled(Exception):
+    """Raised inside a worker to stop a job which was cancelled."""
+
+
+# state of a worker process, set up once by init_worker and reused by every job it runs
+WORKER = {}
+
+
+def init_worker(progress_queue, cancelled, catalog_path):
+    """Set up a worker process: progress reporting, cancellation flags and the metadata catalog."""
+    WORKER['progress'] = progress_queue
+    WORKER['cancelled'] = cancelled
+    # without a catalog file every worker keeps its own catalog in memory across jobs
+    WORKER['catalog'] = Catalog(catalog_path or ':memory:')
+
+
+def merge_outputs(args):
+    """Return the output paths a merge job writes."""
+    output_path, outbag_name = args['output_path'], args['outbag_name']
+    if args.get('split_size') or args.get('split_duration'):
+        return glob.glob(os.path.join(glob.escape(output_path), glob.escape(outbag_name) + '_[0-9][0-9][0-9][0-9].bag'))
+    return [os.path.join(output_path, outbag_name + output_formats.EXTENSIONS[args.get('output_format', 'bag')])]
+
+
+def run_job(job_id, kind, args):
+    """Run one job in a worker process and return its result as plain data with its final (done, total)."""
+    progress_queue = WORKER['progress']
+    cancelled = WORKER['cancelled']
+    reported = [0.0]
+    # reports are throttled, the last one is returned with the result
+    last = [0, None]
+
+    def on_progress(done, total):
+        last[:] = done, total
+        now = time.monotonic()
+        if now - reported[0] < PROGRESS_INTERVAL:
+            return
+        reported[0] = now
+        if job_id in cancelled:
+            raise JobCancelled(job_id)
+        progress_queue.put((job_id, done, total))
+
+    if kind == 'merge':
+        args = {'topics': None, 'exists_ok': True, **args}
+        try:
+            bag_stream.main(catalog=WORKER['catalog'], on_progress=on_progress, **args)
+        except JobCancelled:
+            # a cancelled merge leaves no partial output behind
+            for path in merge_outputs(args):
+                output_formats.remove_output(path, args['input_bags'])
+            raise
+        return {'outputs': merge_outputs(args)}, last
+    if kind == 'export':
+        # a cancelled export removes the files it wrote
+        return {'outputs': export.export_topics(**args, on_progress=on_progress)}, last
+    if kind == 'info':
+        summary = info.collect_info(args['input_bags'], gap=args.get('gap', 1.0), catalog=WORKER['catalog'],
+                                    on_progress=on_progress)
+        return summary, last
+    raise ValueError(f'Job kind {kind!r} is not supported, use merge, export or info.')
+
+
+class Job:
+    """A submitted job and what is known about it."""
+
+    def __init__(self, job_id, kind, args):
+        self.id = job_id
+        self.kind = kind
+        self.args = args
+        self.state = 'queued'
+        self.done = 0
+        self.total = None
+        self.result = None
+        self.error = None
+        self.submitted = time.time()
+        self.started = None
+        self.finished = None
+        self.event = asyncio.Event()
+
+    def finish(self, state, result=None, error=None):
+        self.state = state
+        self.result = result
+        self.error = error
+        self.finished = time.time()
+        self.event.set()
+
+    def to_dict(self):
+        return {
+            'id': self.id, 'kind': self.kind, 'state': self.state, 'done': self.done, 'total': self.total,
+            'result': self.result, 'error': self.error, 'submitted': self.submitted, 'started': self.started,
+            'finished': self.finished,
+        }
+
+
+class MergeService:
+    """Queues jobs and runs them on a pool of long lived worker processes."""
+
+    def __init__(self, workers=None, catalog_path=None):
+        self.workers = workers or os.cpu_count() or 1
+        self.catalog_path = catalog_path
+        self.jobs = {}
+        self.ids = itertools.count(1)
+        self.queue = None
+        self.pool = None
+        self.manager = None
+        self.cancelled = None
+        self.progress_queue = None
+        self.tasks = []
+
+    async def start(self):
+        self.manager = multiprocessing.Manager()
+        self.cancelled = self.manager.dict()
+        self.progress_queue = self.manager.Queue()
+        # workers start on the first jobs, spawned rather than forked so they do not inherit
+        # the sockets of the server and its clients, which would keep connections open
+        self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                        initializer=init_worker,
+                                        initargs=(self.progress_queue, self.cancelled, self.catalog_path))
+        self.queue = asyncio.Queue()
+        # as many runners as workers, so queued jobs wait here where they can still be cancelled
+        self.tasks = [asyncio.create_task(self.runner()) for _ in range(self.workers)]
+        self.tasks.append(asyncio.create_task(self.read_progress()))
+
+    async def close(self):
+        for task in self.tasks:
+            task.cancel()
+        await asyncio.gather(*self.tasks, return_exceptions=True)
+        # jobs only reach the pool when a worker is free, so nothing is left pending there
+        self.pool.shutdown()
+        self.manager.shutdown()
+
+    def submit(self, kind, args):
+        job = Job(next(self.ids), kind, args or {})
+        self.jobs[job.id] = job
+        self.queue.put_nowait(job)
+        self.forget_finished()
+        return job
+
+    def forget_finished(self):
+        finished = [x for x in self.jobs.values() if x.finished is not None]
+        for job in sorted(finished, key=lambda x: x.finished)[:max(len(finished) - KEEP_FINISHED, 0)]:
+            del self.jobs[job.id]
+
+    def cancel(self, job):
+        """Cancel a job, returns an error message when it already finished."""
+        if job.state == 'queued':
+            job.finish('cancelled')
+        elif job.state == 'running':
+            # the worker notices at its next progress report
+            self.cancelled[job.id] = True
+            job.state = 'cancelling'
+        elif job.state != 'cancelling':
+            return f'Job {job.id} already finished ({job.state}), it cannot be cancelled.'
+        return None
+
+    async def runner(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job = await self.queue.get()
+            if job.state != 'queued':
+                continue
+            job.state = 'running'
+            job.started = time.time()
+            try:
+                result, (job.done, job.total) = await loop.run_in_executor(self.pool, run_job, job.id, job.kind,
+                                                                            job.args)
+            except JobCancelled:
+                job.finish('cancelled')
+            except Exception as err:  # pylint: disable=broad-except
+                job.finish('failed', error=f'{type(err).__name__}: {err}')
+            else:
+                # the job may have finished before its worker noticed the cancellation
+                error = 'Finished before the cancellation took effect.' if job.state == 'cancelling' else None
+                job.finish('done', result=result, error=error)
+            finally:
+                self.cancelled.pop(job.id, None)
+
+    async def read_progress(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            job_id, done, total = await loop.run_in_executor(None, self.progress_queue.get)
+            job = self.jobs.get(job_id)
+            if job is not None and job.state in ('running', 'cancelling'):
+                job.done, job.total = done, total
+
+    async def handle(self, request):
+        """Answer one request, see the module docstring."""
+        if not isinstance(request, dict):
+            return {'error': 'Invalid request: a request is a JSON object.'}
+        op = request.get('op')
+        if op not in OPERATIONS:
+            return {'error': f"Operation {op!r} is not supported, use one of {', '.join(OPERATIONS)}."}
+        if op == 'submit':
+            return self.submit(request.get('kind'), request.get('args')).to_dict()
+        if op == 'list':
+            return {'jobs': [x.to_dict() for x in self.jobs.values()]}
+        job = self.jobs.get(request.get('id'))
+        if job is None:
+            return {'error': f"There is no job {request.get('id')!r}."}
+        if op == 'wait':
+            await job.event.wait()
+        elif op == 'cancel':
+            error = self.cancel(job)
+            if error is not None:
+                return {'error': error, 'job': job.to_dict()}
+        return job.to_dict()
+
+    async def handle_lines(self, reader, writer):
+        """Serve JSON requests, one per line, on a stream connection."""
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                try:
+                    response = await self.handle(json.loads(line))
+                except (ValueError, AttributeError) as err:
+                    response = {'error': f'Invalid request: {err}'}
+                writer.write(json.dumps(response).encode() + b'\n')
+                await writer.drain()
+        finally:
+            writer.close()
+
+    async def handle_http(self, reader, writer):
+        """Serve one HTTP request mapped onto handle."""
+        status, response = 200, None
+        try:
+            method, target, _ = (await reader.readline()).decode().split(' ', 2)
+            headers = {}
+            while True:
+                line = (await reader.readline()).decode().strip()
+                if not line:
+                    break
+                name, _, value = line.partition(':')
+                headers[name.strip().lower()] = value.strip()
+            body = await reader.readexactly(int(headers.get('content-length', 0)))
+            path, _, query = target.partition('?')
+            parts = [x for x in path.split('/') if x]
+            if parts == ['jobs'] and method == 'POST':
+                submit = json.loads(body or b'{}')
+                if not isinstance(submit, dict):
+                    raise ValueError('the body is not a JSON object')
+                request = dict(submit, op='submit')
+            elif parts == ['jobs'] and method == 'GET':
+                request = {'op': 'list'}
+            elif len(parts) == 2 and parts[0] == 'jobs' and parts[1].isdigit() and method in ('GET', 'DELETE'):
+                op = 'cancel' if method == 'DELETE' else 'wait' if 'wait=1' in query.split('&') else 'status'
+                request = {'op': op, 'id': int(parts[1])}
+            else:
+                status, response = 404, {'error': f'No route for {method} {path}.'}
+            if response is None:
+                response = await self.handle(request)
+                if 'error' in response and 'id' not in response:
+                    # a job which cannot be cancelled anymore comes with its state
+                    status = 409 if 'job' in response else 404
+        except (ValueError, asyncio.IncompleteReadError) as err:
+            status, response = 400, {'error': f'Invalid request: {err}'}
+        data = json.dumps(response).encode()
+        reason = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 409: 'Conflict'}[status]
+        writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: application/json\r\n'
+                     f'Content-Length: {len(data)}\r\nConnection: close\r\n\r\n'.encode() + data)
+        await writer.drain()
+        writer.close()
+
+
+async def serve_forever(address, workers=None, catalog_path=None):
+    """Serve on address, a HOST:PORT for HTTP or else the path of a UNIX socket, until cancelled."""
+    service = MergeService(workers, catalog_path)
+    await service.start()
+    host, _, port = address.rpartition(':')
+    try:
+        if port.isdigit() and os.path.sep not in address:
+            server = await asyncio.start_server(service.handle_http, host or '127.0.0.1', int(port))
+        else:
+            if os.path.exists(address):
+                os.remove(address)
+            server = await asyncio.start_unix_server(service.handle_lines, address)
+        print(f"Serving on {address} with {service.workers} workers.")
+        async with server:
+            await server.serve_forever()
+    finally:
+        await service.close()
+
+
+def main(address, workers=None, catalog_path=None):
+    try:
+        asyncio.run(serve_forever(address, workers, catalog_path))
+    except KeyboardInterrupt:
+        pass
+
+
+__all__ = [MergeService.__name__, serve_forever.__name__, main.__name__]
@@ -0,0 +1,187 @@
+"""
+
+Measures where the time of a merge goes and what was merged from which input and topic.
+
+Reading (including decompression) and writing (including compression) are timed where
+they happen. Merging is what is left of the merge loop, so the stages add up to the
+wall time of the run. Instrumentation is only installed when a RunStats is passed in.
+
+"""
+
+import cProfile
+import json
+import pstats
+import resource
+import sys
+from collections import defaultdict
+from contextlib import contextmanager
+from time import perf_counter
+
+MIB = 1 << 20
+
+
+def peak_rss(who=resource.RUSAGE_SELF):
+    """Return the peak resident set size in bytes of this process or of its finished children."""
+    peak = resource.getrusage(who).ru_maxrss
+    # ru_maxrss is in KiB on Linux and in bytes on macOS
+    return peak if sys.platform == 'darwin' else peak * 1024
+
+
+def rate(amount, seconds):
+    return round(amount / seconds, 1) if seconds else None
+
+
+class RunStats:
+    """Collects stage times and per input and per topic message and byte counts of one run."""
+
+    def __init__(self):
+        self.started = perf_counter()
+        self.seconds = defaultdict(float)
+        # path -> [messages, bytes, seconds spent reading]
+        self.inputs = defaultdict(lambda: [0, 0, 0.0])
+        # topic -> [messages, bytes]
+        self.topics = defaultdict(lambda: [0, 0])
+        # topic -> duplicate messages dropped
+        self.duplicates = {}
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block as stage name."""
+        started = perf_counter()
+        try:
+            yield
+        finally:
+            self.seconds[name] += perf_counter() - started
+
+    def timed(self, function, name):
+        """Wrap function so the time spent in it counts as stage name."""
+        seconds = self.seconds
+
+        def wrapper(*args, **kwargs):
+            started = perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                seconds[name] += perf_counter() - started
+        return wrapper
+
+    def timed_source(self, path, messages):
+        """Wrap the message iterator of one input, counting its messages and the time spent reading it."""
+        counts = self.inputs[path]
+        seconds = self.seconds
+        messages = iter(messages)
+        while True:
+            started = perf_counter()
+            try:
+                message = next(messages)
+            except StopIteration:
+                return
+            finally:
+                elapsed = perf_counter() - started
+                counts[2] += elapsed
+                seconds['read'] += elapsed
+            counts[0] += 1
+            counts[1] += len(message[2])
+            yield message
+
+    def record(self, topic, size):
+        """Count one written message."""
+        counts = self.topics[topic]
+        counts[0] += 1
+        counts[1] += size
+
+    def record_chunk(self, path, connections, chunk_info, raw, seconds):
+        """Count a chunk copied without decompression.
+
+        Message bytes of a copied chunk are not known per topic, they are shared out
+        by message count.
+        """
+        messages = sum(chunk_info.connection_counts.values())
+        counts = self.inputs[path]
+        counts[0] += messages
+        counts[1] += raw.size
+        counts[2] += seconds
+        for cid, count in chunk_info.connection_counts.items():
+            topic = self.topics[connections[cid].topic]
+            topic[0] += count
+            topic[1] += raw.size * count // messages
+
+    def state(self):
+        """Return the stage times and counts as plain data, for adding them to the RunStats of another process."""
+        return dict(self.seconds), dict(self.inputs), dict(self.topics)
+
+    def add(self, state):
+        """Add the stage times and counts of another RunStats, as returned by its state."""
+        seconds, inputs, topics = state
+        for name, value in seconds.items():
+            self.seconds[name] += value
+        for path, counts in inputs.items():
+            self.inputs[path] = [a + b for a, b in zip(self.inputs[path], counts)]
+        for topic, counts in topics.items():
+            self.topics[topic] = [a + b for a, b in zip(self.topics[topic], counts)]
+
+    def to_dict(self):
+        """Return the report as plain data for json."""
+        wall = perf_counter() - self.started
+        stages = dict(self.seconds)
+        # the merge loop time not spent reading or writing is spent merging
+        stages['merge'] = max(stages.pop('loop', 0.0) - stages.get('read', 0.0) - stages.get('write', 0.0), 0.0)
+        messages = sum(x[0] for x in self.topics.values())
+        size = sum(x[1] for x in self.topics.values())
+        return {
+            'wall_seconds': round(wall, 4),
+            'messages': messages,
+            'bytes': size,
+            'msgs_per_s': rate(messages, wall),
+            'mb_per_s': rate(size / MIB, wall),
+            'stages': {name: round(seconds, 4) for name, seconds in sorted(stages.items())},
+            'inputs': {
+                path: {
+                    'messages': messages,
+                    'bytes': size,
+                    'read_seconds': round(seconds, 4),
+                    'msgs_per_s': rate(messages, seconds),
+                    'mb_per_s': rate(size / MIB, seconds),
+                }
+                for path, (messages, size, seconds) in self.inputs.items()
+            },
+            'topics': {
+                topic: {'messages': messages, 'bytes': size}
+                for topic, (messages, size) in sorted(self.topics.items())
+            },
+            'duplicates': self.duplicates,
+            'peak_rss_mb': {
+                'self': round(peak_rss() / MIB, 1),
+                'children': round(peak_rss(resource.RUSAGE_CHILDREN) / MIB, 1),
+            },
+        }
+
+    def summary(self):
+        """Return a one line summary of the stage times."""
+        report = self.to_dict()
+        stages = ', '.join(f'{name} {seconds:.2f}s' for name, seconds in report['stages'].items())
+        return f"{report['messages']} messages in {report['wall_seconds']:.2f}s ({stages})"
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+
+@contextmanager
+def profiled(path=None):
+    """Run a block under cProfile, dumping the stats to path and a cumulative time listing to path.txt."""
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        profiler.dump_stats(path)
+        with open(path + '.txt', 'w') as f:
+            pstats.Stats(profiler, stream=f).sort_stats('cumulative').print_stats(40)
+
+
+__all__ = [RunStats.__name__, profiled.__name__, peak_rss.__name__]
@@ -0,0 +1,71 @@
+"""
+
+Generates synthetic rosbag1 files of a chosen shape, for benchmarks and for reproducing performance problems.
+
+Every topic carries std_msgs/String messages of a fixed payload size at a fixed rate.
+Consecutive bags are shifted in time so that they overlap by a chosen fraction,
+which decides how much of a merge interleaves messages and how much copies chunks.
+
+"""
+
+import heapq
+import os
+import random
+import struct
+
+from rosbags.typesys.msg import generate_msgdef
+
+from .bag_writer import BagWriter
+
+MSGTYPE = 'std_msgs/msg/String'
+
+
+def per_topic(value, topics):
+    """Spread a scalar or a sequence (cycled) over topics values."""
+    values = list(value) if isinstance(value, (list, tuple)) else [value]
+    return [values[i % len(values)] for i in range(topics)]
+
+
+def topic_times(topic, start_time, duration, rate, phase):
+    """Yield (timestamp, topic) of one topic, starting phase of a period after start_time."""
+    period = 1e9 / rate
+    count = int(duration * rate)
+    for i in range(count):
+        yield start_time + int((i + phase) * period), topic
+
+
+def generate_bags(output_path, bags=3, topics=4, message_size=256, rate=100.0, duration=10.0, overlap=0.5,
+                  compression='none', chunk_size=None, start_time=1_600_000_000 * 10**9, seed=0):
+    """Write bags synthetic bags into output_path and return their paths.
+
+    message_size (payload bytes) and rate (Hz) are scalars or per topic sequences.
+    Each bag spans duration seconds and starts (1 - overlap) * duration seconds after
+    the previous one, so overlap 0 gives time disjoint bags and 1 fully interleaved ones.
+    """
+    msgdef, md5sum = generate_msgdef(MSGTYPE)
+    sizes = per_topic(message_size, topics)
+    rates = per_topic(rate, topics)
+    rng = random.Random(seed)
+    # payloads are slices of one random pool, printable so compression has something to do
+    pool = bytes(rng.choice(b'abcdefghijklmnopqrstuvwxyz0123456789') for _ in range(max(sizes) + 4096))
+    paths = []
+    for b in range(bags):
+        path = os.path.join(output_path, f'synthetic_{b:04d}.bag')
+        if os.path.exists(path):
+            os.remove(path)
+        bag_start = start_time + int(b * (1 - overlap) * duration * 1e9)
+        with BagWriter(path, compression=compression, chunk_size=chunk_size) as writer:
+            connections = [
+                writer.add_connection(f'/synthetic/topic_{t}', MSGTYPE, msgdef, md5sum, callerid=f'/synthetic_{b}')
+                for t in range(topics)
+            ]
+            streams = [topic_times(t, bag_start, duration, rates[t], (t + b) / (topics * bags)) for t in range(topics)]
+            for timestamp, t in heapq.merge(*streams):
+                offset = rng.randrange(4096)
+                data = pool[offset:offset + sizes[t]]
+                writer.write(connections[t], timestamp, struct.pack('<L', len(data)) + data)
+        paths.append(path)
+    return paths
+
+
+__all__ = [generate_bags.__name__]
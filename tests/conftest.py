@@ -0,0 +1,51 @@
+"""
+
+Fixtures shared by the tests, built on the bags bundled in tests/data/raw.
+
+"""
+
+import glob
+import os
+
+import pytest
+from rosbags.rosbag1 import Reader
+from rosbags.serde import deserialize_ros1
+
+RAW_DIR = os.path.join(os.path.dirname(__file__), 'data', 'raw')
+
+
+def read_bag(path):
+    """Return the (topic, timestamp, data) messages of a bag in stored order."""
+    with Reader(path) as bag:
+        return [(c.topic, t, bytes(d)) for c, t, d in bag.messages()]
+
+
+def read_topic(paths, topic):
+    """Return the (timestamp, deserialized message) of topic in paths in time order."""
+    messages = []
+    for path in paths:
+        with Reader(path) as bag:
+            connections = [x for x in bag.connections if x.topic == topic]
+            if not connections:
+                # an empty selection would read every topic
+                continue
+            messages.extend((t, deserialize_ros1(d, c.msgtype)) for c, t, d in bag.messages(connections=connections))
+    return sorted(messages, key=lambda x: x[0])
+
+
+@pytest.fixture
+def raw_bags():
+    """Paths of the bundled bags, sorted."""
+    return sorted(glob.glob(os.path.join(RAW_DIR, '*.bag')))
+
+
+@pytest.fixture
+def bag_messages():
+    """read_bag, for tests comparing bag contents."""
+    return read_bag
+
+
+@pytest.fixture
+def topic_messages():
+    """read_topic, for tests comparing decoded values."""
+    return read_topic
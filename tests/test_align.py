@@ -0,0 +1,63 @@
+"""
+
+Aligns topics of the bundled bags onto a grid and compares the rows with a brute force as-of lookup.
+
+"""
+
+import bisect
+
+import pytest
+
+pytest.importorskip('pyarrow')
+import pyarrow.ipc  # noqa: E402
+import pyarrow.parquet  # noqa: E402
+
+from rosbag_merge.align import align_topics  # noqa: E402
+
+
+def as_of(messages, grid, value, tolerance=None):
+    """Return value(message) of the latest message at or before every grid time, None without one."""
+    times = [t for t, _ in messages]
+    result = []
+    for time in grid:
+        i = bisect.bisect_right(times, time) - 1
+        if i < 0 or (tolerance is not None and time - times[i] > tolerance):
+            result.append(None)
+        else:
+            result.append(value(messages[i][1]))
+    return result
+
+
+def test_as_of_rows(raw_bags, topic_messages, tmp_path):
+    output_file = str(tmp_path / 'aligned.parquet')
+    rows = align_topics(raw_bags, output_file, ['/imu:angular_velocity.z', '/odom:pose.pose.position'], rate=10.0)
+    table = pyarrow.parquet.read_table(output_file)
+    assert table.num_rows == rows
+    assert table.column_names == ['timestamp', 'imu.angular_velocity.z', 'odom.pose.pose.position.x',
+                                  'odom.pose.pose.position.y', 'odom.pose.pose.position.z']
+    imu = topic_messages(raw_bags, '/imu')
+    odom = topic_messages(raw_bags, '/odom')
+    grid = table.column('timestamp').to_pylist()
+    first = min(imu[0][0], odom[0][0])
+    last = max(imu[-1][0], odom[-1][0])
+    assert grid == list(range(first, last + 1, 100_000_000))
+    assert table.column('imu.angular_velocity.z').to_pylist() == as_of(imu, grid, lambda x: x.angular_velocity.z)
+    assert table.column('odom.pose.pose.position.x').to_pylist() == as_of(odom, grid, lambda x: x.pose.pose.position.x)
+
+
+def test_tolerance_and_window(raw_bags, topic_messages, tmp_path):
+    output_file = str(tmp_path / 'aligned.arrow')
+    odom = topic_messages(raw_bags, '/odom')
+    start_time, end_time = odom[10][0], odom[100][0]
+    tolerance = 10_000_000
+    align_topics(raw_bags, output_file, ['/odom:twist.twist.linear.x'], rate=50.0, start_time=start_time,
+                 end_time=end_time, tolerance=tolerance, fmt='arrow', batch_rows=16)
+    with pyarrow.memory_map(output_file) as source:
+        table = pyarrow.ipc.open_file(source).read_all()
+    grid = table.column('timestamp').to_pylist()
+    assert grid == list(range(start_time, end_time, 20_000_000))
+    # messages before the window are not read, rows are null until the first one inside it
+    inside = [x for x in odom if start_time <= x[0] < end_time]
+    values = table.column('odom.twist.twist.linear.x').to_pylist()
+    assert values == as_of(inside, grid, lambda x: x.twist.twist.linear.x, tolerance)
+    assert None in values
@@ -0,0 +1,78 @@
+"""
+
+Appends the bundled bags to earlier merges and compares the result with merging everything at once.
+
+"""
+
+import os
+import shutil
+
+from rosbags.rosbag1 import Reader, Writer
+
+from rosbag_merge import bag_append
+from rosbag_merge.bag_append import SIDECAR_SUFFIX, load_sidecar, plan_append
+
+
+def copy_bags(paths, directory):
+    """Copy the bags into directory, so the tests can touch them."""
+    directory.mkdir(exist_ok=True)
+    return [shutil.copy(x, str(directory)) for x in paths]
+
+
+def shifted_copy(path, target, offset):
+    """Write a copy of the bag at path with every timestamp moved by offset nanoseconds."""
+    with Reader(path) as bag, Writer(target) as writer:
+        connections = {x.id: writer.add_connection(x.topic, x.msgtype, x.msgdef, x.digest) for x in bag.connections}
+        for connection, timestamp, data in bag.messages():
+            writer.write(connections[connection.id], timestamp + offset, data)
+    return target
+
+
+def check_merge(bag_messages, bag_path, inputs):
+    messages = bag_messages(bag_path)
+    assert sorted(messages) == sorted(x for path in inputs for x in bag_messages(path))
+    assert [t for _, t, _ in messages] == sorted(t for _, t, _ in messages)
+
+
+def test_overlapping_inputs_rewrite_the_tail(raw_bags, bag_messages, tmp_path):
+    inputs = copy_bags(raw_bags, tmp_path / 'in')
+    out = str(tmp_path / 'out')
+    os.makedirs(out)
+    bag_path = os.path.join(out, 'merged.bag')
+    bag_append.main(inputs[1:], None, out, 'merged', chunk_size=16384)
+    check_merge(bag_messages, bag_path, inputs[1:])
+    assert [x['path'] for x in load_sidecar(bag_path)['inputs']] == [os.path.abspath(x) for x in inputs[1:]]
+    mode, new_inputs, cut_pos = plan_append(bag_path, inputs)
+    assert mode == 'rewrite' and new_inputs == inputs[:1]
+    bag_append.main(inputs, None, out, 'merged', chunk_size=16384)
+    check_merge(bag_messages, bag_path, inputs)
+    assert plan_append(bag_path, inputs)[0] == 'noop'
+
+
+def test_later_inputs_are_appended(raw_bags, bag_messages, tmp_path):
+    inputs = copy_bags(raw_bags, tmp_path / 'in')
+    later = shifted_copy(inputs[0], str(tmp_path / 'in' / 'later.bag'), 10_000_000_000)
+    out = str(tmp_path)
+    bag_path = os.path.join(out, 'merged.bag')
+    topics = ['/imu', '/cmd_vel_rc100']
+    bag_append.main(inputs, topics, out, 'merged')
+    size = os.path.getsize(bag_path)
+    assert plan_append(bag_path, inputs + [later], topics)[0] == 'append'
+    bag_append.main(inputs + [later], topics, out, 'merged')
+    assert os.path.getsize(bag_path) > size
+    messages = bag_messages(bag_path)
+    assert len(messages) == 852 + 139 * 2
+    assert sorted(messages) == sorted(x for path in inputs + [later] for x in bag_messages(path) if x[0] in topics)
+
+
+def test_changed_inputs_or_topics_merge_again(raw_bags, tmp_path):
+    inputs = copy_bags(raw_bags, tmp_path / 'in')
+    out = str(tmp_path)
+    bag_path = os.path.join(out, 'merged.bag')
+    bag_append.main(inputs, None, out, 'merged')
+    assert plan_append(bag_path, inputs, ['/imu'])[0] == 'merge'
+    stat = os.stat(inputs[0])
+    os.utime(inputs[0], ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert plan_append(bag_path, inputs)[0] == 'merge'
+    os.remove(bag_path + SIDECAR_SUFFIX)
+    assert plan_append(bag_path, inputs)[0] == 'merge'
@@ -0,0 +1,50 @@
+"""
+
+Decodes topics of the bundled bags into structured arrays and compares them with per message decoding.
+
+"""
+
+from dataclasses import replace
+
+import numpy as np
+from rosbags.serde import serialize_ros1
+
+from rosbag_merge.bag_arrays import decode_batch, read_array
+
+
+def test_fixed_layout_is_decoded_in_bulk(raw_bags, topic_messages):
+    array = read_array(raw_bags, '/imu')
+    expected = topic_messages(raw_bags, '/imu')
+    assert 'message' not in array.dtype.names
+    assert array['timestamp'].tolist() == [t for t, _ in expected]
+    assert array['angular_velocity.z'].tolist() == [x.angular_velocity.z for _, x in expected]
+    assert array['header.stamp.nanosec'].tolist() == [x.header.stamp.nanosec for _, x in expected]
+    assert array['header.frame_id'].tolist() == [x.header.frame_id.encode() for _, x in expected]
+    assert np.array_equal(array['orientation_covariance'], np.stack([x.orientation_covariance for _, x in expected]))
+
+
+def test_message_without_header(raw_bags, topic_messages):
+    array = read_array(raw_bags, '/cmd_vel_rc100')
+    expected = topic_messages(raw_bags, '/cmd_vel_rc100')
+    assert array['linear.x'].tolist() == [x.linear.x for _, x in expected]
+    assert array['angular.z'].tolist() == [x.angular.z for _, x in expected]
+
+
+def test_time_window(raw_bags):
+    array = read_array(raw_bags, '/imu')
+    start, end = int(array['timestamp'][100]), int(array['timestamp'][200])
+    assert read_array(raw_bags, '/imu', start, end)['timestamp'].tolist() == array['timestamp'][100:200].tolist()
+
+
+def test_varying_layout_falls_back_to_messages(raw_bags, topic_messages):
+    (t0, first), (t1, second) = topic_messages(raw_bags, '/imu')[:2]
+    second = replace(second, header=replace(second.header, frame_id='imu_link_longer'))
+    msgtype = 'sensor_msgs/msg/Imu'
+    array = decode_batch(msgtype, [t0, t1], [serialize_ros1(first, msgtype), serialize_ros1(second, msgtype)])
+    assert array.dtype.names == ('timestamp', 'message')
+    assert array['timestamp'].tolist() == [t0, t1]
+    assert [x.header.frame_id for x in array['message']] == [first.header.frame_id, 'imu_link_longer']
+
+
+def test_missing_topic(raw_bags):
+    assert len(read_array(raw_bags, '/missing')) == 0
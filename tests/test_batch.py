@@ -0,0 +1,58 @@
+"""
+
+Writes manifests over the bundled bags and compares every output with the messages it selects.
+
+"""
+
+import json
+import os
+
+from rosbag_merge.batch import run_manifest
+
+
+def selected(bag_messages, paths, topics=None, start=None, end=None):
+    """Return the messages of paths an output with topics and [start, end) keeps, sorted."""
+    return sorted(
+        x for path in paths for x in bag_messages(path)
+        if (topics is None or x[0] in topics) and (start is None or x[1] >= start) and (end is None or x[1] < end)
+    )
+
+
+def test_outputs_keep_their_selection(raw_bags, bag_messages, tmp_path):
+    # relative times count from the first message of the output's own inputs
+    first_time = min(t for _, t, _ in bag_messages(raw_bags[0]))
+    manifest = {
+        'inputs': raw_bags,
+        'outputs': [
+            {'name': 'all'},
+            {'name': 'nav', 'topics': ['/imu', '/odom'], 'compression': 'lz4'},
+            {'name': 'drive', 'inputs': [raw_bags[0]], 'topics': ['/cmd_vel_rc100'], 'start': '+1', 'end': '+3'},
+        ],
+    }
+    manifest_path = tmp_path / 'manifest.json'
+    manifest_path.write_text(json.dumps(manifest))
+    counts = run_manifest(str(manifest_path), str(tmp_path / 'out'))
+    out = {name: os.path.join(str(tmp_path / 'out'), name + '.bag') for name in ('all', 'nav', 'drive')}
+    expected = {
+        'all': selected(bag_messages, raw_bags),
+        'nav': selected(bag_messages, raw_bags, ['/imu', '/odom']),
+        'drive': selected(bag_messages, [raw_bags[0]], ['/cmd_vel_rc100'], first_time + 1_000_000_000,
+                          first_time + 3_000_000_000),
+    }
+    for name, path in out.items():
+        messages = bag_messages(path)
+        assert counts[path] == len(messages)
+        assert sorted(messages) == expected[name]
+        assert [t for _, t, _ in messages] == sorted(t for _, t, _ in messages)
+    assert len(expected['all']) == 1129
+    assert 0 < len(expected['drive']) < 139
+
+
+def test_disjoint_jobs_in_parallel(raw_bags, bag_messages, tmp_path):
+    manifest = {'outputs': [{'name': os.path.basename(x)[:-4], 'inputs': [x]} for x in raw_bags]}
+    manifest_path = tmp_path / 'manifest.json'
+    manifest_path.write_text(json.dumps(manifest))
+    counts = run_manifest(str(manifest_path), str(tmp_path), jobs=2)
+    assert len(counts) == len(raw_bags)
+    for path in raw_bags:
+        assert sorted(bag_messages(str(tmp_path / os.path.basename(path)))) == sorted(bag_messages(path))
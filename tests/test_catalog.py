@@ -0,0 +1,69 @@
+"""
+
+Caches the metadata of the bundled bags in a catalog and compares it with their indexes.
+
+"""
+
+import os
+import shutil
+import sqlite3
+
+from rosbag_merge import bag_stream
+from rosbag_merge.bag_index import IndexReader
+from rosbag_merge.catalog import Catalog
+
+
+def test_metadata_matches_the_index(raw_bags, tmp_path):
+    path = str(tmp_path / 'catalog.sqlite')
+    with Catalog(path) as catalog:
+        catalog.load(raw_bags)
+    # a new catalog on the same file reads its entries back
+    with Catalog(path) as catalog:
+        metadata = catalog.load(raw_bags)
+        assert list(metadata) == raw_bags
+        for bag_path, meta in metadata.items():
+            with IndexReader(bag_path) as bag:
+                assert (meta.start_time, meta.end_time, meta.message_count, meta.index_pos) == (
+                    bag.start_time, bag.end_time, bag.message_count, bag.index_pos)
+                assert meta.chunk_infos == bag.chunk_infos
+                assert [x._replace(owner=None) for x in bag.connections] == meta.connections
+        assert catalog.time_ranges(raw_bags[:1]) == {raw_bags[0]: (metadata[raw_bags[0]].start_time,
+                                                                   metadata[raw_bags[0]].end_time)}
+
+
+def test_changed_and_missing_bags(raw_bags, tmp_path):
+    bag_path = shutil.copy(raw_bags[0], str(tmp_path / 'input.bag'))
+    with Catalog(':memory:') as catalog:
+        assert catalog.load([bag_path])[bag_path].message_count == 139
+        # the same path now holds another bag
+        shutil.copy(raw_bags[1], bag_path)
+        assert catalog.load([bag_path])[bag_path].message_count == 852
+        os.remove(bag_path)
+        assert catalog.forget_missing() == 1
+        assert catalog.db.execute('SELECT COUNT(*) FROM bags').fetchone() == (0,)
+
+
+def test_old_catalogs_are_rebuilt(raw_bags, tmp_path):
+    path = str(tmp_path / 'catalog.sqlite')
+    db = sqlite3.connect(path)
+    db.execute('CREATE TABLE bags(path TEXT PRIMARY KEY, size INTEGER NOT NULL, mtime_ns INTEGER NOT NULL, '
+               'start_time INTEGER NOT NULL, end_time INTEGER NOT NULL, message_count INTEGER NOT NULL, '
+               'connections TEXT NOT NULL, chunk_infos TEXT NOT NULL)')
+    db.execute("INSERT INTO bags VALUES (?, 0, 0, 0, 0, 0, '[]', '[]')", (os.path.abspath(raw_bags[0]),))
+    db.commit()
+    db.close()
+    with Catalog(path) as catalog:
+        assert catalog.load(raw_bags)[raw_bags[0]].message_count == 139
+
+
+def test_merge_window_with_catalog(raw_bags, bag_messages, tmp_path):
+    with IndexReader(raw_bags[1]) as bag:
+        start_time, end_time = bag.start_time + 1_000_000_000, bag.start_time + 2_000_000_000
+    expected = sorted(x for path in raw_bags for x in bag_messages(path) if start_time <= x[1] < end_time)
+    reports = []
+    with Catalog(':memory:') as catalog:
+        assert bag_stream.main(raw_bags, None, str(tmp_path), 'merged', exists_ok=True, start_time=start_time,
+                               end_time=end_time, catalog=catalog, on_progress=lambda *x: reports.append(x))
+    assert sorted(bag_messages(str(tmp_path / 'merged.bag'))) == expected
+    # the total counts the messages of the window, not every indexed message
+    assert reports[-1] == (len(expected), len(expected))
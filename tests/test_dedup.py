@@ -0,0 +1,46 @@
+"""
+
+Merges the bundled bags together with copies of themselves and checks that the copies are dropped.
+
+"""
+
+import json
+import os
+import shutil
+
+from rosbag_merge import bag_stream
+from rosbag_merge.dedup import Deduplicator
+
+
+def test_copies_are_dropped(raw_bags, bag_messages, tmp_path):
+    copies = [shutil.copy(x, str(tmp_path / ('copy_' + os.path.basename(x)))) for x in raw_bags]
+    stats_json = str(tmp_path / 'stats.json')
+    assert bag_stream.main(raw_bags + copies, None, str(tmp_path), 'merged', exists_ok=True, dedup=True,
+                           stats_json=stats_json)
+    messages = bag_messages(str(tmp_path / 'merged.bag'))
+    assert sorted(messages) == sorted(x for path in raw_bags for x in bag_messages(path))
+    with open(stats_json) as f:
+        assert json.load(f)['duplicates'] == {'/cmd_vel_rc100': 139, '/imu': 852, '/odom': 137, '/tf_static': 1}
+
+
+def test_repeats_within_one_input_are_kept():
+    dedup = Deduplicator()
+    assert not dedup.is_duplicate('/a', 10, b'x', source=1)
+    assert not dedup.is_duplicate('/a', 10, b'x', source=1)
+    assert dedup.is_duplicate('/a', 10, b'x', source=2)
+    # another topic or payload is not a duplicate
+    assert not dedup.is_duplicate('/b', 10, b'x', source=2)
+    assert not dedup.is_duplicate('/a', 10, b'y', source=2)
+    assert dedup.report() == {'/a': 1}
+
+
+def test_window():
+    exact = Deduplicator()
+    assert not exact.is_duplicate('/a', 10, b'x', source=1)
+    assert not exact.is_duplicate('/a', 15, b'x', source=2)
+    windowed = Deduplicator(window=5)
+    assert not windowed.is_duplicate('/a', 10, b'x', source=1)
+    assert windowed.is_duplicate('/a', 15, b'x', source=2)
+    # keys older than the window are forgotten
+    assert not windowed.is_duplicate('/a', 21, b'x', source=2)
+    assert windowed.report() == {'/a': 1}
@@ -0,0 +1,55 @@
+"""
+
+Exports the bundled bags into Parquet and Arrow files and checks the columns against the messages.
+
+"""
+
+import os
+
+import pytest
+
+pa = pytest.importorskip('pyarrow')
+import pyarrow.ipc  # noqa: E402
+import pyarrow.parquet  # noqa: E402
+
+from rosbag_merge.export import export_topics, message_arrow_type  # noqa: E402
+
+
+def test_parquet_columns(raw_bags, topic_messages, tmp_path):
+    paths = export_topics(raw_bags, str(tmp_path))
+    assert sorted(os.path.basename(x) for x in paths) == [
+        'cmd_vel_rc100.parquet', 'imu.parquet', 'odom.parquet', 'tf_static.parquet']
+    table = pyarrow.parquet.read_table(tmp_path / 'imu.parquet')
+    expected = topic_messages(raw_bags, '/imu')
+    assert table.column('timestamp').to_pylist() == [t for t, _ in expected]
+    assert table.column('angular_velocity.z').to_pylist() == [x.angular_velocity.z for _, x in expected]
+    assert table.column('header.frame_id').to_pylist() == [x.header.frame_id for _, x in expected]
+    assert table.column('orientation_covariance').to_pylist() == [list(x.orientation_covariance) for _, x in expected]
+
+
+def test_message_arrays_are_typed_from_definitions(raw_bags, topic_messages, tmp_path):
+    export_topics(raw_bags, str(tmp_path), topics=['/tf_static'])
+    table = pyarrow.parquet.read_table(tmp_path / 'tf_static.parquet')
+    assert table.schema.field('transforms').type == pa.list_(message_arrow_type('geometry_msgs/msg/TransformStamped'))
+    (_, message), = topic_messages(raw_bags, '/tf_static')
+    transforms, = table.column('transforms').to_pylist()
+    assert [x['child_frame_id'] for x in transforms] == [x.child_frame_id for x in message.transforms]
+    assert [x['transform']['rotation']['w'] for x in transforms] == [x.transform.rotation.w for x in message.transforms]
+
+
+def test_arrow_with_jobs_reports_progress(raw_bags, tmp_path):
+    reports = []
+    paths = export_topics(raw_bags, str(tmp_path), fmt='arrow', jobs=2, on_progress=lambda *x: reports.append(x))
+    assert len(paths) == 4
+    with pa.memory_map(str(tmp_path / 'odom.arrow')) as source:
+        assert pyarrow.ipc.open_file(source).read_all().num_rows == 137
+    assert reports[-1] == (1129, 1129)
+
+
+def test_failed_export_removes_its_files(raw_bags, tmp_path):
+    def stop(done, total):
+        raise RuntimeError('stop')
+
+    with pytest.raises(RuntimeError):
+        export_topics(raw_bags, str(tmp_path), on_progress=stop)
+    assert os.listdir(tmp_path) == []
@@ -0,0 +1,48 @@
+"""
+
+Summarizes the bundled bags from their indexes and compares the summary with their messages.
+
+"""
+
+from collections import Counter
+
+from rosbags.rosbag1 import Reader, Writer
+
+from rosbag_merge.catalog import Catalog
+from rosbag_merge.info import collect_info
+
+
+def test_topics(raw_bags, bag_messages):
+    reports = []
+    info = collect_info(raw_bags, jobs=1, on_progress=lambda *x: reports.append(x))
+    counts = Counter(topic for path in raw_bags for topic, _, _ in bag_messages(path))
+    assert {name: x['messages'] for name, x in info['topics'].items()} == counts
+    assert info['bags'] == 3 and info['messages'] == 1129 and info['conflicts'] == []
+    imu = info['topics']['/imu']
+    assert imu['msgtypes'] == ['sensor_msgs/msg/Imu']
+    with Reader(raw_bags[1]) as bag:
+        assert (imu['start_time'], imu['end_time']) == (bag.start_time, bag.end_time)
+    assert 150 < imu['rate_hz'] < 200
+    assert reports[-1] == (3, 3)
+
+
+def test_catalog_gives_the_same_summary(raw_bags, tmp_path):
+    expected = collect_info(raw_bags, jobs=1)
+    with Catalog(str(tmp_path / 'catalog.sqlite')) as catalog:
+        assert collect_info(raw_bags, catalog=catalog) == expected
+        # and again from the cached entries
+        assert collect_info(raw_bags, catalog=catalog) == expected
+
+
+def test_conflicts(raw_bags, tmp_path):
+    other = str(tmp_path / 'other.bag')
+    # /odom recorded with another message type
+    with Reader(raw_bags[0]) as bag, Writer(other) as writer:
+        source = bag.connections[0]
+        connection = writer.add_connection('/odom', source.msgtype, source.msgdef, source.digest)
+        for _, timestamp, data in bag.messages():
+            writer.write(connection, timestamp, data)
+    info = collect_info(raw_bags + [other], jobs=1)
+    conflict, = info['conflicts']
+    assert conflict['topic'] == '/odom' and conflict['kind'] == 'msgtype'
+    assert [x['bags'] for x in conflict['variants']] == [[other], [raw_bags[2]]]
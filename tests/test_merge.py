@@ -0,0 +1,117 @@
+"""
+
+Compares merged bags against a plain heapq.merge of the inputs.
+
+"""
+
+import glob
+import heapq
+import os
+import random
+from itertools import chain
+from operator import itemgetter
+
+import pytest
+from rosbags.rosbag1 import Reader
+
+from rosbag_merge import bag_stream, merge
+from rosbag_merge.synthetic import generate_bags
+
+RAW_BAGS = sorted(glob.glob(os.path.join(os.path.dirname(__file__), 'data', 'raw', '*.bag')))
+
+
+def bag_messages(path):
+    """Return the (topic, timestamp, data) messages of a bag in stored order."""
+    with Reader(path) as bag:
+        return [(c.topic, t, bytes(d)) for c, t, d in bag.messages()]
+
+
+def reference_merge(paths, start_time=None, end_time=None):
+    """Merge the messages of paths with heapq.merge, equal timestamps keep the order of the inputs."""
+    messages = heapq.merge(*[bag_messages(x) for x in paths], key=itemgetter(1))
+    return [x for x in messages
+            if (start_time is None or x[1] >= start_time) and (end_time is None or x[1] < end_time)]
+
+
+def merged(paths, tmp_path, **kwargs):
+    """Merge paths into tmp_path with bag_stream.main and return the messages of the output."""
+    output_path = str(tmp_path / 'out')
+    os.makedirs(output_path, exist_ok=True)
+    assert bag_stream.main(list(paths), None, output_path, 'merged', exists_ok=True, **kwargs)
+    return bag_messages(os.path.join(output_path, 'merged.bag'))
+
+
+@pytest.fixture(scope='module')
+def synthetic_bags(tmp_path_factory):
+    """Three overlapping bags with small chunks, so merges both copy and interleave chunks."""
+    return generate_bags(str(tmp_path_factory.mktemp('synthetic')), bags=3, topics=3, rate=[50.0, 100.0, 200.0],
+                         duration=4.0, overlap=0.3, chunk_size=16 * 1024)
+
+
+MERGES = {
+    'passthrough': {},
+    'messages': {'passthrough': False},
+    'unmapped': {'mapped': False},
+    'jobs': {'jobs': 2},
+    'prefetch': {'prefetch_mb': 1},
+    'prefetch_unmapped': {'prefetch_mb': 1, 'mapped': False},
+    'lz4': {'compression': 'lz4'},
+}
+
+
+@pytest.mark.parametrize('kwargs', MERGES.values(), ids=list(MERGES))
+def test_raw_bags(kwargs, tmp_path):
+    assert merged(RAW_BAGS, tmp_path, **kwargs) == reference_merge(RAW_BAGS)
+
+
+@pytest.mark.parametrize('kwargs', MERGES.values(), ids=list(MERGES))
+def test_synthetic_bags(synthetic_bags, kwargs, tmp_path):
+    assert merged(synthetic_bags, tmp_path, **kwargs) == reference_merge(synthetic_bags)
+
+
+@pytest.mark.parametrize('kwargs', [{}, {'jobs': 2}, {'prefetch_mb': 1}], ids=['single', 'jobs', 'prefetch'])
+def test_time_window(synthetic_bags, kwargs, tmp_path):
+    messages = reference_merge(synthetic_bags)
+    start_time = messages[len(messages) // 4][1]
+    end_time = messages[3 * len(messages) // 4][1]
+    expected = reference_merge(synthetic_bags, start_time, end_time)
+    assert merged(synthetic_bags, tmp_path, start_time=start_time, end_time=end_time, **kwargs) == expected
+
+
+def test_split_duration(synthetic_bags, tmp_path):
+    assert bag_stream.main(synthetic_bags, None, str(tmp_path), 'merged', exists_ok=True, split_duration=1.0)
+    parts = sorted(glob.glob(str(tmp_path / 'merged_[0-9][0-9][0-9][0-9].bag')))
+    assert len(parts) > 1
+    messages = [bag_messages(x) for x in parts]
+    for part in messages:
+        assert part[-1][1] - part[0][1] < 10**9
+    assert list(chain.from_iterable(messages)) == reference_merge(synthetic_bags)
+
+
+def random_sources(rng, count, length, times):
+    """Return count time ordered message lists with many equal timestamps, tagged with their source."""
+    return [[(None, t, (i, n)) for n, t in enumerate(sorted(rng.randrange(times) for _ in range(length)))]
+            for i in range(count)]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_merge_batches_keeps_tie_order(seed):
+    rng = random.Random(seed)
+    sources = random_sources(rng, rng.randint(1, 5), rng.randint(0, 300), rng.choice([5, 50, 1000]))
+    batch_size = rng.choice([1, 7, 64, merge.BATCH_SIZE])
+    expected = list(heapq.merge(*sources, key=itemgetter(1)))
+    batches = merge.merge_batches([merge.batched(x, batch_size) for x in sources])
+    assert list(chain.from_iterable(batches)) == expected
+
+
+@pytest.mark.parametrize('seed', range(5))
+def test_merge_batches_disjoint_ranges(seed):
+    rng = random.Random(seed)
+    sources = random_sources(rng, 4, 100, 10)
+    # shift the sources apart in a random order, touching at their boundaries
+    for offset, i in enumerate(rng.sample(range(4), 4)):
+        sources[i] = [(c, t + 9 * offset, data) for c, t, data in sources[i]]
+    ranges = [(x[0][1], x[-1][1]) for x in sources]
+    expected = list(heapq.merge(*sources, key=itemgetter(1)))
+    batches = merge.merge_batches([merge.batched(x, 16) for x in sources], ranges)
+    assert list(chain.from_iterable(batches)) == expected
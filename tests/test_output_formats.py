@@ -0,0 +1,72 @@
+"""
+
+Merges the bundled bags into MCAP and rosbag2 outputs and reads them back.
+
+"""
+
+import os
+import shutil
+from collections import Counter
+
+import pytest
+from rosbags.rosbag2 import Reader as Rosbag2Reader
+
+from rosbag_merge import bag_stream
+from rosbag_merge.output_formats import remove_output
+
+
+def test_mcap_defaults_to_zstd(raw_bags, bag_messages, tmp_path):
+    mcap_reader = pytest.importorskip('mcap.reader')
+    assert bag_stream.main(raw_bags, None, str(tmp_path), 'merged', exists_ok=True, output_format='mcap')
+    with open(tmp_path / 'merged.mcap', 'rb') as f:
+        reader = mcap_reader.make_reader(f)
+        summary = reader.get_summary()
+        assert {x.compression for x in summary.chunk_indexes} == {'zstd'}
+        assert {x.encoding for x in summary.schemas.values()} == {'ros1msg'}
+        messages = [(channel.topic, message.log_time, message.data) for _, channel, message in reader.iter_messages()]
+    assert len(messages) == 1129
+    assert sorted(messages) == sorted(x for path in raw_bags for x in bag_messages(path))
+
+
+def test_mcap_compression_can_be_picked(raw_bags, tmp_path):
+    mcap_reader = pytest.importorskip('mcap.reader')
+    assert bag_stream.main(raw_bags, ['/imu'], str(tmp_path), 'merged', exists_ok=True, output_format='mcap',
+                           compression='lz4')
+    with open(tmp_path / 'merged.mcap', 'rb') as f:
+        summary = mcap_reader.make_reader(f).get_summary()
+    assert {x.compression for x in summary.chunk_indexes} == {'lz4'}
+    assert summary.statistics.message_count == 852
+
+
+def test_rosbag2(raw_bags, topic_messages, tmp_path):
+    assert bag_stream.main(raw_bags, None, str(tmp_path), 'merged', exists_ok=True, output_format='rosbag2')
+    with Rosbag2Reader(tmp_path / 'merged') as bag:
+        assert bag.message_count == 1129
+        counts = Counter(connection.topic for connection, _, _ in bag.messages())
+        imu = [t for connection, t, _ in bag.messages() if connection.topic == '/imu']
+    assert counts == {'/cmd_vel_rc100': 139, '/imu': 852, '/odom': 137, '/tf_static': 1}
+    assert imu == [t for t, _ in topic_messages(raw_bags, '/imu')]
+    # merging again replaces the bag
+    assert bag_stream.main(raw_bags, ['/odom'], str(tmp_path), 'merged', exists_ok=True, output_format='rosbag2')
+    with Rosbag2Reader(tmp_path / 'merged') as bag:
+        assert bag.message_count == 137
+
+
+def test_remove_output_keeps_inputs_and_other_directories(raw_bags, tmp_path):
+    inputs_dir = tmp_path / 'inputs'
+    inputs_dir.mkdir()
+    inputs = [shutil.copy(x, str(inputs_dir)) for x in raw_bags]
+    with pytest.raises(ValueError):
+        bag_stream.main(inputs, None, str(tmp_path), 'inputs', exists_ok=True, output_format='rosbag2')
+    assert sorted(os.listdir(inputs_dir)) == sorted(os.path.basename(x) for x in raw_bags)
+    other = tmp_path / 'other'
+    other.mkdir()
+    (other / 'metadata.yaml').write_text('')
+    (other / 'notes.txt').write_text('')
+    with pytest.raises(ValueError):
+        remove_output(str(other))
+    assert sorted(os.listdir(other)) == ['metadata.yaml', 'notes.txt']
+    (other / 'notes.txt').unlink()
+    (other / 'merged_0.db3').write_text('')
+    remove_output(str(other))
+    assert not other.exists()
@@ -0,0 +1,54 @@
+"""
+
+Runs pipeline stages on merges of the bundled bags and checks what every stage kept.
+
+"""
+
+from rosbags.serde import deserialize_ros1, serialize_ros1
+
+from rosbag_merge import bag_stream
+from rosbag_merge.pipeline import Pipeline, Transform, build_pipeline, resolve_topics
+
+
+def merge(raw_bags, tmp_path, pipeline, topics=None):
+    assert bag_stream.main(raw_bags, topics, str(tmp_path), 'merged', exists_ok=True, pipeline=pipeline)
+    return str(tmp_path / 'merged.bag')
+
+
+def test_throttle_and_decimate(raw_bags, bag_messages, topic_messages, tmp_path):
+    # a small batch size runs the stages across batch boundaries
+    pipeline = build_pipeline(throttle=['/imu=50'], decimate=['/od*=3'], batch_size=64)
+    messages = bag_messages(merge(raw_bags, tmp_path, pipeline))
+    imu = [t for topic, t, _ in messages if topic == '/imu']
+    rate = (len(imu) - 1) / ((imu[-1] - imu[0]) / 1e9)
+    assert 48 < rate <= 50.5
+    odom = [t for topic, t, _ in messages if topic == '/odom']
+    assert odom == [t for t, _ in topic_messages(raw_bags, '/odom')][::3]
+    assert sum(topic == '/cmd_vel_rc100' for topic, _, _ in messages) == 139
+
+
+def test_transform(raw_bags, topic_messages, tmp_path):
+    def stamp_speed(connection, timestamp, rawdata):
+        if timestamp % 2:
+            return None
+        message = deserialize_ros1(rawdata, connection.msgtype)
+        message.linear.x = timestamp / 1e9
+        return timestamp, serialize_ros1(message, connection.msgtype)
+
+    pipeline = Pipeline([Transform(stamp_speed, '/cmd_vel_rc100')])
+    bag_path = merge(raw_bags, tmp_path, pipeline, topics=['/cmd_vel_rc100', '/odom'])
+    expected = [(t, t / 1e9) for t, _ in topic_messages(raw_bags, '/cmd_vel_rc100') if not t % 2]
+    assert 0 < len(expected) < 139
+    assert [(t, x.linear.x) for t, x in topic_messages([bag_path], '/cmd_vel_rc100')] == expected
+    assert len(topic_messages([bag_path], '/odom')) == 137
+
+
+def test_resolve_topics(raw_bags):
+    assert resolve_topics(raw_bags, ['/imu']) == ['/imu']
+    assert resolve_topics(raw_bags) is None
+    assert resolve_topics(raw_bags, patterns=['/c*']) == ['/cmd_vel_rc100']
+    assert resolve_topics(raw_bags, patterns=['re:/(imu|odom)']) == ['/imu', '/odom']
+    assert resolve_topics(raw_bags, types=['sensor_msgs/msg/*']) == ['/imu']
+    assert resolve_topics(raw_bags, ['/tf_static'], patterns=['/imu']) == ['/imu', '/tf_static']
+    # types narrow down the selected topics
+    assert resolve_topics(raw_bags, patterns=['*'], types=['nav_msgs/msg/Odometry']) == ['/odom']
@@ -0,0 +1,54 @@
+"""
+
+Cuts copies of the bundled bags short and checks what reindexing recovers from them.
+
+"""
+
+import os
+import shutil
+
+import pytest
+
+from rosbag_merge import bag_stream
+from rosbag_merge.reindex import needs_reindex, reindex_bags
+
+
+def truncate(path, fraction):
+    with open(path, 'r+b') as f:
+        f.truncate(int(os.path.getsize(path) * fraction))
+
+
+@pytest.mark.parametrize('compression', ['none', 'lz4', 'bz2'])
+def test_truncated_bag_keeps_a_prefix(raw_bags, bag_messages, tmp_path, compression):
+    # a merge with small chunks, cut off in the middle of one of them
+    assert bag_stream.main(raw_bags, None, str(tmp_path), 'merged', exists_ok=True, compression=compression,
+                           chunk_size=16384)
+    path = str(tmp_path / 'merged.bag')
+    original = bag_messages(path)
+    truncate(path, 0.6)
+    assert needs_reindex(path)
+    recovered_path, = reindex_bags([path], str(tmp_path / 'reindexed'), jobs=1)
+    assert recovered_path != path and not needs_reindex(recovered_path)
+    recovered = bag_messages(recovered_path)
+    assert 0 < len(recovered) < len(original)
+    assert recovered == original[:len(recovered)]
+
+
+def test_healthy_and_unrecoverable_bags(raw_bags, tmp_path):
+    broken = tmp_path / 'broken.bag'
+    broken.write_bytes(b'not a bag')
+    empty = tmp_path / 'empty.bag'
+    empty.write_bytes(b'')
+    paths = reindex_bags(raw_bags + [str(broken), str(empty)], str(tmp_path / 'reindexed'), jobs=1)
+    assert paths == raw_bags
+
+
+def test_same_names_get_their_own_copies(raw_bags, bag_messages, tmp_path):
+    paths = []
+    for name, fraction in (('a', 0.5), ('b', 0.8)):
+        (tmp_path / name).mkdir()
+        paths.append(shutil.copy(raw_bags[1], str(tmp_path / name)))
+        truncate(paths[-1], fraction)
+    targets = reindex_bags(paths, str(tmp_path / 'reindexed'), jobs=1)
+    assert len(set(targets)) == 2
+    assert len(bag_messages(targets[0])) < len(bag_messages(targets[1]))
@@ -0,0 +1,91 @@
+"""
+
+Runs merge and info jobs of the bundled bags through the service and checks the answers to requests.
+
+"""
+
+import asyncio
+import json
+
+from rosbag_merge.service import MergeService
+
+
+def run_service(test):
+    """Run test(service) on a started service with one worker."""
+    async def main():
+        service = MergeService(1)
+        await service.start()
+        try:
+            return await test(service)
+        finally:
+            await service.close()
+
+    return asyncio.run(main())
+
+
+async def http_request(port, method, target, body=b''):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    writer.write(f'{method} {target} HTTP/1.1\r\nContent-Length: {len(body)}\r\n\r\n'.encode() + body)
+    await writer.drain()
+    status = int((await reader.readline()).split()[1])
+    response = (await reader.read()).split(b'\r\n\r\n', 1)[1]
+    writer.close()
+    return status, json.loads(response)
+
+
+def test_jobs(raw_bags, bag_messages, tmp_path):
+    async def test(service):
+        args = {'input_bags': raw_bags, 'output_path': str(tmp_path), 'outbag_name': 'merged'}
+        merge = await service.handle({'op': 'submit', 'kind': 'merge', 'args': args})
+        info = await service.handle({'op': 'submit', 'kind': 'info', 'args': {'input_bags': raw_bags}})
+        missing = await service.handle({'op': 'submit', 'kind': 'info', 'args': {'input_bags': ['missing.bag']}})
+        return [await service.handle({'op': 'wait', 'id': x['id']}) for x in (merge, info, missing)]
+
+    merge, info, missing = run_service(test)
+    assert merge['state'] == 'done' and merge['result'] == {'outputs': [str(tmp_path / 'merged.bag')]}
+    assert (merge['done'], merge['total']) == (1129, 1129)
+    assert len(bag_messages(str(tmp_path / 'merged.bag'))) == 1129
+    assert info['state'] == 'done' and info['result']['messages'] == 1129
+    assert missing['state'] == 'failed' and missing['error']
+
+
+def test_invalid_requests():
+    async def test(service):
+        finished = service.submit('unknown', {})
+        await finished.event.wait()
+        return [
+            await service.handle({'op': 'remove'}),
+            await service.handle(['status']),
+            await service.handle({'op': 'status', 'id': 99}),
+            await service.handle({'op': 'cancel', 'id': finished.id}),
+            finished.to_dict(),
+        ]
+
+    unknown_op, not_object, unknown_id, cancel_finished, finished = run_service(test)
+    assert 'not supported' in unknown_op['error']
+    assert 'JSON object' in not_object['error']
+    assert 'There is no job 99' in unknown_id['error']
+    assert 'cannot be cancelled' in cancel_finished['error'] and cancel_finished['job']['state'] == 'failed'
+    assert "Job kind 'unknown' is not supported" in finished['error']
+
+
+def test_http():
+    async def test(service):
+        server = await asyncio.start_server(service.handle_http, '127.0.0.1', 0)
+        port = server.sockets[0].getsockname()[1]
+        async with server:
+            return [
+                await http_request(port, 'POST', '/jobs', b'[1, 2]'),
+                await http_request(port, 'POST', '/jobs', b'{"kind": "unknown"}'),
+                await http_request(port, 'GET', '/jobs/1?wait=1'),
+                await http_request(port, 'DELETE', '/jobs/1'),
+                await http_request(port, 'GET', '/jobs/2'),
+                await http_request(port, 'GET', '/other'),
+            ]
+
+    not_object, submitted, waited, cancel, missing, other = run_service(test)
+    assert not_object[0] == 400
+    assert submitted[0] == 200 and submitted[1]['id'] == 1
+    assert waited[0] == 200 and waited[1]['state'] == 'failed'
+    assert cancel[0] == 409
+    assert missing[0] == 404 and other[0] == 404
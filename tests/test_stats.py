@@ -0,0 +1,34 @@
+"""
+
+Merges the bundled bags with a stats report and checks the counts it gives, with and without jobs.
+
+"""
+
+import json
+
+import pytest
+
+from rosbag_merge import bag_stream
+
+
+def merge_report(raw_bags, tmp_path, name, **kwargs):
+    stats_json = str(tmp_path / (name + '.json'))
+    assert bag_stream.main(raw_bags, None, str(tmp_path), name, exists_ok=True, stats_json=stats_json,
+                           on_progress=lambda *x: None, **kwargs)
+    with open(stats_json) as f:
+        return json.load(f)
+
+
+@pytest.mark.parametrize('passthrough', [True, False])
+def test_jobs_report_the_same_counts(raw_bags, tmp_path, passthrough):
+    single = merge_report(raw_bags, tmp_path, 'single', passthrough=passthrough)
+    sharded = merge_report(raw_bags, tmp_path, 'sharded', passthrough=passthrough, jobs=2)
+    assert single['messages'] == sharded['messages'] == 1129
+    assert {name: x['messages'] for name, x in single['topics'].items()} == {
+        '/cmd_vel_rc100': 139, '/imu': 852, '/odom': 137, '/tf_static': 1}
+    assert sharded['topics'] == single['topics']
+    assert {path: x['messages'] for path, x in sharded['inputs'].items()} == {
+        path: x['messages'] for path, x in single['inputs'].items()}
+    assert sorted(single['inputs']) == raw_bags
+    assert {'read', 'write', 'merge'} <= set(single['stages'])
+    assert {'read', 'write', 'stitch'} <= set(sharded['stages'])